@@ -166,6 +166,12 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
       Serial.println("CONFIG ACTUALIZADA");
     }
   }
+  
+  // Confirmar al servidor el valor aplicado (mide la ida y vuelta del comando)
+  if (topicStr.startsWith("casa/actuadores/")) {
+    String confirmacion = "casa/confirmacion/" + topicStr.substring(16);
+    mqttClient.publish(confirmacion.c_str(), message.c_str());
+  }
 }
 
 void conectarMQTT() {
@@ -181,8 +187,9 @@ void conectarMQTT() {
     Serial.println("OK");
     
     // Suscribirse a topics
-    mqttClient.subscribe("casa/actuadores/#");
-    mqttClient.subscribe("casa/sistema/#");
+    // QoS 1: el broker reenvía los comandos que no llegaron a confirmarse
+    mqttClient.subscribe("casa/actuadores/#", 1);
+    mqttClient.subscribe("casa/sistema/#", 1);
     
     Serial.println("✓ Suscrito a casa/actuadores/#");
     Serial.println("✓ Suscrito a casa/sistema/#");
@@ -196,19 +203,18 @@ void conectarMQTT() {
 void publicarSensoresMQTT() {
   if (!mqttConectado || !datosDisponibles) return;
   
-  char temp[10], hum[10], suelo[10];
+  char frame[96];
   
-  // Convertir valores a strings
-  dtostrf(datosRecibidos.temperatura, 4, 1, temp);
-  dtostrf(datosRecibidos.humedad, 4, 1, hum);
-  sprintf(suelo, "%d", datosRecibidos.humedad_suelo);
+  // Una lectura completa en un solo mensaje (el servidor guarda y
+  // difunde una vez por frame)
+  snprintf(frame, sizeof(frame),
+           "{\"temperatura\":%.1f,\"humedad\":%.1f,\"humedad_suelo\":%d,\"timestamp\":%lu}",
+           datosRecibidos.temperatura, datosRecibidos.humedad,
+           datosRecibidos.humedad_suelo, datosRecibidos.timestamp);
   
-  // Publicar cada sensor
-  mqttClient.publish("casa/sensores/temperatura", temp);
-  mqttClient.publish("casa/sensores/humedad", hum);
-  mqttClient.publish("casa/sensores/humedad_suelo", suelo);
+  mqttClient.publish("casa/sensores/frame", frame);
   
-  Serial.println("✓ Sensores publicados por MQTT");
+  Serial.println("✓ Frame de sensores publicado por MQTT");
 }
 
 // ==================== CONTROL DE ACTUADORES ====================
@@ -0,0 +1,215 @@
+"""
+Detección de anomalías en línea para lecturas de sensores
+
+Cada (dispositivo, sensor) guarda un estado de tamaño fijo: media y
+varianza EWMA, última lectura y contadores. Las alertas se deduplican
+por tipo con un cooldown y se insertan en lote en la tabla alertas.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from monitoring.logs import obtener_logger
+from config import (
+    ANOMALY_EWMA_ALPHA, ANOMALY_Z_THRESHOLD, ANOMALY_MIN_STD,
+    ANOMALY_WARMUP_READINGS, ANOMALY_MAX_RATE, ANOMALY_STUCK_READINGS,
+    ANOMALY_ALERT_COOLDOWN, ANOMALY_FLUSH_INTERVAL
+)
+
+log = obtener_logger("analitica")
+
+
+class _EstadoSensor:
+    """Estadísticas acumuladas de un sensor (memoria constante)"""
+
+    __slots__ = (
+        "n", "media", "varianza", "ultimo", "ultimo_ts", "repeticiones",
+        "alerta_atipico", "alerta_tasa", "alerta_atascado"
+    )
+
+    def __init__(self, valor, ts):
+        self.n = 1
+        self.media = valor
+        self.varianza = 0.0
+        self.ultimo = valor
+        self.ultimo_ts = ts
+        self.repeticiones = 0
+        # Momento de la última alerta de cada tipo (deduplicación)
+        self.alerta_atipico = 0.0
+        self.alerta_tasa = 0.0
+        self.alerta_atascado = 0.0
+
+
+class AnomalyDetector:
+    """Detector EWMA + tasa de cambio + sensor atascado"""
+
+    def __init__(self, alpha=ANOMALY_EWMA_ALPHA, umbral_z=ANOMALY_Z_THRESHOLD,
+                 min_std=ANOMALY_MIN_STD, warmup=ANOMALY_WARMUP_READINGS,
+                 max_tasa=ANOMALY_MAX_RATE, lecturas_atascado=ANOMALY_STUCK_READINGS,
+                 cooldown=ANOMALY_ALERT_COOLDOWN):
+        self.alpha = alpha
+        self.umbral_z2 = umbral_z * umbral_z
+        self.min_var = min_std * min_std
+        self.warmup = warmup
+        self.max_tasa = max_tasa
+        self.lecturas_atascado = lecturas_atascado
+        self.cooldown = cooldown
+        self.estados = {}
+
+    def procesar(self, dispositivo, sensor, valor, ts=None):
+        """Actualizar estadísticas y devolver la lista de alertas (normalmente vacía)"""
+        # Una lectura fallida (NaN, p.ej. DHT en una trama binaria) dejaría
+        # la media y la varianza en NaN para siempre
+        if valor is None or not math.isfinite(valor):
+            return []
+        if ts is None:
+            ts = time.time()
+        clave = (dispositivo, sensor)
+        estado = self.estados.get(clave)
+        if estado is None:
+            self.estados[clave] = _EstadoSensor(valor, ts)
+            return []
+
+        alertas = []
+
+        # Valor atípico respecto a la media EWMA (z² para evitar la raíz)
+        diff = valor - estado.media
+        if estado.n >= self.warmup:
+            var = estado.varianza if estado.varianza > self.min_var else self.min_var
+            if diff * diff > self.umbral_z2 * var and ts - estado.alerta_atipico >= self.cooldown:
+                estado.alerta_atipico = ts
+                alertas.append(self._alerta(
+                    "valor_atipico", dispositivo, sensor, valor,
+                    f"{valor} fuera de lo normal (media {estado.media:.2f}, "
+                    f"desv. {var ** 0.5:.2f})", "warning", ts
+                ))
+
+        # Cambio demasiado rápido entre lecturas (dt mínimo de 1 s para
+        # no alertar con ráfagas de mensajes casi simultáneos)
+        max_tasa = self.max_tasa.get(sensor)
+        dt = ts - estado.ultimo_ts
+        if dt < 1.0:
+            dt = 1.0
+        if max_tasa is not None:
+            salto = valor - estado.ultimo
+            if salto < 0:
+                salto = -salto
+            if salto > max_tasa * dt and ts - estado.alerta_tasa >= self.cooldown:
+                estado.alerta_tasa = ts
+                alertas.append(self._alerta(
+                    "cambio_brusco", dispositivo, sensor, valor,
+                    f"cambio de {estado.ultimo} a {valor} en {dt:.1f} s",
+                    "warning", ts
+                ))
+
+        # Sensor atascado: misma lectura muchas veces seguidas
+        if valor == estado.ultimo:
+            estado.repeticiones += 1
+            if (estado.repeticiones == self.lecturas_atascado
+                    and ts - estado.alerta_atascado >= self.cooldown):
+                estado.alerta_atascado = ts
+                alertas.append(self._alerta(
+                    "sensor_atascado", dispositivo, sensor, valor,
+                    f"{estado.repeticiones} lecturas seguidas con valor {valor}",
+                    "error", ts
+                ))
+        else:
+            estado.repeticiones = 0
+
+        # Actualización EWMA de media y varianza
+        incr = self.alpha * diff
+        estado.media += incr
+        estado.varianza = (1 - self.alpha) * (estado.varianza + diff * incr)
+        estado.n += 1
+        estado.ultimo = valor
+        estado.ultimo_ts = ts
+
+        return alertas
+
+    @staticmethod
+    def _alerta(tipo, dispositivo, sensor, valor, detalle, nivel, ts):
+        return {
+            "tipo": tipo,
+            "dispositivo": dispositivo,
+            "sensor": sensor,
+            "valor": valor,
+            "mensaje": f"{dispositivo}/{sensor}: {detalle}",
+            "nivel": nivel,
+            "timestamp": ts
+        }
+
+
+class AlertDispatcher:
+    """Cola de alertas: inserción en lote en BD y envío por WebSocket"""
+
+    def __init__(self, db_manager=None, broadcast=None,
+                 intervalo=ANOMALY_FLUSH_INTERVAL):
+        self.db_manager = db_manager
+        self.broadcast = broadcast
+        self.intervalo = intervalo
+        # deque: append/popleft son seguros entre el thread MQTT y el event loop
+        self.pendientes = deque()
+
+    def encolar(self, alertas):
+        """Añadir alertas (llamado desde el thread de MQTT)"""
+        self.pendientes.extend(alertas)
+
+    async def flush(self):
+        """Guardar y difundir las alertas pendientes"""
+        lote = []
+        while self.pendientes:
+            lote.append(self.pendientes.popleft())
+        if not lote:
+            return
+
+        if self.db_manager:
+            try:
+                await asyncio.to_thread(
+                    self.db_manager.insertar_alertas,
+                    [(a["tipo"], a["mensaje"], a["nivel"]) for a in lote]
+                )
+            except Exception as e:
+                log.error("Error guardando alertas: %s", e)
+
+        if self.broadcast:
+            for alerta in lote:
+                await self.broadcast({"type": "alerta", "alerta": alerta})
+        log.warning("%d alertas generadas", len(lote))
+
+    async def run(self):
+        """Vaciar la cola periódicamente"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error("Error procesando alertas: %s", e)
+
+
+# ====================== TESTS ======================
+
+if __name__ == '__main__':
+    import random
+
+    print("Probando AnomalyDetector...")
+    detector = AnomalyDetector()
+    t = 0.0
+
+    for _ in range(100):
+        t += 5
+        detector.procesar("nodo", "temperatura", 24 + random.random(), t)
+    t += 5
+    print(f"✓ Pico: {detector.procesar('nodo', 'temperatura', 45.0, t)}")
+
+    for _ in range(ANOMALY_STUCK_READINGS + 1):
+        t += 5
+        alertas = detector.procesar("nodo", "humedad", 50.0, t)
+    print(f"✓ Atascado: {alertas}")
+
+    n = 200_000
+    inicio = time.perf_counter()
+    for i in range(n):
+        detector.procesar("nodo", "humedad_suelo", 40 + (i & 7), i * 5.0)
+    print(f"✓ {(time.perf_counter() - inicio) / n * 1e6:.2f} µs por lectura")
@@ -0,0 +1,63 @@
+"""
+Reducción de puntos para gráficas (Largest-Triangle-Three-Buckets)
+
+El bucle recorre cubetas (max_points), nunca filas; dentro de cada
+cubeta el área de los triángulos se calcula con NumPy.
+"""
+
+import numpy as np
+
+
+def lttb(x, y, n):
+    """Índices de los `n` puntos que mejor conservan la forma de (x, y)"""
+    total = x.size
+    if n >= total or n < 3:
+        return np.arange(total)
+
+    x = x - x[0]
+    # n - 2 cubetas para los puntos interiores (el primero y el último se conservan)
+    bordes = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    cantidad = np.diff(bordes)
+    media_x = np.add.reduceat(x[:-1], bordes[:-1]) / cantidad
+    media_y = np.add.reduceat(y[:-1], bordes[:-1]) / cantidad
+
+    indices = np.empty(n, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = total - 1
+    a = 0
+    for i in range(n - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        # Vértice C: media de la cubeta siguiente (o el último punto)
+        if i + 1 < n - 2:
+            cx, cy = media_x[i + 1], media_y[i + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[inicio:fin] - ay) - (ax - x[inicio:fin]) * (cy - ay))
+        a = inicio + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def reducir_series(x, series, max_points):
+    """Unión de los índices LTTB de varias series que comparten eje x
+
+    `max_points` se reparte entre las series, así que la unión tiene como
+    mucho `max_points` índices; los NaN se ignoran.
+    """
+    if x.size <= max_points:
+        return np.arange(x.size)
+    series = list(series)
+    presupuesto = max(max_points // max(len(series), 1), 3)
+    elegidos = []
+    for y in series:
+        validos = np.flatnonzero(~np.isnan(y))
+        if validos.size:
+            elegidos.append(validos[lttb(x[validos], y[validos], presupuesto)])
+    if not elegidos:
+        return np.arange(0)
+    indices = np.unique(np.concatenate(elegidos))
+    if indices.size > max_points:
+        # Solo con max_points < 3 * series (mínimo de 3 puntos por serie)
+        indices = indices[np.linspace(0, indices.size - 1, max_points).astype(np.int64)]
+    return indices
@@ -0,0 +1,235 @@
+"""
+Historial reciente en memoria
+
+Un buffer circular de tamaño fijo por (dispositivo, sensor): tiempos
+(epoch) y valores en dos arrays float64 paralelos, 16 bytes por muestra.
+La ingesta añade cada lectura guardada en BD y al arrancar se precarga
+la última ventana (HISTORY_BUFFER_WINDOW) desde SQLite.
+
+Las consultas de la ventana reciente buscan el inicio con búsqueda
+binaria sobre los tiempos; si piden datos que ya no están en memoria
+(antes de la precarga o expulsados por la capacidad) devuelven None y
+la API consulta SQLite.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from database.db_manager import DatabaseManager
+from monitoring.logs import obtener_logger
+from config import (
+    HISTORY_BUFFER_WINDOW, HISTORY_BUFFER_CAPACITY, DEFAULT_DEVICE_ID
+)
+
+log = obtener_logger("analitica")
+
+# Series de cada dispositivo: el id de la fila y las columnas de lecturas_sensores
+SERIES = DatabaseManager.COLUMNAS_LECTURAS
+
+
+class BufferCircular:
+    """Últimas `capacidad` muestras de una serie, en orden de llegada"""
+
+    __slots__ = ("ts", "valores", "capacidad", "n", "pos", "descartado_hasta")
+
+    BYTES_POR_MUESTRA = 16  # float64 de tiempo + float64 de valor
+
+    def __init__(self, capacidad):
+        self.ts = np.empty(capacidad, dtype=np.float64)
+        self.valores = np.empty(capacidad, dtype=np.float64)
+        self.capacidad = capacidad
+        self.n = 0
+        self.pos = 0  # siguiente posición a escribir
+        self.descartado_hasta = float("-inf")  # ts de la última muestra expulsada
+
+    def agregar(self, ts, valor):
+        pos = self.pos
+        if self.n == self.capacidad:
+            self.descartado_hasta = self.ts[pos]
+        else:
+            self.n += 1
+        self.ts[pos] = ts
+        self.valores[pos] = valor
+        self.pos = pos + 1 if pos + 1 < self.capacidad else 0
+
+    def agregar_lote(self, ts, valores):
+        """Añadir arrays ordenados por tiempo (precarga)"""
+        for inicio in range(0, len(ts), self.capacidad):
+            tramo_ts = ts[inicio:inicio + self.capacidad]
+            tramo_valores = valores[inicio:inicio + self.capacidad]
+            k = len(tramo_ts)
+            expulsadas = self.n + k - self.capacidad
+            if expulsadas > 0:
+                ultima = (self.pos - self.n + expulsadas - 1) % self.capacidad
+                self.descartado_hasta = self.ts[ultima]
+            primero = min(k, self.capacidad - self.pos)
+            self.ts[self.pos:self.pos + primero] = tramo_ts[:primero]
+            self.valores[self.pos:self.pos + primero] = tramo_valores[:primero]
+            self.ts[:k - primero] = tramo_ts[primero:]
+            self.valores[:k - primero] = tramo_valores[primero:]
+            self.n = min(self.n + k, self.capacidad)
+            self.pos = (self.pos + k) % self.capacidad
+
+    def _tramos(self):
+        """Tramos físicos [a, b) en orden cronológico"""
+        if self.n < self.capacidad:
+            return ((0, self.n),)
+        return ((self.pos, self.capacidad), (0, self.pos))
+
+    def rango(self, desde=None, ultimas=None):
+        """Copia (ts, valores) de las muestras con ts >= desde y/o las últimas N"""
+        inicio = 0  # índice lógico (0 = la más antigua)
+        if desde is not None:
+            for a, b in self._tramos():
+                i = int(np.searchsorted(self.ts[a:b], desde))
+                inicio += i
+                if i < b - a:
+                    break
+        if ultimas is not None:
+            inicio = max(inicio, self.n - ultimas)
+
+        partes_ts, partes_valores = [], []
+        for a, b in self._tramos():
+            if inicio < b - a:
+                partes_ts.append(self.ts[a + inicio:b])
+                partes_valores.append(self.valores[a + inicio:b])
+                inicio = 0
+            else:
+                inicio -= b - a
+        if not partes_ts:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(partes_ts), np.concatenate(partes_valores)
+
+    @property
+    def bytes(self):
+        return self.ts.nbytes + self.valores.nbytes
+
+
+class HistorialReciente:
+    """Buffers circulares por (dispositivo, sensor) con la ventana reciente
+
+    Todas las series de un dispositivo se escriben juntas (una fila de
+    lecturas_sensores), así que sus buffers están alineados.
+    """
+
+    def __init__(self, ventana=HISTORY_BUFFER_WINDOW, capacidad=HISTORY_BUFFER_CAPACITY):
+        self.ventana = ventana
+        self.capacidad = capacidad
+        self.buffers = {}  # (dispositivo, sensor) -> BufferCircular
+        self.dispositivos = {}  # dispositivo -> buffers en el orden de SERIES
+        self.activo = False
+        self.cobertura_desde = float("inf")  # desde aquí están todas las lecturas
+        self._lock = threading.Lock()
+        self._ultimo_ts = float("-inf")
+
+    def _buffers_de(self, dispositivo):
+        buffers = self.dispositivos.get(dispositivo)
+        if buffers is None:
+            buffers = tuple(BufferCircular(self.capacidad) for _ in SERIES)
+            for sensor, buffer in zip(SERIES, buffers):
+                self.buffers[(dispositivo, sensor)] = buffer
+            self.dispositivos[dispositivo] = buffers
+        return buffers
+
+    def agregar(self, dispositivo, lectura_id, valores, ts=None):
+        """Añadir una lectura ya guardada en BD (valores: sensor -> valor o None)"""
+        if not self.activo:
+            return
+        with self._lock:
+            # Segundos enteros como CURRENT_TIMESTAMP, y no decrecientes
+            # para la búsqueda binaria
+            ts = max(float(int(time.time())) if ts is None else ts, self._ultimo_ts)
+            self._ultimo_ts = ts
+            buffers = self._buffers_de(dispositivo or DEFAULT_DEVICE_ID)
+            buffers[0].agregar(ts, lectura_id)
+            for sensor, buffer in zip(SERIES[1:], buffers[1:]):
+                valor = valores.get(sensor)
+                buffer.agregar(ts, np.nan if valor is None else valor)
+
+    def cargar(self, db):
+        """Precargar la última ventana desde SQLite y empezar a aceptar lecturas"""
+        inicio = time.perf_counter()
+        desde = time.time() - self.ventana
+        filas = 0
+        with self._lock:
+            for lote in db.iterar_lecturas_desde(desde):
+                datos = np.array([fila[:-1] for fila in lote], dtype=np.float64)
+                datos[:, 0] = np.rint(datos[:, 0])
+                dispositivos = np.array([fila[-1] or DEFAULT_DEVICE_ID for fila in lote], dtype=object)
+                for dispositivo in set(dispositivos.tolist()):
+                    seleccion = datos[dispositivos == dispositivo]
+                    for columna, buffer in enumerate(self._buffers_de(dispositivo), start=1):
+                        buffer.agregar_lote(seleccion[:, 0], seleccion[:, columna])
+                self._ultimo_ts = max(self._ultimo_ts, datos[-1, 0])
+                filas += len(lote)
+            self.cobertura_desde = desde
+            self.activo = True
+        log.info("Historial reciente precargado", extra={
+            "filas": filas, "dispositivos": len(self.dispositivos),
+            "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1)
+        })
+
+    def olvidar_anteriores(self, hasta):
+        """Dejar de servir lecturas anteriores a `hasta` (borradas de la BD)"""
+        with self._lock:
+            self.cobertura_desde = max(self.cobertura_desde, hasta)
+
+    def ventana_lecturas(self, desde=None, ultimas=None):
+        """Lecturas de todos los dispositivos con ts >= desde y/o las últimas N
+
+        Devuelve un array (n, 1 + len(SERIES)) ordenado por tiempo con las
+        columnas (epoch, *SERIES), o None si la memoria no las tiene todas.
+        """
+        if not self.activo:
+            return None
+        with self._lock:
+            valido_desde = max([self.cobertura_desde] + [
+                buffers[0].descartado_hasta for buffers in self.dispositivos.values()
+            ])
+            if desde is not None and desde <= valido_desde:
+                return None
+            partes = []
+            for buffers in self.dispositivos.values():
+                ts, _ = buffers[0].rango(desde, ultimas)
+                if ts.size:
+                    columnas = [ts] + [b.rango(desde, ultimas)[1] for b in buffers]
+                    partes.append(np.column_stack(columnas))
+
+        if not partes:
+            datos = np.empty((0, 1 + len(SERIES)))
+        else:
+            datos = np.concatenate(partes)
+            # Por tiempo y, a igual segundo, por id (como ORDER BY timestamp)
+            datos = datos[np.lexsort((datos[:, 1], datos[:, 0]))]
+        if ultimas is not None:
+            if len(datos) < ultimas:
+                return None  # puede haber filas más antiguas solo en SQLite
+            datos = datos[len(datos) - ultimas:]
+            if ultimas and datos[0, 0] <= valido_desde:
+                return None
+        return datos
+
+    def resumen(self):
+        """Estado del historial en memoria (para /api/admin)"""
+        with self._lock:
+            muestras = sum(b.n for b in self.buffers.values())
+            memoria = sum(b.bytes for b in self.buffers.values())
+        return {
+            "activo": self.activo,
+            "ventana_s": self.ventana,
+            "capacidad": self.capacidad,
+            "dispositivos": len(self.dispositivos),
+            "series": len(self.buffers),
+            "muestras": muestras,
+            "bytes": memoria,
+            "bytes_por_muestra": BufferCircular.BYTES_POR_MUESTRA,
+            "cobertura_desde": datetime.fromtimestamp(self.cobertura_desde).isoformat()
+                               if self.activo else None
+        }
+
+
+# Instancia global
+historial_reciente = HistorialReciente()
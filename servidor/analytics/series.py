@@ -0,0 +1,141 @@
+"""
+Analítica vectorizada (NumPy) sobre ventanas de historial
+
+Los datos se cargan una sola vez en arrays contiguos y todos los cálculos
+son operaciones de NumPy, sin bucles por fila en Python.
+"""
+
+import numpy as np
+
+SERIES = ("temperatura", "humedad", "humedad_suelo")
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def cargar_ventana(db, horas=24):
+    """Cargar la ventana de historial en arrays (ts en epoch, valores float64)"""
+    lotes = [
+        np.array(lote, dtype=np.float64)
+        for lote in db.iterar_lecturas_por_tiempo(horas)
+    ]
+    if lotes:
+        datos = np.concatenate(lotes)
+    else:
+        datos = np.empty((0, 4), dtype=np.float64)
+
+    # Columnas contiguas (NULL de SQLite llega como NaN)
+    ventana = {"ts": np.rint(datos[:, 0]).astype(np.int64)}
+    for indice, nombre in enumerate(SERIES, start=1):
+        ventana[nombre] = np.ascontiguousarray(datos[:, indice])
+    return ventana
+
+
+def _grupos(claves):
+    """Inicio de cada grupo en un array de claves ordenado"""
+    return np.concatenate(([0], np.flatnonzero(np.diff(claves)) + 1))
+
+
+def _agregar(claves, valores):
+    """Media, mínimo, máximo y cantidad por grupo de claves consecutivas"""
+    inicios = _grupos(claves)
+    validos = ~np.isnan(valores)
+    cantidad = np.add.reduceat(validos.astype(np.int64), inicios)
+    suma = np.add.reduceat(np.where(validos, valores, 0.0), inicios)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = suma / cantidad
+    minimo = np.fmin.reduceat(valores, inicios)
+    maximo = np.fmax.reduceat(valores, inicios)
+    return claves[inicios], media, minimo, maximo, cantidad
+
+
+def remuestrear(ts, valores, paso, ventana_media=None):
+    """Media/mín/máx por intervalos de `paso` segundos (y media móvil opcional)"""
+    if ts.size == 0:
+        return {"ts": [], "media": [], "minima": [], "maxima": [], "media_movil": []}
+    cubetas = ts // paso
+    claves, media, minimo, maximo, _ = _agregar(cubetas, valores)
+    resultado = {
+        "ts": (claves * paso).tolist(),
+        "media": _a_lista(media),
+        "minima": _a_lista(minimo),
+        "maxima": _a_lista(maximo)
+    }
+    if ventana_media:
+        resultado["media_movil"] = _a_lista(media_movil(media, ventana_media))
+    return resultado
+
+
+def media_movil(valores, ventana):
+    """Media móvil de `ventana` puntos ignorando NaN"""
+    if valores.size == 0 or ventana <= 1:
+        return valores
+    validos = ~np.isnan(valores)
+    suma = np.cumsum(np.where(validos, valores, 0.0))
+    cantidad = np.cumsum(validos)
+    suma[ventana:] = suma[ventana:] - suma[:-ventana]
+    cantidad[ventana:] = cantidad[ventana:] - cantidad[:-ventana]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return suma / cantidad
+
+
+def percentiles(valores):
+    """Percentiles de la serie completa"""
+    validos = valores[~np.isnan(valores)]
+    if validos.size == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    resultado = np.percentile(validos, PERCENTILES)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, resultado)}
+
+
+def perfil_diario(ts, valores):
+    """Mínimo, máximo y media por día (UTC)"""
+    if ts.size == 0:
+        return []
+    dias, media, minimo, maximo, cantidad = _agregar(ts // 86400, valores)
+    fechas = np.array(dias * 86400, dtype="datetime64[s]").astype("datetime64[D]")
+    return [
+        {"fecha": str(f), "media": m, "minima": mi, "maxima": ma, "lecturas": int(c)}
+        for f, m, mi, ma, c in zip(
+            fechas, _a_lista(media), _a_lista(minimo), _a_lista(maximo), cantidad
+        )
+    ]
+
+
+def correlacion(a, b):
+    """Coeficiente de Pearson entre dos series (pares sin NaN)"""
+    mascara = ~(np.isnan(a) | np.isnan(b))
+    if mascara.sum() < 2:
+        return None
+    x = a[mascara]
+    y = b[mascara]
+    if x.std() == 0 or y.std() == 0:
+        return None
+    return round(float(np.corrcoef(x, y)[0, 1]), 4)
+
+
+def calcular_analitica(ventana, paso=300, ventana_media=12):
+    """Todas las métricas de /api/analitica sobre una ventana cargada"""
+    ts = ventana["ts"]
+    resultado = {
+        "lecturas": int(ts.size),
+        "desde": int(ts[0]) if ts.size else None,
+        "hasta": int(ts[-1]) if ts.size else None,
+        "paso": paso,
+        "series": {},
+        "correlacion_temp_humedad": correlacion(
+            ventana["temperatura"], ventana["humedad"]
+        )
+    }
+    for nombre in SERIES:
+        valores = ventana[nombre]
+        resultado["series"][nombre] = {
+            "remuestreo": remuestrear(ts, valores, paso, ventana_media),
+            "percentiles": percentiles(valores),
+            "diario": perfil_diario(ts, valores)
+        }
+    return resultado
+
+
+def _a_lista(valores):
+    """Array → lista JSON (NaN → None, 2 decimales)"""
+    redondeado = np.round(valores, 2).tolist()
+    return [None if v != v else v for v in redondeado]
@@ -0,0 +1,84 @@
+"""
+API Admin - diagnóstico del servidor
+"""
+
+from fastapi import APIRouter, Request, HTTPException
+from models.schemas import PeticionPerfilado
+from monitoring.watchdog import loop_watchdog
+from monitoring.profiling import perfilador, perfilar_peticion
+from database.query_log import consultas_lentas
+from analytics.ring_buffer import historial_reciente
+from scheduler.manager import planificador
+from mqtt.client import mqtt_client
+from config import PROFILING_ENABLED, SLOW_QUERY_THRESHOLD_MS
+
+router = APIRouter()
+
+# ==================== EVENT LOOP ====================
+
+@router.get("/loop")
+async def estado_event_loop():
+    """Retraso del event loop y últimos bloqueos con su stack"""
+    return loop_watchdog.resumen()
+
+# ==================== HISTORIAL EN MEMORIA ====================
+
+@router.get("/historial")
+async def estado_historial():
+    """Muestras, memoria y cobertura del historial reciente en memoria"""
+    return historial_reciente.resumen()
+
+# ==================== PLANIFICADOR ====================
+
+@router.get("/planificador")
+async def estado_planificador():
+    """Programaciones y temporizadores en la rueda de este worker"""
+    return planificador.resumen()
+
+# ==================== MQTT ====================
+
+@router.get("/mqtt")
+async def estado_mqtt():
+    """Conexión y cola de salida MQTT de este worker"""
+    cola = mqtt_client.cola_salida
+    return {
+        "conectado": mqtt_client.client.is_connected(),
+        "cola_salida": cola.resumen() if cola is not None else None
+    }
+
+# ==================== PERFILADO ====================
+
+@router.get("/perfil")
+async def perfil_rutas():
+    """Desglose medio por ruta: validación, handler, BD, serialización y otros"""
+    return {
+        "activo": PROFILING_ENABLED,
+        "rutas": perfilador.resumen()
+    }
+
+@router.delete("/perfil")
+async def reiniciar_perfil():
+    """Empezar una nueva medición del desglose por ruta"""
+    perfilador.reiniciar()
+    return {"status": "success"}
+
+@router.get("/consultas-lentas")
+async def obtener_consultas_lentas(limite: int = 50):
+    """Consultas SQL que superaron SLOW_QUERY_THRESHOLD_MS (más reciente primero)"""
+    return {
+        "umbral_ms": SLOW_QUERY_THRESHOLD_MS,
+        "consultas": list(reversed(consultas_lentas))[:limite]
+    }
+
+@router.post("/perfilar")
+async def perfilar(peticion: PeticionPerfilado, request: Request):
+    """
+    Ejecutar una petición dentro del proceso bajo cProfile o el muestreador
+    de pilas y devolver el informe (solo GET y con PROFILING_ENABLED)
+    """
+    if not PROFILING_ENABLED:
+        raise HTTPException(404, "Perfilado desactivado")
+    return await perfilar_peticion(
+        request.app, peticion.metodo, peticion.ruta, None,
+        peticion.modo, peticion.limite
+    )
@@ -0,0 +1,156 @@
+"""
+Archivos estáticos y páginas preparados al arrancar
+
+Cada archivo de static/ se lee una vez, se comprime (gzip y, si está
+instalado, brotli) y se publica también con la huella de su contenido en
+el nombre: css/styles_premium.<huella>.css. url_for() de las plantillas
+devuelve esa ruta, que se sirve con caché inmutable de un año; un cambio
+en el archivo cambia la huella. Las rutas sin huella siguen funcionando,
+con revalidación por ETag.
+
+Las páginas (/, /control, /historial) no dependen de la petición, así
+que se renderizan una sola vez con las URLs ya resueltas.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from fastapi.responses import Response
+
+from monitoring.logs import obtener_logger
+from config import ASSETS_MIN_COMPRESS
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+log = obtener_logger("api")
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"  # el navegador guarda la copia pero pregunta con If-None-Match
+TIPOS_TEXTO = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class _Recurso:
+    __slots__ = ("contenido", "gzip", "br", "tipo", "huella", "cache")
+
+    def __init__(self, contenido, tipo, huella, cache):
+        self.contenido = contenido
+        self.tipo = tipo
+        self.huella = huella
+        self.cache = cache
+        self.gzip = None
+        self.br = None
+        if tipo.startswith(TIPOS_TEXTO) and len(contenido) >= ASSETS_MIN_COMPRESS:
+            comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+            if len(comprimido) < len(contenido):
+                self.gzip = comprimido
+            if brotli is not None:
+                comprimido = brotli.compress(contenido, quality=11)
+                if len(comprimido) < len(contenido):
+                    self.br = comprimido
+
+    def copia(self, cache):
+        """El mismo contenido con otra política de caché (comparte los bytes)"""
+        otro = _Recurso.__new__(_Recurso)
+        for campo in _Recurso.__slots__:
+            setattr(otro, campo, getattr(self, campo))
+        otro.cache = cache
+        return otro
+
+
+def _huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()[:12]
+
+
+def _codificaciones(cabecera):
+    """Codificaciones de Accept-Encoding que el cliente no rechaza con q=0"""
+    aceptadas = set()
+    for parte in cabecera.split(","):
+        nombre, _, parametros = parte.partition(";")
+        parametros = parametros.replace(" ", "")
+        try:
+            q = float(parametros[2:]) if parametros.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+class Assets:
+    """Estáticos con huella y precomprimidos, y páginas prerenderizadas"""
+
+    def __init__(self, directorio="static", prefijo="/static"):
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.recursos = {}  # ruta relativa (con o sin huella) -> _Recurso
+        self.manifiesto = {}  # ruta relativa -> ruta con huella
+        self.paginas = {}  # plantilla -> _Recurso
+
+    def construir(self):
+        """Leer, comprimir y ponerle huella a todo lo que hay en static/"""
+        recursos, manifiesto = {}, {}
+        original = comprimido = 0
+        for raiz, _, archivos in os.walk(self.directorio):
+            for archivo in sorted(archivos):
+                ruta_fs = os.path.join(raiz, archivo)
+                ruta = os.path.relpath(ruta_fs, self.directorio).replace(os.sep, "/")
+                with open(ruta_fs, "rb") as f:
+                    contenido = f.read()
+                tipo = mimetypes.guess_type(archivo)[0] or "application/octet-stream"
+                huella = _huella(contenido)
+                base, extension = os.path.splitext(ruta)
+                con_huella = f"{base}.{huella}{extension}"
+
+                recurso = _Recurso(contenido, tipo, huella, CACHE_INMUTABLE)
+                recursos[con_huella] = recurso
+                recursos[ruta] = recurso.copia(CACHE_REVALIDAR)
+                manifiesto[ruta] = con_huella
+                original += len(contenido)
+                comprimido += len(recurso.br or recurso.gzip or contenido)
+        self.recursos, self.manifiesto = recursos, manifiesto
+        log.info("Estáticos preparados", extra={
+            "archivos": len(manifiesto), "bytes": original, "comprimidos": comprimido,
+            "brotli": brotli is not None
+        })
+
+    def url_for(self, name, **params):
+        """url_for de las plantillas: ruta con huella si el archivo está en el manifiesto"""
+        ruta = params.get("path", params.get("filename", ""))
+        return f"{self.prefijo}/{self.manifiesto.get(ruta, ruta)}"
+
+    def prerenderizar(self, entorno, plantillas):
+        """Renderizar una vez las plantillas (Jinja2) que no usan datos de la petición"""
+        for plantilla in plantillas:
+            html = entorno.get_template(plantilla).render(request=None).encode()
+            self.paginas[plantilla] = _Recurso(html, "text/html", _huella(html), CACHE_REVALIDAR)
+
+    @staticmethod
+    def responder(recurso, cabeceras):
+        """Respuesta con la mejor codificación aceptada, o 304 si el ETag coincide
+
+        Cada codificación es otra representación y lleva su propio ETag
+        ("<huella>", "<huella>-gzip", "<huella>-br").
+        """
+        aceptadas = _codificaciones(cabeceras.get("accept-encoding", ""))
+        contenido, codificacion = recurso.contenido, None
+        if recurso.br is not None and "br" in aceptadas:
+            contenido, codificacion = recurso.br, "br"
+        elif recurso.gzip is not None and "gzip" in aceptadas:
+            contenido, codificacion = recurso.gzip, "gzip"
+
+        etag = f'"{recurso.huella}-{codificacion}"' if codificacion else f'"{recurso.huella}"'
+        headers = {"Cache-Control": recurso.cache, "ETag": etag, "Vary": "Accept-Encoding"}
+        if etag in cabeceras.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        if codificacion:
+            headers["Content-Encoding"] = codificacion
+        return Response(contenido, media_type=recurso.tipo, headers=headers)
+
+
+# Instancia global
+assets = Assets()
@@ -0,0 +1,69 @@
+"""
+API Trabajos - exportaciones, analítica y limpieza en segundo plano
+"""
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from models.schemas import PeticionTrabajo
+from jobs.manager import gestor_trabajos
+
+router = APIRouter()
+
+TIPOS_MIME = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.file",
+    "parquet": "application/vnd.apache.parquet",
+    "zip": "application/zip",
+}
+
+
+def _trabajo(trabajo_id):
+    trabajo = gestor_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+@router.post("", status_code=202)
+async def enviar_trabajo(peticion: PeticionTrabajo):
+    """Encolar un trabajo en el pool de procesos"""
+    try:
+        await gestor_trabajos.iniciar()
+        trabajo = gestor_trabajos.enviar(peticion.tipo, peticion.model_dump(exclude={"tipo"}))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return gestor_trabajos.estado(trabajo)
+
+@router.get("")
+async def listar_trabajos():
+    """Trabajos recientes, más nuevos primero"""
+    return gestor_trabajos.listar()
+
+@router.get("/{trabajo_id}")
+async def estado_trabajo(trabajo_id: str):
+    """Estado y progreso (0-1) de un trabajo"""
+    return gestor_trabajos.estado(_trabajo(trabajo_id))
+
+@router.delete("/{trabajo_id}")
+async def cancelar_trabajo(trabajo_id: str):
+    """Cancelar un trabajo pendiente o en curso"""
+    trabajo = _trabajo(trabajo_id)
+    if trabajo.future is None:
+        cancelado = await gestor_trabajos.solicitar_cancelacion(trabajo)
+    else:
+        cancelado = gestor_trabajos.cancelar(trabajo)
+    if not cancelado:
+        raise HTTPException(status_code=409, detail=f"El trabajo ya terminó ({trabajo.estado})")
+    return gestor_trabajos.estado(trabajo)
+
+@router.get("/{trabajo_id}/resultado")
+async def descargar_resultado(trabajo_id: str):
+    """Descargar el archivo generado por un trabajo completado"""
+    trabajo = _trabajo(trabajo_id)
+    if trabajo.estado != "completado":
+        raise HTTPException(status_code=409, detail=f"El trabajo no está completado ({trabajo.estado})")
+    return FileResponse(
+        trabajo.ruta,
+        media_type=TIPOS_MIME[trabajo.extension],
+        filename=f"{trabajo.tipo}_{trabajo.id}.{trabajo.extension}"
+    )
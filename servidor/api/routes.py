@@ -2,110 +2,216 @@
 API Routes - REST endpoints
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from models.schemas import (
     SensorData, ActuadorData, ControlCommand, 
-    SystemMode, ThresholdConfig, DataPacket
+    SystemMode, ThresholdConfig, ConfiguracionParcial, DataPacket
 )
+from models.serialization import RespuestaJSON, filas_json
 from database.db_manager import DatabaseManager
 from mqtt.client import mqtt_client
 from mqtt.topics import MQTTTopics
+from mqtt.ingest_worker import shard_ids
+from analytics.series import cargar_ventana, calcular_analitica
+from analytics.downsampling import reducir_series
+from analytics.ring_buffer import historial_reciente
+from jobs.tareas import CABECERA_CSV, fila_csv
+from monitoring.liveness import monitor_dispositivos
+from state.backend import shared_state
+from monitoring.logs import obtener_logger
+from config import (
+    DEFAULT_TEMP_ACTIVACION, DEFAULT_TEMP_DESACTIVACION,
+    DEFAULT_HUMEDAD_SUELO_SECO, DEFAULT_HUMEDAD_SUELO_HUMEDO,
+    ANALYTICS_MAX_HOURS, WEBSOCKET_SNAPSHOT_POINTS
+)
+import asyncio
+import csv
+import io
 import json
+import time
+from datetime import datetime
+import numpy as np
 
 router = APIRouter()
 db = DatabaseManager()
+log = obtener_logger("api")
+
+# Columnas de las consultas de lecturas y alertas, en el orden del SELECT
+COLUMNAS_HISTORIAL = ("id", "temperatura", "humedad", "movimiento",
+                      "distancia", "humedad_suelo", "timestamp")
+COLUMNAS_ALERTAS = ("id", "tipo", "mensaje", "nivel", "timestamp")
+
+# Comandos manuales para los ESP32 que consultan GET /api/comandos (contrato de app.py)
+COMANDOS_VACIOS = {"ventilador": None, "bomba": None, "servo": None, "leds": {}}
 
-# Estado del sistema (migrado de Flask)
-sistema_estado = {
+# Estado del sistema (migrado de Flask), compartido entre workers
+sistema_estado = shared_state.mapping("sistema", {
     "modo": "automatico",
+    "comandos_pendientes": COMANDOS_VACIOS,
     "configuracion": {
-        "temp_activacion": 30.0,
-        "temp_desactivacion": 28.0,
-        "humedad_suelo_seco": 30,
-        "humedad_suelo_humedo": 70
+        "temp_activacion": DEFAULT_TEMP_ACTIVACION,
+        "temp_desactivacion": DEFAULT_TEMP_DESACTIVACION,
+        "humedad_suelo_seco": DEFAULT_HUMEDAD_SUELO_SECO,
+        "humedad_suelo_humedo": DEFAULT_HUMEDAD_SUELO_HUMEDO
     }
-}
+})
 
 # ==================== DATOS ====================
 
 @router.post("/datos")
-async def recibir_datos(data: DataPacket):
+async def recibir_datos(request: Request):
     """
     Recibir datos del ESP32 (compatibilidad con código actual)
+    
+    El cuerpo se valida directamente desde los bytes con
+    model_validate_json, sin json.loads ni dict intermedio.
     """
     try:
-        # Guardar sensores en BD
-        db.insertar_lectura_sensores(
-            temperatura=data.sensores.temperatura,
-            humedad=data.sensores.humedad,
-            movimiento=data.sensores.movimiento or 0,
-            distancia=data.sensores.distancia,
-            humedad_suelo=data.sensores.humedad_suelo
-        )
-        
-        # Guardar actuadores en BD
-        db.insertar_estado_actuadores(
-            servo_angulo=data.actuadores.servo_angulo,
-            ventilador_velocidad=data.actuadores.ventilador_velocidad,
-            bomba_activa=data.actuadores.bomba_activa,
-            leds=json.dumps(data.actuadores.leds)
-        )
-        
+        data = DataPacket.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    
+    try:
+        guardar_paquete(data.sensores.model_dump(), data.actuadores.model_dump())
         return {"status": "success", "mensaje": "Datos guardados"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/datos/datos")
+async def recibir_datos_legacy(request: Request):
+    """
+    Ruta del servidor Flask (app.py): JSON sin validar, los campos que
+    faltan toman los mismos valores por defecto y los errores van en "error"
+    """
+    try:
+        datos = json.loads(await request.body() or b"null")
+    except ValueError:
+        datos = None
+    if not datos or not isinstance(datos, dict):
+        return RespuestaJSON({"error": "No se recibieron datos"}, status_code=400)
+    
+    try:
+        guardar_paquete(datos.get('sensores') or {}, datos.get('actuadores') or {})
+        return {"status": "success", "mensaje": "Datos guardados"}
+    except Exception as e:
+        log.error("Error en /api/datos/datos: %s", e)
+        return RespuestaJSON({"error": str(e)}, status_code=500)
+
 @router.get("/ultimo-estado")
 async def ultimo_estado():
     """
     Obtener último estado de sensores y actuadores
     """
     try:
-        sensores = db.obtener_ultimas_lecturas(1)
-        actuadores = db.obtener_ultimo_estado_actuadores()
-        
-        if sensores and len(sensores) > 0:
-            ultimo_sensor = sensores[0]
-            return {
-                "sensores": {
-                    "temperatura": ultimo_sensor[1],
-                    "humedad": ultimo_sensor[2],
-                    "movimiento": ultimo_sensor[3],
-                    "distancia": ultimo_sensor[4],
-                    "humedad_suelo": ultimo_sensor[5],
-                    "timestamp": str(ultimo_sensor[6])
-                },
-                "actuadores": actuadores if actuadores else {}
-            }
+        estado = _ultimo_estado()
+        if estado is not None:
+            return RespuestaJSON(estado)
         else:
             raise HTTPException(status_code=404, detail="No hay datos disponibles")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/historial")
-async def obtener_historial(limite: int = 100, horas: int = None):
+async def obtener_historial(limite: int = None, horas: int = None, max_points: int = None):
     """
     Obtener historial de lecturas
+    
+    limite: las últimas N lecturas (100 por defecto sin `horas`; con `horas`,
+    las últimas N de la ventana)
+    max_points: reduce la respuesta con LTTB a como mucho max_points
+    lecturas conservando la forma de las series (para gráficas)
+    
+    La ventana reciente se sirve desde memoria (analytics.ring_buffer); lo
+    que no está en memoria se lee de SQLite y las filas se serializan
+    directamente a bytes (sin jsonable_encoder).
     """
     try:
+        if horas and max_points:
+            return RespuestaJSON(await asyncio.to_thread(historial_reducido, horas, max_points))
+        
+        if not horas and limite is None:
+            limite = 100
         if horas:
-            lecturas = db.obtener_lecturas_por_tiempo(horas)
+            recientes = historial_reciente.ventana_lecturas(desde=time.time() - horas * 3600)
+            if recientes is not None and limite is not None:
+                recientes = recientes[max(len(recientes) - limite, 0):]
         else:
-            lecturas = db.obtener_ultimas_lecturas(limite)
+            recientes = historial_reciente.ventana_lecturas(ultimas=limite)
+        if recientes is not None:
+            return RespuestaJSON(filas_lecturas(recientes[::-1]))  # más recientes primero
         
-        historial = []
-        for lectura in lecturas:
-            historial.append({
-                "id": lectura[0],
-                "temperatura": lectura[1],
-                "humedad": lectura[2],
-                "movimiento": lectura[3],
-                "distancia": lectura[4],
-                "humedad_suelo": lectura[5],
-                "timestamp": str(lectura[6])
-            })
+        if horas:
+            lecturas = db.obtener_lecturas_por_tiempo(horas, limite)
+        else:
+            lecturas = db.obtener_ultimas_lecturas(limite)
         
-        return historial
+        return RespuestaJSON(filas_json(lecturas, COLUMNAS_HISTORIAL))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/sensores/actual")
+async def sensores_actual():
+    """
+    Último valor de cada dispositivo, combinando los shards de ingesta
+    """
+    shards = ["principal"] + shard_ids()
+    dispositivos = {}
+    for shard in shards:
+        for dispositivo, estado in shared_state.get(f"sensores:{shard}", {}).items():
+            actual = dispositivos.get(dispositivo)
+            # Si un dispositivo aparece en varios shards gana el más reciente
+            if actual is None or (estado.get("timestamp") or "") > (actual.get("timestamp") or ""):
+                dispositivos[dispositivo] = estado
+    return RespuestaJSON(dispositivos)
+
+@router.get("/dispositivos")
+async def listar_dispositivos(estado: str = None):
+    """
+    Presencia de cada dispositivo (online/offline, último mensaje visto),
+    combinando los shards de ingesta. `estado` filtra por online u offline.
+    """
+    dispositivos = {}
+    for shard in ["principal"] + shard_ids():
+        dispositivos.update(shared_state.get(f"dispositivos:{shard}", {}))
+    # Lo de este proceso va al día; los snapshots tienen hasta DEVICE_SNAPSHOT_INTERVAL s
+    dispositivos.update(monitor_dispositivos.listar())
+    if estado is not None:
+        dispositivos = {d: info for d, info in dispositivos.items() if info["estado"] == estado}
+    return RespuestaJSON({
+        "total": len(dispositivos),
+        "dispositivos": dispositivos
+    })
+
+@router.get("/alertas")
+async def obtener_alertas(limite: int = 50):
+    """
+    Obtener alertas recientes
+    """
+    try:
+        alertas = db.obtener_alertas_recientes(limite)
+        return RespuestaJSON(filas_json(alertas, COLUMNAS_ALERTAS))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/analitica")
+async def obtener_analitica(horas: int = 24, paso: int = 300, ventana: int = 12):
+    """
+    Analítica vectorizada sobre el historial: remuestreo, media móvil,
+    percentiles, perfil diario y correlación temperatura/humedad
+    """
+    if not (0 < horas <= ANALYTICS_MAX_HOURS):
+        raise HTTPException(status_code=400, detail=f"horas debe estar entre 1 y {ANALYTICS_MAX_HOURS}")
+    if paso < 1 or ventana < 1:
+        raise HTTPException(status_code=400, detail="paso y ventana deben ser positivos")
+    
+    def calcular():
+        return calcular_analitica(cargar_ventana(db, horas), paso, ventana)
+    
+    try:
+        # Fuera del event loop: NumPy y SQLite liberan el GIL la mayor parte del tiempo
+        return RespuestaJSON(await asyncio.to_thread(calcular))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -119,6 +225,7 @@ async def controlar_ventilador(command: dict):
     
     estado = command.get('estado', False)
     mqtt_client.publish_actuator_command("ventilador", estado)
+    registrar_comandos_pendientes({"ventilador": estado})
     
     # Persistir en BD
     actualizar_estado_actuador_inmediato(ventilador_velocidad=100 if estado else 0)
@@ -133,6 +240,7 @@ async def controlar_bomba(command: dict):
     
     estado = command.get('estado', False)
     mqtt_client.publish_actuator_command("bomba", estado)
+    registrar_comandos_pendientes({"bomba": estado})
     
     # Persistir en BD
     actualizar_estado_actuador_inmediato(bomba_activa=estado)
@@ -150,6 +258,7 @@ async def controlar_servo(command: dict):
         raise HTTPException(status_code=400, detail="Ángulo debe estar entre 0 y 180")
     
     mqtt_client.publish_actuator_command("servo", angulo)
+    registrar_comandos_pendientes({"servo": angulo})
     
     # Persistir en BD
     actualizar_estado_actuador_inmediato(servo_angulo=angulo)
@@ -175,6 +284,7 @@ async def controlar_led(command: dict):
     device = device_map.get(nombre)
     if device:
         mqtt_client.publish_actuator_command(device, estado)
+        registrar_comandos_pendientes({device: estado})
         
         # Persistir en BD
         ultimo = db.obtener_ultimo_estado_actuadores() or {}
@@ -200,8 +310,14 @@ async def cambiar_modo(mode: SystemMode):
     """Cambiar modo del sistema"""
     sistema_estado['modo'] = mode.modo
     
-    # Publicar por MQTT
-    mqtt_client.publish(MQTTTopics.MODO, mode.modo)
+    # En automático los ESP32 dejan de recibir los comandos manuales
+    if mode.modo == 'automatico':
+        sistema_estado['comandos_pendientes'] = COMANDOS_VACIOS
+    
+    db.guardar_estado_sistema('modo', mode.modo)
+    
+    # Publicar por MQTT (retenido)
+    mqtt_client.publicar_estado(MQTTTopics.MODO, mode.modo)
     
     return {"status": "success", "modo": mode.modo}
 
@@ -211,17 +327,181 @@ async def obtener_configuracion():
     return sistema_estado['configuracion']
 
 @router.post("/configuracion")
-async def actualizar_configuracion(config: ThresholdConfig):
-    """Actualizar configuración de umbrales"""
+async def actualizar_configuracion(cambios: ConfiguracionParcial):
+    """Actualizar configuración de umbrales (solo los campos enviados)"""
+    try:
+        config = ThresholdConfig(**{
+            **sistema_estado['configuracion'], **cambios.model_dump(exclude_unset=True)
+        })
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
     sistema_estado['configuracion'] = config.dict()
+    db.guardar_estado_sistema('configuracion', config.dict())
     
-    # Publicar por MQTT
-    mqtt_client.publish(MQTTTopics.CONFIG, json.dumps(config.dict()))
+    # Publicar por MQTT (retenido)
+    mqtt_client.publicar_estado(MQTTTopics.CONFIG, json.dumps(config.dict()))
     
     return {"status": "success", "configuracion": sistema_estado['configuracion']}
 
+@router.get("/comandos")
+async def obtener_comandos():
+    """
+    ESP32 consulta comandos pendientes (contrato de app.py)
+    Retorna modo, comandos (solo en manual) y configuración
+    """
+    respuesta = {
+        "modo": sistema_estado['modo'],
+        "comandos": {},
+        "configuracion": sistema_estado['configuracion']
+    }
+    if respuesta['modo'] == 'manual':
+        respuesta['comandos'] = {
+            k: v for k, v in sistema_estado['comandos_pendientes'].items()
+            if v is not None and v != {}
+        }
+    return respuesta
+
+# ==================== EXPORTAR ====================
+
+@router.get("/exportar/csv")
+async def exportar_csv(horas: int = 24):
+    """
+    Exportar historial a CSV (contrato de app.py)
+    
+    Para meses de historial conviene el trabajo exportar_csv (/api/trabajos),
+    que no retiene el archivo en memoria.
+    """
+    try:
+        contenido = await asyncio.to_thread(csv_historial, horas)
+    except Exception as e:
+        log.error("Error en /api/exportar/csv: %s", e)
+        return RespuestaJSON({"error": str(e)}, status_code=500)
+    nombre = f'historial_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(
+        contenido,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={nombre}"}
+    )
+
 # ==================== HELPER FUNCTIONS ====================
 
+def guardar_paquete(sensores, actuadores):
+    """Guardar la lectura (en BD y en el historial en memoria) y el estado
+    de actuadores de un paquete HTTP del ESP32"""
+    lectura = {
+        "temperatura": sensores.get('temperatura'),
+        "humedad": sensores.get('humedad'),
+        "movimiento": sensores.get('movimiento') or 0,
+        "distancia": sensores.get('distancia'),
+        "humedad_suelo": sensores.get('humedad_suelo')
+    }
+    lectura_id = db.insertar_lectura_sensores(**lectura)
+    historial_reciente.agregar(None, lectura_id, lectura)
+    
+    db.insertar_estado_actuadores(
+        servo_angulo=actuadores.get('servo_angulo', 90),
+        ventilador_velocidad=actuadores.get('ventilador_velocidad', 0),
+        bomba_activa=actuadores.get('bomba_activa', False),
+        leds=json.dumps(actuadores.get('leds', {}))
+    )
+
+def registrar_comandos_pendientes(comandos):
+    """Guardar comandos manuales ({dispositivo MQTT: valor}) para GET /api/comandos"""
+    pendientes = dict(sistema_estado['comandos_pendientes'])
+    leds = dict(pendientes['leds'])
+    for dispositivo, valor in comandos.items():
+        if dispositivo.startswith("led_"):
+            leds[dispositivo[len("led_"):]] = valor
+        elif dispositivo in pendientes:
+            pendientes[dispositivo] = valor
+    pendientes['leds'] = leds
+    sistema_estado['comandos_pendientes'] = pendientes
+
+def csv_historial(horas):
+    """Historial de las últimas X horas en CSV (mismas columnas y orden que app.py:
+    más recientes primero)"""
+    salida = io.StringIO()
+    writer = csv.writer(salida)
+    writer.writerow(CABECERA_CSV)
+    for lote in db.iterar_lecturas_completas(horas, descendente=True):
+        writer.writerows(fila_csv(lectura) for lectura in lote)
+    return salida.getvalue()
+
+def _ultimo_estado():
+    """Última lectura y estado de actuadores (None si no hay lecturas)"""
+    sensores = db.obtener_ultimas_lecturas(1)
+    actuadores = db.obtener_ultimo_estado_actuadores()
+    if not sensores:
+        return None
+    ultimo_sensor = sensores[0]
+    return {
+        "sensores": {
+            "temperatura": ultimo_sensor[1],
+            "humedad": ultimo_sensor[2],
+            "movimiento": ultimo_sensor[3],
+            "distancia": ultimo_sensor[4],
+            "humedad_suelo": ultimo_sensor[5],
+            "timestamp": str(ultimo_sensor[6])
+        },
+        "actuadores": actuadores if actuadores else {}
+    }
+
+def _snapshot_dashboard(puntos):
+    recientes = historial_reciente.ventana_lecturas(ultimas=puntos)
+    if recientes is not None:
+        historial = filas_lecturas(recientes[::-1])
+    else:
+        historial = [dict(zip(COLUMNAS_HISTORIAL, fila)) for fila in db.obtener_ultimas_lecturas(puntos)]
+    return {"estado": _ultimo_estado(), "historial": historial}
+
+async def snapshot_dashboard():
+    """
+    Estado para un cliente WebSocket que no puede reanudar con los eventos
+    perdidos: lo mismo que el dashboard pide a /api/ultimo-estado y /api/historial
+    """
+    return await asyncio.to_thread(_snapshot_dashboard, WEBSOCKET_SNAPSHOT_POINTS)
+
+def historial_reducido(horas, max_points):
+    """Historial de las últimas X horas reducido a como mucho max_points lecturas"""
+    columnas = DatabaseManager.COLUMNAS_LECTURAS
+    datos = historial_reciente.ventana_lecturas(desde=time.time() - horas * 3600)
+    if datos is None:
+        lotes = [np.array(lote, dtype=np.float64)
+                 for lote in db.iterar_lecturas_por_tiempo(horas, columnas=columnas)]
+        if not lotes:
+            return []
+        datos = np.concatenate(lotes)
+    if not len(datos):
+        return []
+    ts = datos[:, 0]
+    
+    series = [datos[:, 1 + columnas.index(c)] for c in ("temperatura", "humedad", "humedad_suelo")]
+    seleccion = reducir_series(ts, series, max(max_points, 3))[::-1]  # más recientes primero
+    return filas_lecturas(datos[seleccion])
+
+def filas_lecturas(datos):
+    """Array (epoch, *COLUMNAS_LECTURAS) → filas con el formato de /api/historial
+    
+    Se convierte columna a columna (tolist) y las filas se arman con zip,
+    sin recorrer los valores de NumPy uno a uno.
+    """
+    if not len(datos):
+        return []  # np.char no acepta arrays vacíos
+    columnas = []
+    for indice, nombre in enumerate(DatabaseManager.COLUMNAS_LECTURAS, start=1):
+        serie = datos[:, indice]
+        nulos = np.isnan(serie)
+        if nombre in ("id", "movimiento"):
+            valores = np.where(nulos, 0, serie).astype(np.int64).tolist()
+        else:
+            valores = serie.tolist()
+        if nulos.any():
+            valores = [None if nulo else v for v, nulo in zip(valores, nulos.tolist())]
+        columnas.append(valores)
+    marcas = np.rint(datos[:, 0]).astype("datetime64[s]").astype(str)
+    columnas.append(np.char.replace(marcas, "T", " ").tolist())
+    return [dict(zip(COLUMNAS_HISTORIAL, fila)) for fila in zip(*columnas)]
+
 def actualizar_estado_actuador_inmediato(**kwargs):
     """Actualizar estado de actuadores en BD inmediatamente"""
     try:
@@ -242,6 +522,6 @@ def actualizar_estado_actuador_inmediato(**kwargs):
             leds=json.dumps(leds)
         )
         
-        print(f"✓ Estado persistido en BD")
+        log.debug("Estado de actuadores persistido en BD")
     except Exception as e:
-        print(f"✗ Error al persistir estado: {e}")
+        log.error("Error al persistir estado: %s", e)
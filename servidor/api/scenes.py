@@ -0,0 +1,120 @@
+"""
+API Escenas - conjuntos de acciones de actuadores aplicados en una llamada
+
+Aplicar una escena es una sola combinación de estado y una escritura en
+BD (database.combinar_estado_actuadores), los comandos MQTT encolados de
+una vez y un único broadcast WebSocket con todos los cambios.
+"""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from models.schemas import Escena
+from api.routes import db, sistema_estado, registrar_comandos_pendientes
+from api.websocket import websocket_manager
+from mqtt.client import mqtt_client
+from mqtt.topics import MQTTTopics
+from monitoring.logs import obtener_logger
+
+router = APIRouter()
+log = obtener_logger("api")
+
+# En modo automático los controla el ESP32 (igual que /api/control/*)
+SOLO_MANUAL = ("ventilador", "bomba", "servo")
+
+
+def estado_de_acciones(acciones):
+    """Acciones (dispositivo -> valor) → (columnas de estado_actuadores, leds)"""
+    cambios = {}
+    leds = {}
+    for dispositivo, valor in acciones.items():
+        if dispositivo == "ventilador":
+            cambios["ventilador_velocidad"] = 100 if valor else 0
+        elif dispositivo == "bomba":
+            cambios["bomba_activa"] = valor
+        elif dispositivo == "servo":
+            cambios["servo_angulo"] = valor
+        else:
+            leds[dispositivo.removeprefix("led_")] = valor
+    return cambios, leds
+
+
+def acciones_de_estado(estado):
+    """Fila de estado_actuadores → acciones (dispositivo -> valor), la inversa de estado_de_acciones"""
+    acciones = {
+        # El receptor solo entiende ON/OFF: cualquier velocidad > 0 es encendido
+        "ventilador": (estado["ventilador_velocidad"] or 0) > 0,
+        "bomba": estado["bomba_activa"],
+        "servo": estado["servo_angulo"]
+    }
+    for nombre, valor in estado["leds"].items():
+        if f"led_{nombre}" in MQTTTopics.ACTUADORES:
+            acciones[f"led_{nombre}"] = valor
+    return acciones
+
+
+async def aplicar_escena(nombre):
+    """Aplicar una escena guardada; devuelve el estado de actuadores resultante
+
+    Usada por la API y por el WebSocket ({"type": "scene", "nombre": ...}).
+    """
+    escena = await asyncio.to_thread(db.obtener_escena, nombre)
+    if escena is None:
+        raise HTTPException(status_code=404, detail="Escena no encontrada")
+    acciones = escena["acciones"]
+    if sistema_estado['modo'] != 'manual' and any(d in SOLO_MANUAL for d in acciones):
+        raise HTTPException(status_code=400, detail="Sistema en modo automático")
+
+    # Primero la BD: si falla no se envía ningún comando
+    cambios, leds = estado_de_acciones(acciones)
+    estado = await asyncio.to_thread(db.combinar_estado_actuadores, cambios, leds)
+    mqtt_client.publish_actuator_commands(list(acciones.items()))
+    registrar_comandos_pendientes(acciones)
+    await websocket_manager.broadcast_actuator_batch(acciones, escena=nombre, estado=estado)
+    log.info("Escena %s aplicada", nombre, extra={"dispositivos": len(acciones)})
+    return estado
+
+# ==================== ESCENAS ====================
+
+@router.get("")
+async def listar_escenas():
+    """Escenas guardadas"""
+    try:
+        return db.listar_escenas()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("")
+async def guardar_escena(escena: Escena):
+    """Crear o reemplazar una escena"""
+    try:
+        db.guardar_escena(escena.nombre, escena.acciones, escena.descripcion)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "escena": escena.model_dump()}
+
+@router.get("/{nombre}")
+async def obtener_escena(nombre: str):
+    """Una escena por nombre"""
+    escena = db.obtener_escena(nombre)
+    if escena is None:
+        raise HTTPException(status_code=404, detail="Escena no encontrada")
+    return escena
+
+@router.delete("/{nombre}")
+async def eliminar_escena(nombre: str):
+    """Borrar una escena"""
+    if not db.eliminar_escena(nombre):
+        raise HTTPException(status_code=404, detail="Escena no encontrada")
+    return {"status": "success", "escena": nombre}
+
+@router.post("/{nombre}/aplicar")
+async def aplicar(nombre: str):
+    """Aplicar todas las acciones de una escena en una sola operación"""
+    try:
+        estado = await aplicar_escena(nombre)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "escena": nombre, "estado": estado}
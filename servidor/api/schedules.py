@@ -0,0 +1,43 @@
+"""
+API Programaciones - acciones de actuadores diferidas y recurrentes
+"""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from models.schemas import Programacion
+from scheduler.manager import planificador
+
+router = APIRouter()
+
+@router.get("")
+async def listar_programaciones(solo_activas: bool = False):
+    """Programaciones guardadas con su próxima ejecución (epoch)"""
+    try:
+        return await asyncio.to_thread(planificador.db.listar_programaciones, solo_activas)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("", status_code=201)
+async def crear_programacion(programacion: Programacion):
+    """Programar una acción (una vez, diaria o por intervalo, con duración opcional)"""
+    try:
+        return await planificador.crear(programacion.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{programacion_id}")
+async def obtener_programacion(programacion_id: int):
+    programacion = await asyncio.to_thread(planificador.db.obtener_programacion, programacion_id)
+    if programacion is None:
+        raise HTTPException(status_code=404, detail="Programación no encontrada")
+    return programacion
+
+@router.delete("/{programacion_id}")
+async def eliminar_programacion(programacion_id: int):
+    """Borrar una programación (si tenía una duración en curso se envía su valor final)"""
+    if not await planificador.eliminar(programacion_id):
+        raise HTTPException(status_code=404, detail="Programación no encontrada")
+    return {"status": "success", "id": programacion_id}
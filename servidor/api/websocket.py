@@ -1,51 +1,319 @@
 """
 WebSocket manager para comunicación en tiempo real con el dashboard
+
+Los clientes pueden suscribirse a una parte de los eventos:
+
+    {"type": "subscribe", "event": "sensor_data", "device": "nodo1", "sensor": "temperatura"}
+    {"type": "subscribe", "filters": [{"device": "nodo1"}, {"event": "alerta"}]}
+    {"type": "unsubscribe", "device": "nodo1"}   # sin filtros: todos
+
+Cada campo que falta vale para cualquiera. Un cliente sin suscripciones
+recibe todo. Los filtros van a un índice invertido (clave -> clientes),
+así que un broadcast mira unas pocas claves en vez de todas las conexiones.
+
+Cada evento lleva un número de secuencia ("seq") y se guarda en un
+registro acotado. Un cliente que se reconecta a /ws?epoch=...&last_seq=...
+recibe solo los eventos perdidos, o un "snapshot" si ya no están en el
+registro o la epoch es de otro proceso (reinicio u otro worker). Con
+&filters=[...] (la misma lista que en subscribe) la reconexión ya nace
+suscrita y solo se le reenvían los eventos que coinciden.
+
+Los broadcasts se envían de uno en uno (un lock), así que cada cliente
+recibe los eventos en orden de seq.
 """
 
+import asyncio
 from fastapi import WebSocket
 from typing import List
-import json
+from collections import deque
+from itertools import islice, product
+import time
+import uuid
+from state.backend import shared_state
+from models.serialization import dumps_texto
+from monitoring.metrics import WEBSOCKET_ENVIO, DESCARTADOS
+from monitoring.logs import obtener_logger
+from config import WEBSOCKET_MAX_FILTERS, WEBSOCKET_EVENT_LOG_SIZE
+
+log = obtener_logger("websocket")
+
+CAMPOS_FILTRO = ("event", "device", "sensor")
+
+
+def clave_filtro(filtro):
+    """(event, device, sensor) de un filtro; None = cualquiera"""
+    if not isinstance(filtro, dict):
+        raise ValueError("El filtro debe ser un objeto")
+    clave = tuple(filtro.get(campo) for campo in CAMPOS_FILTRO)
+    if any(valor is not None and not isinstance(valor, str) for valor in clave):
+        raise ValueError("Los campos del filtro deben ser texto")
+    if clave == (None, None, None):
+        raise ValueError("Filtro vacío: indica event, device o sensor")
+    return clave
+
+
+def claves_evento(message):
+    """Tipo, dispositivos y sensores a los que afecta un mensaje"""
+    tipo = message.get("type")
+    dispositivos = set()
+    sensores = set()
+    if message.get("device") is not None:
+        dispositivos.add(message["device"])
+    if tipo == "sensor_data":
+        sensores.update((message.get("data") or {}).get("sensores") or ())
+    elif tipo == "actuator_batch":
+        dispositivos.update(cambio["device"] for cambio in message.get("changes", ()))
+    elif tipo == "alerta":
+        alerta = message.get("alerta") or {}
+        if alerta.get("dispositivo") is not None:
+            dispositivos.add(alerta["dispositivo"])
+        if alerta.get("sensor") is not None:
+            sensores.add(alerta["sensor"])
+    return tipo, dispositivos, sensores
+
+
+def claves_coincidentes(message):
+    """Claves de filtro (event, device, sensor) que reciben este mensaje"""
+    tipo, dispositivos, sensores = claves_evento(message)
+    return product((tipo, None), (*dispositivos, None), (*sensores, None))
+
+
+def claves_de_filtros(filtros):
+    """Lista de filtros de subscribe → claves (ValueError si no es válida)"""
+    if not isinstance(filtros, list):
+        raise ValueError("filters debe ser una lista")
+    return [clave_filtro(filtro) for filtro in filtros]
+
+
+class IndiceSuscripciones:
+    """Índice invertido (event, device, sensor) -> conexiones suscritas
+
+    Las conexiones sin filtros se guardan aparte y reciben todo; el coste
+    de un evento es el de las claves que genera más sus destinatarios.
+    """
+
+    def __init__(self):
+        self.indice = {}  # clave -> set de conexiones
+        self.filtros = {}  # conexión -> set de claves
+        self.sin_filtro = {}  # conexiones que reciben todo (dict para mantener el orden)
+
+    def agregar(self, conexion):
+        self.sin_filtro[conexion] = None
+
+    def quitar(self, conexion):
+        self.desuscribir(conexion)
+        self.sin_filtro.pop(conexion, None)
+
+    def suscribir(self, conexion, claves):
+        propias = self.filtros.get(conexion, set())
+        if len(propias | set(claves)) > WEBSOCKET_MAX_FILTERS:
+            raise ValueError(f"Máximo {WEBSOCKET_MAX_FILTERS} filtros por conexión")
+        self.filtros[conexion] = propias
+        self.sin_filtro.pop(conexion, None)
+        for clave in claves:
+            propias.add(clave)
+            self.indice.setdefault(clave, set()).add(conexion)
+        return propias
+
+    def desuscribir(self, conexion, claves=None):
+        """Quitar filtros (todos si `claves` es None); devuelve los que quedan"""
+        propias = self.filtros.get(conexion)
+        if propias is None:
+            return set()
+        for clave in list(propias) if claves is None else claves:
+            if clave not in propias:
+                continue
+            propias.discard(clave)
+            suscriptores = self.indice[clave]
+            suscriptores.discard(conexion)
+            if not suscriptores:
+                del self.indice[clave]
+        if not propias:
+            # Sin filtros vuelve a recibir todo
+            del self.filtros[conexion]
+            self.sin_filtro[conexion] = None
+        return propias
+
+    def destinatarios(self, message):
+        """Conexiones sin filtros más las que tienen alguno que coincide"""
+        if not self.indice:
+            return list(self.sin_filtro)
+        encontrados = set()
+        for clave in claves_coincidentes(message):
+            suscriptores = self.indice.get(clave)
+            if suscriptores:
+                encontrados |= suscriptores
+        return [*self.sin_filtro, *encontrados]
+
+
+class RegistroEventos:
+    """Últimos eventos enviados por este proceso, numerados"""
+
+    def __init__(self, capacidad=WEBSOCKET_EVENT_LOG_SIZE):
+        # Las secuencias son de este proceso: otra epoch obliga a un snapshot
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.eventos = deque(maxlen=capacidad)  # (seq, texto, mensaje)
+
+    def registrar(self, message):
+        """Numerar un evento; devuelve el texto a enviar"""
+        self.seq += 1
+        texto = dumps_texto({**message, "seq": self.seq})
+        self.eventos.append((self.seq, texto, message))
+        return texto
+
+    def desde(self, seq):
+        """Eventos posteriores a `seq`, o None si ya no están todos"""
+        perdidos = self.seq - seq
+        if perdidos < 0 or perdidos > len(self.eventos):
+            return None
+        return list(islice(self.eventos, len(self.eventos) - perdidos, None))
+
 
 class WebSocketManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        self.suscripciones = IndiceSuscripciones()
+        self.eventos = RegistroEventos()
+        # Coroutine con el estado completo para el snapshot (se asigna desde main.py)
+        self.snapshot = None
+        # Un broadcast a la vez: numerar y enviar sin que otro se intercale
+        self._lock_envio = asyncio.Lock()
         
-    async def connect(self, websocket: WebSocket):
-        """Aceptar nueva conexión WebSocket"""
+    async def connect(self, websocket: WebSocket, last_seq: int = None, epoch: str = None,
+                      filtros: list = None):
+        """Aceptar nueva conexión WebSocket
+        
+        Con `last_seq` el cliente se reconecta: antes de recibir eventos en
+        vivo se le envía lo que se perdió (o un snapshot). Con `filtros`
+        (como en subscribe) solo lo que coincide con ellos.
+        """
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"✓ Cliente WebSocket conectado. Total: {len(self.active_connections)}")
         
         # Enviar mensaje de bienvenida
-        await websocket.send_json({
+        await websocket.send_text(dumps_texto({
             "type": "connection",
             "status": "connected",
-            "message": "Conectado al servidor SmartHome"
-        })
+            "message": "Conectado al servidor SmartHome",
+            "epoch": self.eventos.epoch,
+            "seq": self.eventos.seq
+        }))
+        claves = None
+        if filtros is not None:
+            try:
+                claves = set(claves_de_filtros(filtros)) or None
+                if claves is not None and len(claves) > WEBSOCKET_MAX_FILTERS:
+                    raise ValueError(f"Máximo {WEBSOCKET_MAX_FILTERS} filtros por conexión")
+            except ValueError as e:
+                await websocket.send_text(dumps_texto({"type": "error", "message": str(e)}))
+                claves = None
+        if last_seq is not None:
+            await self._ponerse_al_dia(
+                websocket, last_seq if epoch == self.eventos.epoch else None, claves
+            )
+        
+        self.active_connections.append(websocket)
+        self.suscripciones.agregar(websocket)
+        if claves is not None:
+            self.suscripciones.suscribir(websocket, claves)
+        log.info("Cliente WebSocket conectado", extra={"clientes": len(self.active_connections)})
+        
+    async def _ponerse_al_dia(self, websocket: WebSocket, ultimo, claves=None):
+        """Enviar los eventos posteriores a `ultimo` (None = snapshot)
+        
+        Con `claves` se saltan los eventos que no coinciden con ningún
+        filtro (el snapshot se envía siempre).
+        
+        Se repite hasta no quedar nada pendiente; entre la última
+        comprobación y el alta en active_connections no hay ningún await,
+        así que no se pierde ni se duplica ningún evento.
+        """
+        while True:
+            pendientes = self.eventos.desde(ultimo) if ultimo is not None else None
+            if pendientes is None:
+                ultimo = self.eventos.seq
+                estado = await self.snapshot() if self.snapshot is not None else {}
+                await websocket.send_text(dumps_texto({
+                    "type": "snapshot",
+                    "epoch": self.eventos.epoch,
+                    "seq": ultimo,
+                    **estado
+                }))
+                continue
+            if not pendientes:
+                return
+            for ultimo, texto, message in pendientes:
+                if claves is None or not claves.isdisjoint(claves_coincidentes(message)):
+                    await websocket.send_text(texto)
         
     def disconnect(self, websocket: WebSocket):
         """Desconectar cliente WebSocket"""
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
-            print(f"✗ Cliente WebSocket desconectado. Total: {len(self.active_connections)}")
+            self.suscripciones.quitar(websocket)
+            log.info("Cliente WebSocket desconectado", extra={"clientes": len(self.active_connections)})
             
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Enviar mensaje a un cliente específico"""
         try:
-            await websocket.send_json(message)
+            await websocket.send_text(dumps_texto(message))
         except Exception as e:
-            print(f"✗ Error enviando mensaje personal: {e}")
+            log.warning("Error enviando mensaje personal: %s", e)
             self.disconnect(websocket)
             
+    async def subscribe(self, websocket: WebSocket, data: dict, suscribir=True):
+        """Mensaje subscribe/unsubscribe de un cliente; responde con sus filtros"""
+        try:
+            filtros = data.get("filters")
+            if filtros is None:
+                campos = {campo: data.get(campo) for campo in CAMPOS_FILTRO}
+                filtros = [campos] if any(campos.values()) else []
+            claves = claves_de_filtros(filtros)
+            if suscribir:
+                if not claves:
+                    raise ValueError("Filtro vacío: indica event, device o sensor")
+                vigentes = self.suscripciones.suscribir(websocket, claves)
+            else:
+                vigentes = self.suscripciones.desuscribir(websocket, claves or None)
+        except ValueError as e:
+            await self.send_personal_message({"type": "error", "message": str(e)}, websocket)
+            return
+        await self.send_personal_message({
+            "type": "subscriptions",
+            "filters": [dict(zip(CAMPOS_FILTRO, clave)) for clave in sorted(vigentes, key=str)]
+        }, websocket)
+
     async def broadcast(self, message: dict):
-        """Enviar mensaje a todos los clientes conectados"""
+        """Publicar mensaje para los clientes de todos los workers"""
+        await shared_state.publish("websocket", message)
+        
+    async def on_shared_event(self, canal: str, message: dict):
+        """Recibir eventos del estado compartido"""
+        if canal == "websocket":
+            await self.broadcast_local(message)
+            
+    async def broadcast_local(self, message: dict):
+        """Enviar mensaje a los clientes conectados a este worker
+        
+        El mensaje se serializa una sola vez y se envía el mismo texto a
+        todos (send_json lo serializaría por cada cliente). Solo se
+        recorren los clientes interesados (ver IndiceSuscripciones), pero
+        todo evento se numera y entra en el registro. Con el lock, un
+        broadcast no empieza hasta que el anterior se envió a todos.
+        """
         disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"✗ Error en broadcast: {e}")
-                disconnected.append(connection)
+        async with self._lock_envio:
+            texto = self.eventos.registrar(message)
+            for connection in self.suscripciones.destinatarios(message):
+                inicio = time.perf_counter()
+                try:
+                    await connection.send_text(texto)
+                except Exception as e:
+                    log.warning("Error en broadcast: %s", e)
+                    DESCARTADOS.labels("websocket_desconectado").inc()
+                    disconnected.append(connection)
+                else:
+                    WEBSOCKET_ENVIO.observe(time.perf_counter() - inicio)
                 
         # Limpiar conexiones muertas
         for conn in disconnected:
@@ -66,5 +334,15 @@ class WebSocketManager:
             "value": value
         })
 
+    async def broadcast_actuator_batch(self, cambios: dict, escena: str = None, estado: dict = None):
+        """Un solo broadcast con varios cambios de actuadores (escenas)"""
+        await self.broadcast({
+            "type": "actuator_batch",
+            "escena": escena,
+            "changes": [{"device": device, "value": value} for device, value in cambios.items()],
+            "estado": estado
+        })
+
 # Instancia global
 websocket_manager = WebSocketManager()
+shared_state.subscribe(websocket_manager.on_shared_event)
@@ -1,6 +1,9 @@
 """
 Servidor Flask para Casa Domótica - SISTEMA COMPLETO
 API REST con control manual/automático
+
+Obsoleto: main.py (FastAPI, puerto 8000) sirve estas mismas rutas con el
+estado compartido y la misma BD. Se mantiene solo como referencia.
 """
 
 from flask import Flask, render_template, jsonify, request, Response
@@ -0,0 +1,117 @@
+"""
+Benchmark de /api/analitica: NumPy vectorizado vs SQL + Python puro
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_analitica --filas 1000000
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+
+from analytics.series import cargar_ventana, calcular_analitica, SERIES
+from benchmarks.generador import cargar_lecturas
+
+
+def analitica_baseline(db, horas, paso, ventana):
+    """Mismas métricas con GROUP BY en SQL y bucles de Python"""
+    resultado = {"series": {}}
+    with db.get_connection() as conn:
+        conn.row_factory = None
+        filas = conn.execute('''
+            SELECT temperatura, humedad, humedad_suelo
+            FROM lecturas_sensores
+            WHERE timestamp >= datetime('now', 'localtime', ?)
+            ORDER BY timestamp
+        ''', (f"-{horas} hours",)).fetchall()
+
+        for indice, nombre in enumerate(SERIES):
+            cubetas = conn.execute(f'''
+                SELECT CAST(strftime('%s', timestamp) AS INTEGER) / ? AS cubeta,
+                       AVG({nombre}), MIN({nombre}), MAX({nombre})
+                FROM lecturas_sensores
+                WHERE timestamp >= datetime('now', 'localtime', ?)
+                GROUP BY cubeta ORDER BY cubeta
+            ''', (paso, f"-{horas} hours")).fetchall()
+            diario = conn.execute(f'''
+                SELECT date(timestamp) AS dia, AVG({nombre}), MIN({nombre}), MAX({nombre})
+                FROM lecturas_sensores
+                WHERE timestamp >= datetime('now', 'localtime', ?)
+                GROUP BY dia ORDER BY dia
+            ''', (f"-{horas} hours",)).fetchall()
+
+            medias = [c[1] for c in cubetas]
+            movil = []
+            for i in range(len(medias)):
+                tramo = [m for m in medias[max(0, i - ventana + 1):i + 1] if m is not None]
+                movil.append(sum(tramo) / len(tramo) if tramo else None)
+
+            valores = sorted(f[indice] for f in filas if f[indice] is not None)
+            cuantiles = statistics.quantiles(valores, n=100, method="inclusive") if len(valores) > 1 else []
+
+            resultado["series"][nombre] = {
+                "remuestreo": cubetas, "media_movil": movil,
+                "percentiles": [cuantiles[p - 1] for p in (5, 25, 50, 75, 95)] if cuantiles else [],
+                "diario": diario
+            }
+
+    pares = [(f[0], f[1]) for f in filas if f[0] is not None and f[1] is not None]
+    n = len(pares)
+    if n > 1:
+        mx = sum(p[0] for p in pares) / n
+        my = sum(p[1] for p in pares) / n
+        sxy = sum((p[0] - mx) * (p[1] - my) for p in pares)
+        sxx = sum((p[0] - mx) ** 2 for p in pares)
+        syy = sum((p[1] - my) ** 2 for p in pares)
+        resultado["correlacion"] = sxy / math.sqrt(sxx * syy) if sxx and syy else None
+    return resultado
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de analítica")
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--paso", type=int, default=300)
+    parser.add_argument("--ventana", type=int, default=12)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = cargar_lecturas(os.path.join(tmp, "bench.db"), args.filas, args.dias)
+        horas = args.dias * 24
+
+        carga = medir(lambda: cargar_ventana(db, horas), args.repeticiones)
+        ventana = cargar_ventana(db, horas)
+        calculo = medir(lambda: calcular_analitica(ventana, args.paso, args.ventana), args.repeticiones)
+        baseline = medir(lambda: analitica_baseline(db, horas, args.paso, args.ventana), args.repeticiones)
+
+    resultados = {
+        "filas": args.filas,
+        "numpy_carga_s": round(carga, 4),
+        "numpy_calculo_s": round(calculo, 4),
+        "numpy_total_s": round(carga + calculo, 4),
+        "baseline_s": round(baseline, 4),
+        "aceleracion": round(baseline / (carga + calculo), 2)
+    }
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
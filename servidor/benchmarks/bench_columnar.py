@@ -0,0 +1,109 @@
+"""
+Benchmark de exportación: CSV vs Arrow IPC vs Parquet
+
+Exporta un año de lecturas sintéticas en cada formato y lo vuelve a leer
+calculando la temperatura media, como haría un notebook de análisis.
+Arrow se lee con memory-map (sin copia); CSV hay que parsearlo entero.
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_columnar --filas 1051200 --dispositivos 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from benchmarks.generador import cargar_lecturas
+from database import columnar
+from jobs import tareas
+
+
+class AvanceNulo:
+    def actualizar(self, hechos, total, forzar=False):
+        pass
+
+
+def cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+
+def leer_csv(ruta):
+    temperaturas = []
+    with open(ruta, newline="", encoding="utf-8") as archivo:
+        lector = csv.reader(archivo)
+        next(lector)
+        for fila in lector:
+            temperaturas.append(float(fila[2]))
+    return len(temperaturas), sum(temperaturas) / len(temperaturas), None
+
+
+def leer_columnar(ruta):
+    """Filas, media y memoria que pyarrow reservó para la tabla (0 si es memory-map)"""
+    asignado = pa.total_allocated_bytes()
+    tabla = columnar.cargar(ruta)
+    reservado = pa.total_allocated_bytes() - asignado
+    return tabla.num_rows, pc.mean(tabla.column("temperatura")).as_py(), reservado
+
+
+def tamano(ruta):
+    return sum(os.path.getsize(archivo) for archivo in columnar.archivos_exportados(ruta)) \
+        if os.path.isdir(ruta) else os.path.getsize(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de exportación columnar")
+    parser.add_argument("--filas", type=int, default=365 * 2880, help="Lecturas (por defecto una cada 30 s durante un año)")
+    parser.add_argument("--dias", type=int, default=365)
+    parser.add_argument("--dispositivos", type=int, default=4)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    horas = (args.dias + 1) * 24
+    resultados = {"filas": args.filas, "dias": args.dias, "dispositivos": args.dispositivos}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        db = cargar_lecturas(db_path, args.filas, args.dias, args.dispositivos)
+        desde = time.time() - horas * 3600
+
+        casos = {
+            "csv": (lambda ruta: tareas.exportar_csv(db_path, ruta, AvanceNulo(), horas), leer_csv),
+            "arrow": (lambda ruta: columnar.exportar(db, ruta, "arrow", desde=desde), leer_columnar),
+            "parquet": (lambda ruta: columnar.exportar(db, ruta, "parquet", desde=desde), leer_columnar),
+            "arrow_por_dia": (lambda ruta: columnar.exportar(db, ruta, "arrow", "dia", desde), leer_columnar),
+            "parquet_por_dispositivo": (lambda ruta: columnar.exportar(db, ruta, "parquet", "dispositivo", desde),
+                                        leer_columnar),
+        }
+        referencia = None
+        for nombre, (exportar, leer) in casos.items():
+            # Las exportaciones sin partición son un archivo: la extensión indica el formato
+            ruta = os.path.join(tmp, nombre if "_por_" in nombre else f"historial.{nombre}")
+            _, t_exportar = cronometrar(lambda: exportar(ruta))
+            (filas, media, reservado), t_leer = cronometrar(lambda: leer(ruta))
+            if referencia is None:
+                referencia = (filas, media)
+            elif filas != referencia[0] or abs(media - referencia[1]) > 1e-6:
+                raise SystemExit(f"{nombre}: {filas} filas / media {media} no coincide con CSV")
+            resultados[nombre] = {
+                "exportar_s": round(t_exportar, 3),
+                "leer_s": round(t_leer, 3),
+                "mb": round(tamano(ruta) / 1e6, 1),
+                "memoria_tabla_mb": None if reservado is None else round(reservado / 1e6, 1)
+            }
+
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark de DatabaseManager con volúmenes realistas
+
+Para cada tamaño crea una BD temporal con varios meses de lecturas y
+estados de actuadores, mide cada método, guarda el EXPLAIN QUERY PLAN de
+las sentencias que ejecuta y compara contra los umbrales de regresión.
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_db --tamanos 100000 1000000
+    python -m benchmarks.bench_db --tamanos 10000000 --dias 180
+    python -m benchmarks.bench_db --actualizar-umbrales   # fijar nuevos umbrales
+
+Termina con código 1 si algún método supera su umbral.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from benchmarks.generador import cargar_historial
+from database.db_manager import DatabaseManager
+
+UMBRALES_PATH = os.path.join(os.path.dirname(__file__), "umbrales_db.json")
+FACTOR_UMBRAL = 3.0  # margen sobre la medición al actualizar umbrales
+UMBRAL_MINIMO_MS = 5.0  # por debajo de esto el ruido domina
+
+
+class DatabaseTrazada(DatabaseManager):
+    """DatabaseManager que registra las sentencias SQL ejecutadas"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.sentencias = []
+
+    @contextmanager
+    def get_connection(self):
+        with super().get_connection() as conn:
+            conn.set_trace_callback(self.sentencias.append)
+            yield conn
+
+    def planes(self):
+        """EXPLAIN QUERY PLAN de las sentencias registradas"""
+        planes = {}
+        with super().get_connection() as conn:
+            for sql in self.sentencias:
+                limpia = " ".join(sql.split())
+                if not limpia.upper().startswith(("SELECT", "INSERT", "DELETE", "UPDATE")):
+                    continue
+                # Agrupar por forma de la sentencia (los parámetros vienen expandidos)
+                forma = re.sub(r"'[^']*'|\b\d+(\.\d+)?\b", "?", limpia)
+                if forma in planes:
+                    continue
+                try:
+                    filas = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                    planes[forma] = [fila[3] for fila in filas]
+                except Exception as e:
+                    planes[forma] = [f"error: {e}"]
+        self.sentencias.clear()
+        return planes
+
+
+def casos(dias):
+    """Métodos a medir: (nombre, función, repetible)"""
+    return [
+        ("insertar_lectura_sensores", lambda db: db.insertar_lectura_sensores(
+            25.0, 60.0, 0, None, 45, "nodo0"), True),
+        ("obtener_ultimas_lecturas", lambda db: db.obtener_ultimas_lecturas(100), True),
+        ("obtener_lecturas_por_tiempo", lambda db: db.obtener_lecturas_por_tiempo(24), True),
+        ("iterar_lecturas_por_tiempo", lambda db: sum(
+            len(lote) for lote in db.iterar_lecturas_por_tiempo(24)), True),
+        ("obtener_estadisticas", lambda db: db.obtener_estadisticas(), True),
+        ("insertar_estado_actuadores", lambda db: db.insertar_estado_actuadores(
+            90, 0, False, "{}"), True),
+        ("obtener_ultimo_estado_actuadores", lambda db: db.obtener_ultimo_estado_actuadores(), True),
+        ("insertar_alerta", lambda db: db.insertar_alerta("bench", "prueba", "info"), True),
+        ("obtener_alertas_recientes", lambda db: db.obtener_alertas_recientes(50), True),
+        # Retención diaria: borra el día más antiguo (destructivo, una sola vez)
+        ("limpiar_datos_antiguos", lambda db: db.limpiar_datos_antiguos(dias - 1), False),
+    ]
+
+
+def medir(db, funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(db)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "min_ms": round(min(tiempos), 3),
+        "max_ms": round(max(tiempos), 3)
+    }
+
+
+def ejecutar_tamano(tamano, args):
+    actuadores = max(1, int(tamano * args.proporcion_actuadores))
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseTrazada(os.path.join(tmp, "bench.db"))
+        cargar_historial(db.db_path, tamano, actuadores, args.dias, args.dispositivos)
+        db.sentencias.clear()
+        tamano_mb = os.path.getsize(db.db_path) / 1e6
+
+        metodos = {}
+        for nombre, funcion, repetible in casos(args.dias):
+            resultado = medir(db, funcion, args.repeticiones if repetible else 1)
+            resultado["plan"] = db.planes()
+            metodos[nombre] = resultado
+            print(f"  {nombre:<34} {resultado['mediana_ms']:>10.3f} ms")
+
+    return {
+        "lecturas": tamano,
+        "actuadores": actuadores,
+        "bd_mb": round(tamano_mb, 1),
+        "metodos": metodos
+    }
+
+
+def comparar_umbrales(resultados, umbrales):
+    """Lista de regresiones (tamaño, método, medido, umbral)"""
+    regresiones = []
+    for resultado in resultados:
+        limites = umbrales.get(str(resultado["lecturas"]), {})
+        for nombre, datos in resultado["metodos"].items():
+            limite = limites.get(nombre)
+            if limite is not None and datos["mediana_ms"] > limite:
+                regresiones.append((resultado["lecturas"], nombre, datos["mediana_ms"], limite))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de DatabaseManager")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dias", type=int, default=90, help="Meses de historial en días")
+    parser.add_argument("--dispositivos", type=int, default=4)
+    parser.add_argument("--proporcion-actuadores", type=float, default=0.1,
+                        help="Estados de actuadores por lectura")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--umbrales", default=UMBRALES_PATH)
+    parser.add_argument("--actualizar-umbrales", action="store_true")
+    parser.add_argument("--salida", default="bench_db.json", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    resultados = []
+    for tamano in args.tamanos:
+        print(f"\n📊 {tamano} lecturas")
+        resultados.append(ejecutar_tamano(tamano, args))
+
+    with open(args.salida, "w") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"\n✓ Resultados guardados en {args.salida}")
+
+    umbrales = {}
+    if os.path.exists(args.umbrales):
+        with open(args.umbrales) as f:
+            umbrales = json.load(f)
+
+    if args.actualizar_umbrales:
+        for resultado in resultados:
+            umbrales[str(resultado["lecturas"])] = {
+                nombre: round(max(datos["mediana_ms"] * FACTOR_UMBRAL, UMBRAL_MINIMO_MS), 1)
+                for nombre, datos in resultado["metodos"].items()
+            }
+        with open(args.umbrales, "w") as f:
+            json.dump(umbrales, f, indent=2, sort_keys=True)
+        print(f"✓ Umbrales actualizados en {args.umbrales}")
+        return
+
+    regresiones = comparar_umbrales(resultados, umbrales)
+    for tamano, nombre, medido, limite in regresiones:
+        print(f"✗ REGRESIÓN {tamano} lecturas - {nombre}: {medido} ms > {limite} ms")
+    if regresiones:
+        sys.exit(1)
+    print("✓ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Prueba de carga de la ingesta: flota simulada de ESP32 → MQTTClient →
+DatabaseManager + WebSocketManager → dashboards simulados
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_ingesta --nodos 50 --intervalo 0.5 --clientes 20
+    python -m benchmarks.bench_ingesta --broker        # a través de mosquitto local
+    python -m benchmarks.bench_ingesta --frame         # topic casa/sensores/<nodo>/frame
+
+Sin --broker los mensajes se entregan a MQTTClient.on_message desde un
+thread, igual que lo haría el thread de red de paho.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+import numpy as np
+
+from analytics.anomaly import AnomalyDetector, AlertDispatcher
+from api.websocket import websocket_manager
+from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT
+from database.db_manager import DatabaseManager
+from mqtt.client import MQTTClient
+
+
+class FakeWebSocket:
+    """Dashboard simulado: registra cuándo recibe cada lectura"""
+
+    def __init__(self, recepciones):
+        self.recepciones = recepciones
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self._recibir(message)
+
+    async def send_text(self, message):
+        self._recibir(json.loads(message))
+
+    def _recibir(self, message):
+        if message.get("type") == "sensor_data":
+            self.recepciones.append((message["device"], time.perf_counter()))
+
+
+class DatabaseCronometrada(DatabaseManager):
+    """DatabaseManager que mide la latencia de cada inserción"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.latencias = []
+
+    def insertar_lectura_sensores(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = super().insertar_lectura_sensores(*args, **kwargs)
+        self.latencias.append(time.perf_counter() - inicio)
+        return resultado
+
+
+class Flota:
+    """N nodos ESP32 que publican sus lecturas a una cadencia fija"""
+
+    def __init__(self, nodos, intervalo, frame, entregar):
+        self.nodos = [f"nodo{i}" for i in range(nodos)]
+        self.intervalo = intervalo
+        self.frame = frame
+        self.entregar = entregar
+        # Momento en que se completa cada lectura, por dispositivo
+        self.enviados = defaultdict(deque)
+        self.total = 0
+        self.detener = threading.Event()
+
+    def mensajes(self, nodo):
+        temperatura = round(24 + random.gauss(0, 0.5), 1)
+        humedad = round(60 + random.gauss(0, 2), 1)
+        suelo = random.randint(30, 70)
+        if self.frame:
+            return [(f"casa/sensores/{nodo}/frame", json.dumps({
+                "temperatura": temperatura, "humedad": humedad,
+                "humedad_suelo": suelo, "timestamp": int(time.time() * 1000)
+            }).encode())]
+        return [
+            (f"casa/sensores/{nodo}/temperatura", str(temperatura).encode()),
+            (f"casa/sensores/{nodo}/humedad", str(humedad).encode()),
+            (f"casa/sensores/{nodo}/humedad_suelo", str(suelo).encode()),
+        ]
+
+    def run(self):
+        siguiente = time.perf_counter()
+        while not self.detener.is_set():
+            for nodo in self.nodos:
+                mensajes = self.mensajes(nodo)
+                # La latencia se mide desde el mensaje que completa la lectura
+                for topic, payload in mensajes[:-1]:
+                    self.entregar(topic, payload)
+                self.enviados[nodo].append(time.perf_counter())
+                self.entregar(*mensajes[-1])
+                self.total += 1
+            siguiente += self.intervalo
+            espera = siguiente - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+
+
+def percentil_ms(valores, p):
+    return round(float(np.percentile(valores, p)) * 1000, 3) if len(valores) else None
+
+
+async def ejecutar(args):
+    loop = asyncio.get_running_loop()
+    tmp = tempfile.TemporaryDirectory()
+    db = DatabaseCronometrada(os.path.join(tmp.name, "carga.db"))
+    db.crear_tablas()
+
+    cliente = MQTTClient(client_id=f"bench_ingesta_{os.getpid()}")
+    cliente.db_manager = db
+    cliente.event_loop = loop
+    cliente.websocket_broadcast = websocket_manager.broadcast
+    cliente.anomaly_detector = AnomalyDetector()
+    cliente.alert_dispatcher = AlertDispatcher(db, websocket_manager.broadcast)
+
+    # Dashboards simulados (solo el primero registra latencias)
+    recepciones = []
+    for i in range(args.clientes):
+        await websocket_manager.connect(FakeWebSocket(recepciones if i == 0 else []))
+
+    if args.broker:
+        import paho.mqtt.client as mqtt
+        cliente.connect()
+        cliente.loop_start()
+        publicador = mqtt.Client(client_id=f"bench_flota_{os.getpid()}")
+        publicador.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+        publicador.loop_start()
+        await asyncio.sleep(1)
+        entregar = lambda topic, payload: publicador.publish(topic, payload)
+    else:
+        entregar = lambda topic, payload: cliente.on_message(
+            None, None, SimpleNamespace(topic=topic, payload=payload)
+        )
+
+    flota = Flota(args.nodos, args.intervalo, args.frame, entregar)
+    hilo = threading.Thread(target=flota.run, daemon=True)
+
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        inicio = time.perf_counter()
+        hilo.start()
+        await asyncio.sleep(args.duracion)
+        flota.detener.set()
+        await asyncio.to_thread(hilo.join)
+        # Esperar a que se vacíen los broadcasts pendientes
+        esperado = flota.total
+        limite = time.perf_counter() + 10
+        while len(recepciones) < esperado and time.perf_counter() < limite:
+            await asyncio.sleep(0.05)
+        duracion = time.perf_counter() - inicio
+
+    if args.broker:
+        publicador.loop_stop()
+        cliente.loop_stop()
+        cliente.disconnect()
+
+    # Emparejar cada recepción con su envío (orden FIFO por dispositivo)
+    latencias = []
+    for dispositivo, recibido in recepciones:
+        if flota.enviados[dispositivo]:
+            latencias.append(recibido - flota.enviados[dispositivo].popleft())
+
+    guardadas = len(db.latencias)
+    resultados = {
+        "configuracion": vars(args),
+        "lecturas_enviadas": flota.total,
+        "lecturas_guardadas": guardadas,
+        "lecturas_por_segundo": round(guardadas / duracion, 1),
+        "broadcasts_recibidos": len(recepciones),
+        "mqtt_a_websocket_ms": {
+            "p50": percentil_ms(latencias, 50),
+            "p99": percentil_ms(latencias, 99),
+            "max": percentil_ms(latencias, 100)
+        },
+        "commit_bd_ms": {
+            "p50": percentil_ms(db.latencias, 50),
+            "p99": percentil_ms(db.latencias, 99),
+            "max": percentil_ms(db.latencias, 100)
+        }
+    }
+    for conexion in list(websocket_manager.active_connections):
+        websocket_manager.disconnect(conexion)
+    tmp.cleanup()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de ingesta")
+    parser.add_argument("--nodos", type=int, default=50, help="ESP32 simulados")
+    parser.add_argument("--intervalo", type=float, default=0.5, help="Segundos entre lecturas de cada nodo")
+    parser.add_argument("--clientes", type=int, default=20, help="Dashboards WebSocket simulados")
+    parser.add_argument("--duracion", type=float, default=10, help="Segundos de prueba")
+    parser.add_argument("--frame", action="store_true", help="Publicar un frame por lectura")
+    parser.add_argument("--broker", action="store_true", help="Usar el broker MQTT de config.py")
+    parser.add_argument("--salida", default="bench_ingesta.json", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(ejecutar(args))
+    print(json.dumps(resultados, indent=2))
+    with open(args.salida, "w") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"✓ Resultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
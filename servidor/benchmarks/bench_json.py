@@ -0,0 +1,151 @@
+"""
+Micro-benchmarks de serialización JSON
+
+- historial: filas → dicts → jsonable_encoder → json.dumps (ruta de
+  FastAPI por defecto) vs filas_json + RespuestaJSON
+- broadcast: send_json por cliente vs serializar una vez por broadcast
+- validación: json.loads + model_validate vs model_validate_json
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_json --filas 5000 --clientes 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from api.routes import COLUMNAS_HISTORIAL
+from api.websocket import WebSocketManager
+from benchmarks.generador import cargar_lecturas
+from models.schemas import DataPacket
+from models.serialization import MOTOR, RespuestaJSON, filas_json
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+# ==================== HISTORIAL ====================
+
+def historial_baseline(filas):
+    """Como /api/historial antes: dicts, jsonable_encoder y JSONResponse"""
+    historial = [{
+        "id": f[0], "temperatura": f[1], "humedad": f[2], "movimiento": f[3],
+        "distancia": f[4], "humedad_suelo": f[5], "timestamp": str(f[6])
+    } for f in filas]
+    return json.dumps(jsonable_encoder(historial), ensure_ascii=False,
+                      allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def historial_rapido(filas):
+    return RespuestaJSON(filas_json(filas, COLUMNAS_HISTORIAL)).body
+
+
+# ==================== BROADCAST ====================
+
+class ClienteFalso:
+    """WebSocket que descarta lo enviado; send_json como el de Starlette"""
+
+    async def send_text(self, texto):
+        pass
+
+    async def send_json(self, datos):
+        await self.send_text(json.dumps(datos, separators=(",", ":"), ensure_ascii=False))
+
+
+def mensaje_sensores(i):
+    return {"type": "sensor_data", "data": {
+        "dispositivo": "principal", "temperatura": 24.5 + i % 10 / 10, "humedad": 61.2,
+        "humedad_suelo": 43, "movimiento": 0, "distancia": 120.5,
+        "timestamp": "2024-01-01T12:00:00.000000"
+    }}
+
+
+async def broadcast_baseline(clientes, mensajes):
+    for i in range(mensajes):
+        mensaje = mensaje_sensores(i)
+        for cliente in clientes:
+            await cliente.send_json(mensaje)
+
+
+async def broadcast_rapido(manager, mensajes):
+    for i in range(mensajes):
+        await manager.broadcast_local(mensaje_sensores(i))
+
+
+# ==================== VALIDACIÓN ====================
+
+CUERPO_DATOS = json.dumps({
+    "sensores": {"temperatura": 24.5, "humedad": 61.2, "humedad_suelo": 43,
+                 "movimiento": 1, "distancia": 120.5},
+    "actuadores": {"servo_angulo": 90, "ventilador_velocidad": 50, "bomba_activa": False,
+                   "leds": {"cuarto1": True, "cuarto2": False, "cuarto3": False}}
+}).encode()
+
+
+def validar_baseline(veces):
+    for _ in range(veces):
+        DataPacket.model_validate(json.loads(CUERPO_DATOS))
+
+
+def validar_rapido(veces):
+    for _ in range(veces):
+        DataPacket.model_validate_json(CUERPO_DATOS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización JSON")
+    parser.add_argument("--filas", type=int, default=5000, help="Filas del historial")
+    parser.add_argument("--clientes", type=int, default=50, help="Clientes WebSocket")
+    parser.add_argument("--mensajes", type=int, default=200, help="Broadcasts por medición")
+    parser.add_argument("--validaciones", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = cargar_lecturas(os.path.join(tmp, "bench.db"), args.filas, 1)
+        filas = db.obtener_ultimas_lecturas(args.filas)
+
+    if json.loads(historial_baseline(filas)) != json.loads(historial_rapido(filas)):
+        raise SystemExit("historial: las dos versiones no producen el mismo JSON")
+
+    clientes = [ClienteFalso() for _ in range(args.clientes)]
+    manager = WebSocketManager()
+    manager.active_connections = list(clientes)
+
+    resultados = {"motor": MOTOR, "filas": len(filas), "clientes": args.clientes}
+    pruebas = {
+        "historial": (lambda: historial_baseline(filas), lambda: historial_rapido(filas)),
+        "broadcast": (lambda: asyncio.run(broadcast_baseline(clientes, args.mensajes)),
+                      lambda: asyncio.run(broadcast_rapido(manager, args.mensajes))),
+        "validacion": (lambda: validar_baseline(args.validaciones),
+                       lambda: validar_rapido(args.validaciones)),
+    }
+    for nombre, (baseline, rapido) in pruebas.items():
+        t_baseline = medir(baseline, args.repeticiones)
+        t_rapido = medir(rapido, args.repeticiones)
+        resultados[nombre] = {
+            "baseline_ms": round(t_baseline * 1000, 3),
+            "rapido_ms": round(t_rapido * 1000, 3),
+            "aceleracion": round(t_baseline / t_rapido, 2)
+        }
+
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
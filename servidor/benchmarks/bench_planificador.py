@@ -0,0 +1,108 @@
+"""
+Benchmark de la rueda de temporizadores del planificador frente a heapq
+
+Programa N temporizadores repartidos en una semana y simula un día de
+ticks de un segundo, reprogramando cada temporizador al vencer (como una
+programación recurrente). Mide el coste de agregar, de cancelar y el de
+cada tick.
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_planificador --temporizadores 1000 10000 100000
+"""
+
+import argparse
+import heapq
+import json
+import random
+import time
+
+from scheduler.wheel import RuedaTemporizadores
+
+SEMANA = 7 * 86400
+DIA = 86400
+
+
+class MonticuloTemporizadores:
+    """Alternativa con heapq; cancelar marca la entrada y se descarta al salir"""
+
+    def __init__(self):
+        self.monticulo = []
+        self.vigentes = {}
+
+    def agregar(self, clave, vence):
+        entrada = [vence, clave, True]
+        anterior = self.vigentes.get(clave)
+        if anterior is not None:
+            anterior[2] = False
+        self.vigentes[clave] = entrada
+        heapq.heappush(self.monticulo, entrada)
+
+    def cancelar(self, clave):
+        entrada = self.vigentes.pop(clave, None)
+        if entrada is not None:
+            entrada[2] = False
+
+    def avanzar(self, ahora):
+        vencidos = []
+        while self.monticulo and self.monticulo[0][0] <= ahora:
+            vence, clave, vigente = heapq.heappop(self.monticulo)
+            if vigente:
+                del self.vigentes[clave]
+                vencidos.append((clave, vence))
+        return vencidos
+
+
+def medir(estructura, n, inicio, semilla=1):
+    rng = random.Random(semilla)
+    vencimientos = [inicio + rng.uniform(1, SEMANA) for _ in range(n)]
+
+    t = time.perf_counter()
+    for clave, vence in enumerate(vencimientos):
+        estructura.agregar(clave, vence)
+    agregar_us = (time.perf_counter() - t) / n * 1e6
+
+    # Un día de ticks; lo que vence se reprograma una semana después
+    disparos = 0
+    t = time.perf_counter()
+    for segundo in range(1, DIA + 1):
+        for clave, vence in estructura.avanzar(inicio + segundo):
+            estructura.agregar(clave, vence + SEMANA)
+            disparos += 1
+    tick_us = (time.perf_counter() - t) / DIA * 1e6
+
+    t = time.perf_counter()
+    for clave in range(0, n, 10):
+        estructura.cancelar(clave)
+    cancelar_us = (time.perf_counter() - t) / len(range(0, n, 10)) * 1e6
+
+    return {
+        "agregar_us": round(agregar_us, 3),
+        "tick_us": round(tick_us, 3),
+        "cancelar_us": round(cancelar_us, 3),
+        "disparos": disparos
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la rueda de temporizadores")
+    parser.add_argument("--temporizadores", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    inicio = float(int(time.time()))
+    resultados = {}
+    for n in args.temporizadores:
+        resultados[n] = {
+            "rueda": medir(RuedaTemporizadores(inicio), n, inicio),
+            "heapq": medir(MonticuloTemporizadores(), n, inicio)
+        }
+        print(f"✓ {n} temporizadores")
+
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark del fan-out de WebSocket con suscripciones filtradas
+
+Conecta N clientes falsos repartidos entre D dispositivos (cada uno
+suscrito solo al suyo) y emite lecturas de todos los dispositivos.
+Compara envíos y tiempo por evento frente a los mismos clientes sin
+filtros.
+
+Uso (desde servidor/):
+    python -m benchmarks.bench_websocket --clientes 100 1000 5000 --dispositivos 100
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from api.websocket import WebSocketManager
+
+
+class FakeWebSocket:
+    """Cliente que solo cuenta lo que recibe"""
+
+    def __init__(self):
+        self.recibidos = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.recibidos += 1
+
+
+def evento(dispositivo):
+    return {
+        "type": "sensor_data",
+        "device": dispositivo,
+        "data": {
+            "sensores": {"temperatura": 22.5, "humedad": 55.0, "humedad_suelo": 40},
+            "timestamp": "2025-01-01T00:00:00"
+        }
+    }
+
+
+async def medir(n_clientes, n_dispositivos, eventos, filtrar):
+    manager = WebSocketManager()
+    clientes = [FakeWebSocket() for _ in range(n_clientes)]
+    for i, cliente in enumerate(clientes):
+        await manager.connect(cliente)
+        if filtrar:
+            await manager.subscribe(cliente, {"device": f"nodo{i % n_dispositivos}"})
+        cliente.recibidos = 0
+
+    mensajes = [evento(f"nodo{i % n_dispositivos}") for i in range(eventos)]
+    inicio = time.perf_counter()
+    for mensaje in mensajes:
+        await manager.broadcast_local(mensaje)
+    duracion = time.perf_counter() - inicio
+
+    envios = sum(cliente.recibidos for cliente in clientes)
+    return {
+        "us_por_evento": round(duracion / eventos * 1e6, 2),
+        "envios_por_evento": round(envios / eventos, 2)
+    }
+
+
+async def ejecutar(args):
+    resultados = {}
+    for n in args.clientes:
+        resultados[n] = {
+            "sin_filtro": await medir(n, args.dispositivos, args.eventos, False),
+            "por_dispositivo": await medir(n, args.dispositivos, args.eventos, True)
+        }
+        print(f"✓ {n} clientes")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de fan-out WebSocket")
+    parser.add_argument("--clientes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--dispositivos", type=int, default=100)
+    parser.add_argument("--eventos", type=int, default=2000)
+    parser.add_argument("--salida", help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(ejecutar(args))
+    print(json.dumps(resultados, indent=2))
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
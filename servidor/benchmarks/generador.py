@@ -0,0 +1,129 @@
+"""
+Generador de datos sintéticos para benchmarks
+
+Historiales de varios meses con ciclo diario, ruido, riegos periódicos
+y cambios de actuadores. Se genera por lotes para poder cargar decenas
+de millones de filas sin tenerlas todas en memoria.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database.db_manager import DatabaseManager
+
+TAMANO_LOTE = 200_000
+
+
+def _marcas(inicio, segundos):
+    """Epoch relativo → texto 'YYYY-MM-DD HH:MM:SS' como CURRENT_TIMESTAMP"""
+    base = np.datetime64(inicio, "s")
+    marcas = (base + segundos.astype("timedelta64[s]")).astype(str)
+    return np.char.replace(marcas, "T", " ").tolist()
+
+
+def generar_lotes_lecturas(n, dias=30, dispositivos=1, semilla=42, lote=TAMANO_LOTE):
+    """Lotes de lecturas realistas ordenadas por tiempo, terminando ahora
+
+    Cada lote es una lista de tuplas lista para executemany.
+    """
+    rng = np.random.default_rng(semilla)
+    inicio = datetime.now().replace(microsecond=0) - timedelta(days=dias)
+    total_segundos = dias * 86400
+    lotes = max(1, -(-n // lote))
+
+    for i in range(lotes):
+        cantidad = min(lote, n - i * lote)
+        # Cada lote cubre su tramo de tiempo, así el conjunto queda ordenado
+        desde = total_segundos * i / lotes
+        hasta = total_segundos * (i + 1) / lotes
+        segundos = np.sort(rng.uniform(desde, hasta, cantidad)).astype(np.int64)
+
+        hora = (segundos % 86400) / 86400.0
+        ciclo = np.sin(2 * np.pi * (hora - 0.375))
+        temperatura = np.round(24 + 4 * ciclo + rng.normal(0, 0.4, cantidad), 1)
+        humedad = np.round(60 - 10 * ciclo + rng.normal(0, 1.5, cantidad), 1)
+        # El suelo se seca poco a poco y se riega cada ~3 días
+        humedad_suelo = np.clip(
+            np.round(75 - (segundos % (3 * 86400)) / (3 * 86400) * 50
+                     + rng.normal(0, 1, cantidad)),
+            0, 100
+        ).astype(np.int64)
+        movimiento = (rng.random(cantidad) < 0.05).astype(np.int64)
+        distancia = np.round(rng.uniform(10, 300, cantidad), 1)
+        dispositivo = rng.integers(0, dispositivos, cantidad)
+
+        yield list(zip(
+            temperatura.tolist(), humedad.tolist(), movimiento.tolist(),
+            distancia.tolist(), humedad_suelo.tolist(), _marcas(inicio, segundos),
+            [f"nodo{d}" for d in dispositivo.tolist()]
+        ))
+
+
+def generar_lecturas(n, dias=30, dispositivos=1, semilla=42):
+    """Todas las lecturas en una sola lista (para tamaños pequeños)"""
+    filas = []
+    for lote in generar_lotes_lecturas(n, dias, dispositivos, semilla):
+        filas.extend(lote)
+    return filas
+
+
+def generar_lotes_actuadores(n, dias=30, semilla=7, lote=TAMANO_LOTE):
+    """Lotes de estados de actuadores (servo, ventilador, bomba, LEDs)"""
+    rng = np.random.default_rng(semilla)
+    inicio = datetime.now().replace(microsecond=0) - timedelta(days=dias)
+    total_segundos = dias * 86400
+    lotes = max(1, -(-n // lote))
+    combinaciones = [
+        json.dumps({"cuarto1": a, "cuarto2": b, "cuarto3": c})
+        for a in (False, True) for b in (False, True) for c in (False, True)
+    ]
+
+    for i in range(lotes):
+        cantidad = min(lote, n - i * lote)
+        desde = total_segundos * i / lotes
+        hasta = total_segundos * (i + 1) / lotes
+        segundos = np.sort(rng.uniform(desde, hasta, cantidad)).astype(np.int64)
+
+        servo = rng.choice([0, 45, 90, 135, 180], cantidad)
+        ventilador = rng.choice([0, 100], cantidad, p=[0.7, 0.3])
+        bomba = (rng.random(cantidad) < 0.1).astype(np.int64)
+        leds = rng.integers(0, len(combinaciones), cantidad)
+
+        yield list(zip(
+            servo.tolist(), ventilador.tolist(), bomba.tolist(),
+            [combinaciones[j] for j in leds.tolist()], _marcas(inicio, segundos)
+        ))
+
+
+def cargar_historial(db_path, lecturas, actuadores=0, dias=30, dispositivos=1):
+    """Crear una BD en db_path y cargar lecturas y estados sintéticos"""
+    db = DatabaseManager(db_path)
+    db.crear_tablas()
+    inicio = time.perf_counter()
+    with db.get_connection() as conn:
+        conn.execute('PRAGMA synchronous=OFF')
+        for lote in generar_lotes_lecturas(lecturas, dias, dispositivos):
+            conn.executemany('''
+                INSERT INTO lecturas_sensores
+                (temperatura, humedad, movimiento, distancia, humedad_suelo,
+                 timestamp, dispositivo)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', lote)
+        if actuadores:
+            for lote in generar_lotes_actuadores(actuadores, dias):
+                conn.executemany('''
+                    INSERT INTO estado_actuadores
+                    (servo_angulo, ventilador_velocidad, bomba_activa, leds, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', lote)
+    print(f"✓ {lecturas} lecturas y {actuadores} estados cargados "
+          f"en {time.perf_counter() - inicio:.1f} s")
+    return db
+
+
+def cargar_lecturas(db_path, n, dias=30, dispositivos=1):
+    """Crear una BD en db_path y cargar n lecturas sintéticas"""
+    return cargar_historial(db_path, n, 0, dias, dispositivos)
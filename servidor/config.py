@@ -3,6 +3,19 @@
 MQTT_BROKER_HOST = "localhost"
 MQTT_BROKER_PORT = 1883
 MQTT_CLIENT_ID = "smarthome_server"
+MQTT_QOS_ESTADO = 1  # QoS de comandos de actuadores, modo y configuración
+MQTT_RETAIN_ESTADO = True  # retenidos: un ESP32 que se reconecta recibe el último estado al suscribirse
+MQTT_INFLIGHT = 10  # mensajes QoS > 0 publicados sin PUBACK/PUBCOMP; el resto espera en la cola de salida
+MQTT_RECONNECT_MIN = 1  # segundos hasta el primer reintento de conexión; se duplica en cada intento
+MQTT_RECONNECT_MAX = 60  # espera máxima entre reintentos de conexión
+MQTT_OUTBOX_INTERVAL = 1.0  # segundos entre limpiezas de la cola de salida persistente
+DEFAULT_DEVICE_ID = "esp32_receptor"  # Dispositivo de los topics casa/sensores/<sensor>
+
+# Workers de ingesta (python -m mqtt.ingest_worker); 0 = ingesta en el servidor API
+MQTT_INGEST_WORKERS = 0
+MQTT_INGEST_MODE = "hash"  # "hash" (partición por dispositivo, cada worker recibe todo) o "shared" ($share MQTT 5, reparte el broker)
+MQTT_SHARED_GROUP = "smarthome_ingesta"
+FRAME_ASSEMBLY_WINDOW = 2.0  # segundos para unir los tres topics de una lectura
 
 # Base de datos
 DATABASE_PATH = "database/casa_domotica.db"
@@ -10,9 +23,91 @@ DATABASE_PATH = "database/casa_domotica.db"
 # Servidor
 HOST = "0.0.0.0"
 PORT = 8000
+ASSETS_PIPELINE_ENABLED = True  # estáticos con huella y precomprimidos, páginas prerenderizadas (False = leer del disco en cada petición)
+ASSETS_MIN_COMPRESS = 256  # bytes; los archivos más pequeños se sirven sin comprimir
 
 # Umbrales por defecto
 DEFAULT_TEMP_ACTIVACION = 30.0
 DEFAULT_TEMP_DESACTIVACION = 28.0
 DEFAULT_HUMEDAD_SUELO_SECO = 30
 DEFAULT_HUMEDAD_SUELO_HUMEDO = 70
+
+# Estado compartido entre workers ("memory" = un solo proceso, "sqlite" = varios workers)
+STATE_BACKEND = "memory"
+STATE_DB_PATH = "database/estado_compartido.db"
+STATE_POLL_INTERVAL = 0.05  # segundos entre lecturas del bus de eventos
+STATE_EVENT_RETENTION = 60  # segundos que se conservan los eventos publicados
+LEADER_LEASE_TTL = 10  # segundos de validez del liderazgo del ingestor MQTT
+
+# Detección de anomalías por (dispositivo, sensor)
+ANOMALY_EWMA_ALPHA = 0.05  # peso de la lectura nueva en media/varianza
+ANOMALY_Z_THRESHOLD = 4.0  # desviaciones respecto a la media EWMA
+ANOMALY_MIN_STD = 0.5  # desviación mínima para no alertar con señales planas
+ANOMALY_WARMUP_READINGS = 30  # lecturas antes de evaluar el z-score
+ANOMALY_MAX_RATE = {  # cambio máximo en unidades por segundo
+    "temperatura": 0.5,
+    "humedad": 2.0,
+    "humedad_suelo": 5.0
+}
+ANOMALY_STUCK_READINGS = 120  # lecturas idénticas seguidas = sensor atascado
+ANOMALY_ALERT_COOLDOWN = 300  # segundos entre alertas iguales
+ANOMALY_FLUSH_INTERVAL = 1.0  # segundos entre inserciones en lote
+
+# Analítica
+ANALYTICS_MAX_HOURS = 24 * 90  # ventana máxima de /api/analitica
+
+# Historial reciente en memoria (analytics.ring_buffer)
+HISTORY_BUFFER_ENABLED = True  # solo con un proceso (STATE_BACKEND = "memory" y sin workers de ingesta)
+HISTORY_BUFFER_WINDOW = 24 * 3600  # segundos de historial que se precargan al arrancar
+HISTORY_BUFFER_CAPACITY = 43200  # muestras por (dispositivo, sensor), 16 bytes cada una
+
+# Trabajos en segundo plano (jobs.manager)
+JOBS_MAX_WORKERS = 2  # procesos del pool: exportaciones, analítica y limpieza
+JOBS_DIR = "database/trabajos"  # resultados descargables
+JOBS_HISTORY = 50  # trabajos terminados que se conservan (con su resultado)
+JOBS_NICE = 10  # los procesos del pool tienen menos prioridad que el servidor
+
+# Planificador de acciones (scheduler)
+SCHEDULER_ENABLED = True
+SCHEDULER_TICK = 1.0  # segundos por tick de la rueda de temporizadores
+SCHEDULER_CATCHUP_WINDOW = 3600  # al arrancar se ejecuta la última acción perdida si no tiene más de X segundos
+
+# WebSocket
+WEBSOCKET_MAX_FILTERS = 64  # filtros de suscripción por conexión
+WEBSOCKET_EVENT_LOG_SIZE = 1000  # eventos que se guardan para reanudar tras una reconexión
+WEBSOCKET_SNAPSHOT_POINTS = 20  # lecturas del historial que lleva un snapshot
+
+# Presencia de dispositivos (monitoring.liveness)
+DEVICE_TIMEOUT = 60  # segundos sin mensajes para marcar un dispositivo como offline
+DEVICE_TIMEOUTS = {}  # timeout por dispositivo, ej. {"nodo_jardin": 600}
+DEVICE_CHECK_INTERVAL = 1.0  # segundos entre revisiones de vencimientos
+DEVICE_SNAPSHOT_INTERVAL = 10  # segundos entre publicaciones del listado en el estado compartido
+
+# Watchdog del event loop
+LOOP_WATCHDOG_ENABLED = True
+LOOP_WATCHDOG_INTERVAL = 0.1  # segundos entre latidos del event loop
+LOOP_LAG_THRESHOLD = 0.1  # retraso a partir del cual se captura el stack
+LOOP_WATCHDOG_HISTORY = 50  # bloqueos que se conservan para /api/admin/loop
+
+# Logging (monitoring.logs)
+LOG_FORMAT = "json"  # "json" para producción, "texto" para desarrollo
+LOG_LEVELS = {  # nivel por componente (logger smarthome.<componente>)
+    "smarthome": "INFO",
+    "smarthome.mqtt": "INFO",
+    "smarthome.websocket": "INFO",
+    "smarthome.api": "INFO",
+    "smarthome.bd": "INFO",
+    "smarthome.estado": "INFO",
+    "smarthome.analitica": "INFO",
+    "smarthome.trabajos": "INFO",
+    "smarthome.planificador": "INFO",
+    "smarthome.monitoring": "INFO"
+}
+LOG_QUEUE_SIZE = 10000  # registros en cola antes de descartar
+LOG_DEBUG_SAMPLE_EVERY = 10  # en logs por mensaje se emite 1 de cada N
+LOG_DEBUG_MAX_PER_SECOND = 20  # y como mucho N por segundo
+
+# Perfilado (monitoring.profiling)
+PROFILING_ENABLED = False  # desglose por ruta y cabecera Server-Timing en cada petición
+SLOW_QUERY_THRESHOLD_MS = 100  # consultas más lentas se registran (0 = desactivado)
+SLOW_QUERY_HISTORY = 100  # consultas lentas que se conservan para /api/admin
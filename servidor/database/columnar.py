@@ -0,0 +1,236 @@
+"""
+Exportación columnar (Arrow IPC / Parquet) del historial
+
+Las lecturas se leen del cursor de SQLite por lotes y cada lote se
+escribe como un RecordBatch, sin cargar la tabla entera en memoria.
+Opcionalmente se parte en un archivo por dispositivo o por día
+(directorios dispositivo=<id>/ o dia=<AAAA-MM-DD>/, estilo Hive).
+
+cargar() abre los archivos Arrow con memory-map: las columnas apuntan al
+archivo mapeado, sin copiarlo. pyarrow es opcional.
+
+Uso (desde servidor/):
+    python -m database.columnar exportar historial.arrow --horas 8760
+    python -m database.columnar exportar export/ --formato parquet --particion dia
+    python -m database.columnar leer historial.arrow
+"""
+
+import glob
+import os
+import time
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+
+FORMATOS = ("arrow", "parquet")
+PARTICIONES = ("dispositivo", "dia")
+TAMANO_LOTE = 100_000
+SIN_DISPOSITIVO = "ninguno"  # partición de las filas con dispositivo NULL
+
+# Columnas de iterar_lecturas_desde: (epoch, *COLUMNAS_LECTURAS, dispositivo)
+_ORDEN = ("id", "temperatura", "humedad", "movimiento", "distancia", "humedad_suelo")
+
+
+def _requerir_pyarrow():
+    if pa is None:
+        raise RuntimeError("La exportación columnar requiere pyarrow (pip install pyarrow)")
+
+
+def esquema():
+    """Esquema de las exportaciones"""
+    _requerir_pyarrow()
+    return pa.schema([
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("id", pa.int64()),
+        ("dispositivo", pa.string()),
+        ("temperatura", pa.float64()),
+        ("humedad", pa.float64()),
+        ("movimiento", pa.int64()),
+        ("distancia", pa.float64()),
+        ("humedad_suelo", pa.float64()),
+    ])
+
+
+def _record_batch(lote, esquema):
+    """Lote de filas de SQLite → RecordBatch columnar"""
+    columnas = list(zip(*lote))
+    valores = dict(zip(_ORDEN, columnas[1:-1]))
+    ts = np.rint(np.array(columnas[0], dtype=np.float64)).astype(np.int64)
+    arrays = [pa.array(ts, esquema.field("timestamp").type)]
+    for campo in esquema.names[1:]:
+        datos = columnas[-1] if campo == "dispositivo" else valores[campo]
+        arrays.append(pa.array(datos, esquema.field(campo).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+
+def _partir(batch, particion):
+    """(clave, batch) por partición; las filas llegan ordenadas por tiempo"""
+    if particion is None:
+        yield None, batch
+    elif particion == "dispositivo":
+        columna = batch.column(batch.schema.get_field_index("dispositivo"))
+        for valor in pc.unique(columna).to_pylist():
+            mascara = pc.is_null(columna) if valor is None else pc.equal(columna, valor)
+            yield valor or SIN_DISPOSITIVO, batch.filter(mascara)
+    else:
+        dias = batch.column(0).to_numpy().astype("datetime64[D]")
+        cortes = np.concatenate(([0], np.flatnonzero(np.diff(dias.view(np.int64))) + 1, [len(dias)]))
+        for a, b in zip(cortes[:-1], cortes[1:]):
+            yield str(dias[a]), batch.slice(a, b - a)
+
+
+class _Escritor:
+    """Un archivo de salida (Arrow IPC sin comprimir o Parquet con zstd)"""
+
+    def __init__(self, ruta, formato, esquema):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        if formato == "parquet":
+            self._sink = None
+            self._writer = pq.ParquetWriter(ruta, esquema, compression="zstd")
+        else:
+            # Sin compresión para poder leerlo con memory-map sin copias
+            self._sink = pa.OSFile(ruta, "wb")
+            self._writer = pa.ipc.new_file(self._sink, esquema)
+
+    def escribir(self, batch):
+        self._writer.write_batch(batch)
+
+    def cerrar(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+
+def _ruta_particion(destino, formato, particion, clave):
+    clave = str(clave).replace(os.sep, "_")
+    return os.path.join(destino, f"{particion}={clave}", f"parte-0.{formato}")
+
+
+def exportar(db, destino, formato="arrow", particion=None, desde=0,
+             tamano_lote=TAMANO_LOTE, avance=None):
+    """Exportar las lecturas con timestamp >= desde (epoch)
+
+    Sin partición `destino` es el archivo; con partición, el directorio
+    raíz. `avance(filas)` se llama tras cada lote. Devuelve filas,
+    archivos escritos y bytes.
+    """
+    _requerir_pyarrow()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no válido: {formato}")
+    if particion is not None and particion not in PARTICIONES:
+        raise ValueError(f"Partición no válida: {particion}")
+
+    campos = esquema()
+    abiertos = {}  # clave de partición -> _Escritor
+    archivos = []
+    filas = 0
+
+    def escritor(clave):
+        actual = abiertos.get(clave)
+        if actual is None:
+            if particion == "dia":
+                # Orden por tiempo: un día empezado nuevo cierra los anteriores
+                for anterior in abiertos.values():
+                    anterior.cerrar()
+                abiertos.clear()
+            ruta = destino if particion is None else _ruta_particion(destino, formato, particion, clave)
+            actual = abiertos[clave] = _Escritor(ruta, formato, campos)
+            archivos.append(ruta)
+        return actual
+
+    try:
+        if particion is None:
+            escritor(None)  # el archivo existe aunque no haya filas
+        for lote in db.iterar_lecturas_desde(desde, tamano_lote):
+            batch = _record_batch(lote, campos)
+            for clave, parte in _partir(batch, particion):
+                escritor(clave).escribir(parte)
+            filas += batch.num_rows
+            if avance is not None:
+                avance(filas)
+    finally:
+        for abierto in abiertos.values():
+            abierto.cerrar()
+
+    return {
+        "filas": filas,
+        "archivos": archivos,
+        "bytes": sum(os.path.getsize(archivo) for archivo in archivos)
+    }
+
+
+def archivos_exportados(ruta):
+    """Archivos .arrow/.parquet de una exportación (archivo o directorio)"""
+    if os.path.isfile(ruta):
+        return [ruta]
+    return sorted(
+        archivo for archivo in glob.glob(os.path.join(ruta, "**", "*"), recursive=True)
+        if archivo.endswith((".arrow", ".parquet"))
+    )
+
+
+def cargar(ruta, columnas=None):
+    """Leer una exportación como pyarrow.Table
+
+    Los .arrow se abren con memory-map: la tabla referencia las páginas
+    del archivo (sin copia) y el sistema carga solo lo que se lee. Los
+    .parquet hay que decodificarlos.
+    """
+    _requerir_pyarrow()
+    tablas = []
+    for archivo in archivos_exportados(ruta):
+        if archivo.endswith(".parquet"):
+            tabla = pq.read_table(archivo, columns=columnas, memory_map=True)
+        else:
+            tabla = pa.ipc.open_file(pa.memory_map(archivo, "r")).read_all()
+            if columnas is not None:
+                tabla = tabla.select(columnas)
+        tablas.append(tabla)
+    if not tablas:
+        campos = esquema()
+        return campos.empty_table() if columnas is None else campos.empty_table().select(columnas)
+    return pa.concat_tables(tablas)
+
+
+def main():
+    import argparse
+    from database.db_manager import DatabaseManager
+    from config import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(description="Exportación columnar del historial")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    exp = sub.add_parser("exportar", help="Exportar lecturas_sensores")
+    exp.add_argument("destino", help="Archivo (sin partición) o directorio")
+    exp.add_argument("--formato", choices=FORMATOS, default="arrow")
+    exp.add_argument("--particion", choices=PARTICIONES)
+    exp.add_argument("--horas", type=int, help="Solo las últimas X horas (por defecto todo)")
+    exp.add_argument("--db", default=DATABASE_PATH)
+    leer = sub.add_parser("leer", help="Cargar una exportación y mostrar un resumen")
+    leer.add_argument("ruta")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.comando == "exportar":
+        desde = time.time() - args.horas * 3600 if args.horas else 0
+        db = DatabaseManager(args.db, solo_lectura=True)
+        resultado = exportar(db, args.destino, args.formato, args.particion, desde)
+        print(f"✓ {resultado['filas']} filas en {len(resultado['archivos'])} archivo(s), "
+              f"{resultado['bytes'] / 1e6:.1f} MB, {time.perf_counter() - inicio:.2f} s")
+    else:
+        tabla = cargar(args.ruta)
+        print(f"✓ {tabla.num_rows} filas cargadas en {time.perf_counter() - inicio:.3f} s")
+        print(tabla.schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,28 @@ Gestiona almacenamiento de datos de sensores y actuadores
 
 import sqlite3
 import json
+import time
 from datetime import datetime, timedelta
 from contextlib import contextmanager
+from monitoring.metrics import BD_LATENCIA, cronometrar
+from monitoring.logs import obtener_logger
+from database.query_log import ConexionRegistrada
+
+log = obtener_logger("bd")
 
 class DatabaseManager:
-    def __init__(self, db_path='database/casa_domotica.db'):
+    def __init__(self, db_path='database/casa_domotica.db', solo_lectura=False):
         self.db_path = db_path
+        # Conexiones de solo lectura (trabajos en segundo plano)
+        self.solo_lectura = solo_lectura
         
     @contextmanager
     def get_connection(self):
         """Context manager para conexiones a BD"""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=10, factory=ConexionRegistrada)
         conn.row_factory = sqlite3.Row
+        if self.solo_lectura:
+            conn.execute('PRAGMA query_only = ON')
         try:
             yield conn
             conn.commit()
@@ -31,6 +41,9 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
+            # WAL permite lectores concurrentes y varios procesos escritores
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Tabla de lecturas de sensores
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS lecturas_sensores (
@@ -40,10 +53,16 @@ class DatabaseManager:
                     movimiento INTEGER,
                     distancia REAL,
                     humedad_suelo REAL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    dispositivo TEXT
                 )
             ''')
             
+            # Migración: columna dispositivo en BDs anteriores
+            columnas = [c[1] for c in cursor.execute('PRAGMA table_info(lecturas_sensores)')]
+            if 'dispositivo' not in columnas:
+                cursor.execute('ALTER TABLE lecturas_sensores ADD COLUMN dispositivo TEXT')
+            
             # Tabla de estado de actuadores
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS estado_actuadores (
@@ -67,6 +86,59 @@ class DatabaseManager:
                 )
             ''')
             
+            # Escenas: conjuntos de acciones de actuadores con nombre
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS escenas (
+                    nombre TEXT PRIMARY KEY,
+                    descripcion TEXT,
+                    acciones TEXT NOT NULL,
+                    actualizada DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Acciones programadas (scheduler); horas en epoch
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS programaciones (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nombre TEXT,
+                    dispositivo TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    inicio REAL,
+                    hora TEXT,
+                    dias TEXT,
+                    cada INTEGER,
+                    duracion INTEGER,
+                    valor_final TEXT,
+                    activa INTEGER DEFAULT 1,
+                    proxima REAL,
+                    fin_pendiente REAL,
+                    ultima REAL,
+                    creada DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Modo y umbrales del sistema (clave -> JSON), para recuperarlos al reiniciar
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS estado_sistema (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    actualizado DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Cola de salida MQTT (mqtt.outbox): mensajes QoS > 0 sin confirmar por el broker
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cola_mqtt (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    qos INTEGER NOT NULL,
+                    retain INTEGER NOT NULL,
+                    creado DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
             # Crear índices para mejorar consultas
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_timestamp_sensores 
@@ -78,23 +150,25 @@ class DatabaseManager:
                 ON estado_actuadores(timestamp)
             ''')
             
-            print("✓ Tablas creadas/verificadas correctamente")
+            log.info("Tablas creadas/verificadas correctamente")
     
     # ====================== SENSORES ======================
     
+    @cronometrar(BD_LATENCIA)
     def insertar_lectura_sensores(self, temperatura, humedad, movimiento, 
-                                   distancia, humedad_suelo):
+                                   distancia, humedad_suelo, dispositivo=None):
         """Inserta una nueva lectura de sensores"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO lecturas_sensores 
-                (temperatura, humedad, movimiento, distancia, humedad_suelo)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (temperatura, humedad, movimiento, distancia, humedad_suelo))
+                (temperatura, humedad, movimiento, distancia, humedad_suelo, dispositivo)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (temperatura, humedad, movimiento, distancia, humedad_suelo, dispositivo))
             
             return cursor.lastrowid
     
+    @cronometrar(BD_LATENCIA)
     def obtener_ultimas_lecturas(self, limite=100):
         """Obtiene las últimas N lecturas"""
         with self.get_connection() as conn:
@@ -107,8 +181,9 @@ class DatabaseManager:
             
             return cursor.fetchall()
     
-    def obtener_lecturas_por_tiempo(self, horas=24):
-        """Obtiene lecturas de las últimas X horas"""
+    @cronometrar(BD_LATENCIA)
+    def obtener_lecturas_por_tiempo(self, horas=24, limite=None):
+        """Obtiene lecturas de las últimas X horas (las `limite` más recientes si se indica)"""
         fecha_limite = datetime.now() - timedelta(hours=horas)
         
         with self.get_connection() as conn:
@@ -117,12 +192,122 @@ class DatabaseManager:
                 SELECT * FROM lecturas_sensores 
                 WHERE timestamp >= ?
                 ORDER BY timestamp DESC
-            ''', (fecha_limite,))
+                LIMIT ?
+            ''', (fecha_limite, -1 if limite is None else limite))
             
             return cursor.fetchall()
     
+    # Columnas numéricas que se pueden pedir en lote
+    COLUMNAS_LECTURAS = ('id', 'temperatura', 'humedad', 'movimiento',
+                         'distancia', 'humedad_suelo')
+    
+    def iterar_lecturas_por_tiempo(self, horas=24, tamano_lote=50000,
+                                   columnas=('temperatura', 'humedad', 'humedad_suelo')):
+        """Recorre las lecturas de las últimas X horas en lotes (orden ascendente)
+        
+        Cada lote es una lista de tuplas (epoch, *columnas) lista para
+        convertirse en arrays.
+        """
+        if any(c not in self.COLUMNAS_LECTURAS for c in columnas):
+            raise ValueError(f"Columnas no válidas: {columnas}")
+        fecha_limite = datetime.now() - timedelta(hours=horas)
+        
+        # Solo cuenta el tiempo de SQLite, no el del consumidor entre lotes
+        serie = BD_LATENCIA.labels('iterar_lecturas_por_tiempo')
+        inicio = time.perf_counter()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f'''
+                SELECT (julianday(timestamp) - 2440587.5) * 86400.0,
+                       {', '.join(columnas)}
+                FROM lecturas_sensores 
+                WHERE timestamp >= ?
+                ORDER BY timestamp ASC
+            ''', (fecha_limite,))
+            
+            duracion = 0.0
+            while True:
+                lote = cursor.fetchmany(tamano_lote)
+                duracion += time.perf_counter() - inicio
+                if not lote:
+                    break
+                yield lote
+                inicio = time.perf_counter()
+            serie.observe(duracion)
+
+    def iterar_lecturas_desde(self, desde, tamano_lote=50000):
+        """Recorre las lecturas con timestamp >= desde (epoch) en lotes, orden ascendente
+
+        Cada fila es (epoch, *COLUMNAS_LECTURAS, dispositivo).
+        """
+        serie = BD_LATENCIA.labels('iterar_lecturas_desde')
+        inicio = time.perf_counter()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f'''
+                SELECT (julianday(timestamp) - 2440587.5) * 86400.0,
+                       {', '.join(self.COLUMNAS_LECTURAS)}, dispositivo
+                FROM lecturas_sensores
+                WHERE timestamp >= datetime(?, 'unixepoch')
+                ORDER BY timestamp ASC, id ASC
+            ''', (desde,))
+
+            duracion = 0.0
+            while True:
+                lote = cursor.fetchmany(tamano_lote)
+                duracion += time.perf_counter() - inicio
+                if not lote:
+                    break
+                yield lote
+                inicio = time.perf_counter()
+            serie.observe(duracion)
+
+    @cronometrar(BD_LATENCIA)
+    def contar_lecturas_por_tiempo(self, horas=24):
+        """Cantidad de lecturas de las últimas X horas"""
+        fecha_limite = datetime.now() - timedelta(hours=horas)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM lecturas_sensores
+                WHERE timestamp >= ?
+            ''', (fecha_limite,))
+
+            return cursor.fetchone()[0]
+
+    def iterar_lecturas_completas(self, horas=24, tamano_lote=50000, descendente=False):
+        """Recorre las filas completas de las últimas X horas en lotes
+        (orden ascendente, o más recientes primero con `descendente`)"""
+        fecha_limite = datetime.now() - timedelta(hours=horas)
+        orden = "DESC" if descendente else "ASC"
+
+        serie = BD_LATENCIA.labels('iterar_lecturas_completas')
+        inicio = time.perf_counter()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f'''
+                SELECT * FROM lecturas_sensores
+                WHERE timestamp >= ?
+                ORDER BY timestamp {orden}
+            ''', (fecha_limite,))
+
+            duracion = 0.0
+            while True:
+                lote = cursor.fetchmany(tamano_lote)
+                duracion += time.perf_counter() - inicio
+                if not lote:
+                    break
+                yield lote
+                inicio = time.perf_counter()
+            serie.observe(duracion)
+
     # ====================== ACTUADORES ======================
     
+    @cronometrar(BD_LATENCIA)
     def insertar_estado_actuadores(self, servo_angulo, ventilador_velocidad,
                                      bomba_activa, leds):
         """Inserta el estado actual de los actuadores"""
@@ -136,6 +321,7 @@ class DatabaseManager:
             
             return cursor.lastrowid
     
+    @cronometrar(BD_LATENCIA)
     def obtener_ultimo_estado_actuadores(self):
         """Obtiene el último estado de los actuadores"""
         with self.get_connection() as conn:
@@ -159,8 +345,207 @@ class DatabaseManager:
                 }
             return None
     
+    @cronometrar(BD_LATENCIA)
+    def combinar_estado_actuadores(self, cambios, leds=None):
+        """Inserta el último estado con `cambios` (columnas) y `leds` aplicados
+
+        La lectura del último estado y la inserción van en la misma
+        transacción (BEGIN IMMEDIATE), así dos escenas simultáneas no
+        pisan sus cambios. Devuelve el estado resultante.
+        """
+        with self.get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            fila = conn.execute('''
+                SELECT servo_angulo, ventilador_velocidad, bomba_activa, leds
+                FROM estado_actuadores
+                ORDER BY timestamp DESC, id DESC
+                LIMIT 1
+            ''').fetchone()
+
+            estado = {"servo_angulo": 90, "ventilador_velocidad": 0, "bomba_activa": False, "leds": {}}
+            if fila:
+                estado.update(
+                    servo_angulo=fila[0], ventilador_velocidad=fila[1],
+                    bomba_activa=bool(fila[2]), leds=json.loads(fila[3]) if fila[3] else {}
+                )
+            estado.update(cambios)
+            estado["leds"] = {**estado["leds"], **(leds or {})}
+
+            estado["id"] = conn.execute('''
+                INSERT INTO estado_actuadores
+                (servo_angulo, ventilador_velocidad, bomba_activa, leds)
+                VALUES (?, ?, ?, ?)
+            ''', (estado["servo_angulo"], estado["ventilador_velocidad"],
+                  estado["bomba_activa"], json.dumps(estado["leds"]))).lastrowid
+            return estado
+
+    # ====================== ESCENAS ======================
+
+    @cronometrar(BD_LATENCIA)
+    def guardar_escena(self, nombre, acciones, descripcion=None):
+        """Crea o reemplaza una escena (acciones: dispositivo -> valor)"""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO escenas (nombre, descripcion, acciones)
+                VALUES (?, ?, ?)
+                ON CONFLICT(nombre) DO UPDATE SET
+                    descripcion = excluded.descripcion,
+                    acciones = excluded.acciones,
+                    actualizada = CURRENT_TIMESTAMP
+            ''', (nombre, descripcion, json.dumps(acciones)))
+
+    @cronometrar(BD_LATENCIA)
+    def obtener_escena(self, nombre):
+        """Escena por nombre o None"""
+        with self.get_connection() as conn:
+            fila = conn.execute(
+                'SELECT nombre, descripcion, acciones, actualizada FROM escenas WHERE nombre = ?',
+                (nombre,)
+            ).fetchone()
+        return self._escena(fila) if fila else None
+
+    @cronometrar(BD_LATENCIA)
+    def listar_escenas(self):
+        """Todas las escenas por nombre"""
+        with self.get_connection() as conn:
+            filas = conn.execute(
+                'SELECT nombre, descripcion, acciones, actualizada FROM escenas ORDER BY nombre'
+            ).fetchall()
+        return [self._escena(fila) for fila in filas]
+
+    @cronometrar(BD_LATENCIA)
+    def eliminar_escena(self, nombre):
+        """Borra una escena; devuelve si existía"""
+        with self.get_connection() as conn:
+            return conn.execute('DELETE FROM escenas WHERE nombre = ?', (nombre,)).rowcount > 0
+
+    @staticmethod
+    def _escena(fila):
+        return {
+            "nombre": fila[0],
+            "descripcion": fila[1],
+            "acciones": json.loads(fila[2]),
+            "actualizada": fila[3]
+        }
+    
+    # ====================== PROGRAMACIONES ======================
+
+    COLUMNAS_PROGRAMACION = (
+        "id", "nombre", "dispositivo", "valor", "tipo", "inicio", "hora", "dias",
+        "cada", "duracion", "valor_final", "activa", "proxima", "fin_pendiente",
+        "ultima", "creada"
+    )
+    _JSON_PROGRAMACION = ("valor", "dias", "valor_final")
+
+    @cronometrar(BD_LATENCIA)
+    def insertar_programacion(self, programacion):
+        """Inserta una programación (dict con COLUMNAS_PROGRAMACION); devuelve su id"""
+        columnas = [c for c in self.COLUMNAS_PROGRAMACION if c in programacion and c != "id"]
+        valores = [
+            json.dumps(programacion[c]) if c in self._JSON_PROGRAMACION else programacion[c]
+            for c in columnas
+        ]
+        with self.get_connection() as conn:
+            return conn.execute(
+                f'INSERT INTO programaciones ({", ".join(columnas)}) '
+                f'VALUES ({", ".join("?" * len(columnas))})',
+                valores
+            ).lastrowid
+
+    @cronometrar(BD_LATENCIA)
+    def obtener_programacion(self, programacion_id):
+        with self.get_connection() as conn:
+            fila = conn.execute(
+                f'SELECT {", ".join(self.COLUMNAS_PROGRAMACION)} FROM programaciones WHERE id = ?',
+                (programacion_id,)
+            ).fetchone()
+        return self._programacion(fila) if fila else None
+
+    @cronometrar(BD_LATENCIA)
+    def listar_programaciones(self, solo_activas=False):
+        consulta = f'SELECT {", ".join(self.COLUMNAS_PROGRAMACION)} FROM programaciones'
+        if solo_activas:
+            consulta += ' WHERE activa = 1'
+        with self.get_connection() as conn:
+            filas = conn.execute(consulta + ' ORDER BY id').fetchall()
+        return [self._programacion(fila) for fila in filas]
+
+    @cronometrar(BD_LATENCIA)
+    def actualizar_programaciones(self, estados):
+        """Guarda (proxima, fin_pendiente, ultima, activa, id) de varias en una transacción"""
+        with self.get_connection() as conn:
+            conn.executemany('''
+                UPDATE programaciones
+                SET proxima = ?, fin_pendiente = ?, ultima = ?, activa = ?
+                WHERE id = ?
+            ''', estados)
+
+    @cronometrar(BD_LATENCIA)
+    def eliminar_programacion(self, programacion_id):
+        """Borra una programación; devuelve si existía"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'DELETE FROM programaciones WHERE id = ?', (programacion_id,)
+            ).rowcount > 0
+
+    def _programacion(self, fila):
+        programacion = dict(zip(self.COLUMNAS_PROGRAMACION, fila))
+        for columna in self._JSON_PROGRAMACION:
+            if programacion[columna] is not None:
+                programacion[columna] = json.loads(programacion[columna])
+        programacion["activa"] = bool(programacion["activa"])
+        return programacion
+    
+    # ====================== ESTADO DEL SISTEMA ======================
+
+    @cronometrar(BD_LATENCIA)
+    def guardar_estado_sistema(self, clave, valor):
+        """Guarda un valor del estado del sistema (modo, configuracion)"""
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO estado_sistema (clave, valor) VALUES (?, ?)
+                ON CONFLICT(clave) DO UPDATE SET
+                    valor = excluded.valor,
+                    actualizado = CURRENT_TIMESTAMP
+            ''', (clave, json.dumps(valor)))
+
+    @cronometrar(BD_LATENCIA)
+    def obtener_estado_sistema(self):
+        """Estado del sistema guardado (clave -> valor)"""
+        with self.get_connection() as conn:
+            filas = conn.execute('SELECT clave, valor FROM estado_sistema').fetchall()
+        return {clave: json.loads(valor) for clave, valor in filas}
+
+    # ====================== COLA DE SALIDA MQTT ======================
+
+    @cronometrar(BD_LATENCIA)
+    def encolar_mensajes_mqtt(self, mensajes):
+        """Guarda mensajes (topic, payload, qos, retain); devuelve sus ids"""
+        with self.get_connection() as conn:
+            return [
+                conn.execute(
+                    'INSERT INTO cola_mqtt (topic, payload, qos, retain) VALUES (?, ?, ?, ?)', mensaje
+                ).lastrowid
+                for mensaje in mensajes
+            ]
+
+    @cronometrar(BD_LATENCIA)
+    def borrar_mensajes_mqtt(self, ids):
+        """Borra los mensajes ya confirmados por el broker"""
+        with self.get_connection() as conn:
+            conn.executemany('DELETE FROM cola_mqtt WHERE id = ?', [(i,) for i in ids])
+
+    @cronometrar(BD_LATENCIA)
+    def listar_mensajes_mqtt(self):
+        """Mensajes pendientes (id, topic, payload, qos, retain) en orden de llegada"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT id, topic, payload, qos, retain FROM cola_mqtt ORDER BY id'
+            ).fetchall()
+
     # ====================== ALERTAS ======================
     
+    @cronometrar(BD_LATENCIA)
     def insertar_alerta(self, tipo, mensaje, nivel='info'):
         """Inserta una nueva alerta/evento"""
         with self.get_connection() as conn:
@@ -172,6 +557,19 @@ class DatabaseManager:
             
             return cursor.lastrowid
     
+    @cronometrar(BD_LATENCIA)
+    def insertar_alertas(self, alertas):
+        """Inserta varias alertas (tipo, mensaje, nivel) en una transacción"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO alertas (tipo, mensaje, nivel)
+                VALUES (?, ?, ?)
+            ''', alertas)
+            
+            return cursor.rowcount
+    
+    @cronometrar(BD_LATENCIA)
     def obtener_alertas_recientes(self, limite=50):
         """Obtiene las alertas más recientes"""
         with self.get_connection() as conn:
@@ -186,6 +584,7 @@ class DatabaseManager:
     
     # ====================== ESTADÍSTICAS ======================
     
+    @cronometrar(BD_LATENCIA)
     def obtener_estadisticas(self):
         """Calcula estadísticas generales del sistema"""
         with self.get_connection() as conn:
@@ -235,6 +634,7 @@ class DatabaseManager:
                 "total_registros": total_registros
             }
     
+    @cronometrar(BD_LATENCIA)
     def limpiar_datos_antiguos(self, dias=30):
         """Elimina datos más antiguos de X días"""
         fecha_limite = datetime.now() - timedelta(days=dias)
@@ -254,6 +654,39 @@ class DatabaseManager:
             
             return cursor.rowcount
 
+    @cronometrar(BD_LATENCIA)
+    def contar_datos_antiguos(self, dias=30):
+        """Filas que borraría limpiar_datos_antiguos, por tabla"""
+        fecha_limite = datetime.now() - timedelta(days=dias)
+
+        with self.get_connection() as conn:
+            return {
+                tabla: conn.execute(
+                    f'SELECT COUNT(*) FROM {tabla} WHERE timestamp < ?', (fecha_limite,)
+                ).fetchone()[0]
+                for tabla in ('lecturas_sensores', 'estado_actuadores')
+            }
+
+    def limpiar_datos_antiguos_por_lotes(self, dias=30, tamano_lote=5000):
+        """Como limpiar_datos_antiguos, con una transacción por lote
+
+        Cada lote bloquea la escritura solo un momento, así la ingesta
+        sigue insertando. Genera (tabla, filas borradas en el lote).
+        """
+        fecha_limite = datetime.now() - timedelta(days=dias)
+
+        for tabla in ('lecturas_sensores', 'estado_actuadores'):
+            while True:
+                with self.get_connection() as conn:
+                    borradas = conn.execute(f'''
+                        DELETE FROM {tabla} WHERE id IN (
+                            SELECT id FROM {tabla} WHERE timestamp < ? LIMIT ?
+                        )
+                    ''', (fecha_limite, tamano_lote)).rowcount
+                if not borradas:
+                    break
+                yield tabla, borradas
+
 # ====================== TESTS ======================
 
 if __name__ == '__main__':
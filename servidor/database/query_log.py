@@ -0,0 +1,132 @@
+"""
+Registro de consultas lentas
+
+Conexión y cursor de sqlite3 que miden execute + fetch de cada sentencia.
+Las que superan SLOW_QUERY_THRESHOLD_MS se registran con su SQL,
+parámetros, duración y filas; además el tiempo se suma al Perfil de la
+petición en curso (monitoring.profiling).
+"""
+
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+
+from monitoring.logs import obtener_logger
+from monitoring.profiling import registrar_bd
+from config import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_HISTORY
+
+log = obtener_logger("bd")
+
+# Últimas consultas lentas (más reciente al final)
+consultas_lentas = deque(maxlen=SLOW_QUERY_HISTORY)
+
+
+class CursorRegistrado(sqlite3.Cursor):
+    """Cursor que acumula el tiempo y las filas de la sentencia actual"""
+
+    def __init__(self, conexion):
+        super().__init__(conexion)
+        self._sql = None
+        self._parametros = None
+        self._duracion = 0.0
+        self._filas = 0
+
+    def _empezar(self, sql, parametros):
+        self.cerrar_sentencia()
+        self._sql = sql
+        self._parametros = parametros
+        self._duracion = 0.0
+        self._filas = 0
+
+    def execute(self, sql, parametros=()):
+        self._empezar(sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._duracion += time.perf_counter() - inicio
+
+    def executemany(self, sql, secuencia):
+        if not isinstance(secuencia, (list, tuple)):
+            secuencia = list(secuencia)
+        self._empezar(sql, f"<{len(secuencia)} filas>")
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, secuencia)
+        finally:
+            self._duracion += time.perf_counter() - inicio
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._duracion += time.perf_counter() - inicio
+        if fila is not None:
+            self._filas += 1
+        return fila
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        filas = super().fetchmany(self.arraysize if size is None else size)
+        self._duracion += time.perf_counter() - inicio
+        self._filas += len(filas)
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._duracion += time.perf_counter() - inicio
+        self._filas += len(filas)
+        return filas
+
+    def cerrar_sentencia(self):
+        """Registrar la sentencia actual (al ejecutar otra o al cerrar la conexión)"""
+        if self._sql is None:
+            return
+        duracion = self._duracion
+        registrar_bd(duracion)
+        if SLOW_QUERY_THRESHOLD_MS and duracion * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+            consulta = {
+                "timestamp": datetime.now().isoformat(),
+                "sql": " ".join(self._sql.split()),
+                "parametros": [str(p) for p in self._parametros]
+                              if isinstance(self._parametros, (list, tuple)) else str(self._parametros),
+                "duracion_ms": round(duracion * 1000, 3),
+                "filas": self._filas or max(self.rowcount, 0)
+            }
+            consultas_lentas.append(consulta)
+            log.warning("Consulta lenta (%.1f ms)", consulta["duracion_ms"], extra=consulta)
+        self._sql = None
+
+
+class ConexionRegistrada(sqlite3.Connection):
+    """Conexión cuyos cursores registran sus sentencias"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursores = []
+
+    def cursor(self, factory=CursorRegistrado):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, CursorRegistrado):
+            self._cursores.append(cursor)
+        return cursor
+
+    # Como sqlite3.Connection.execute, pero a través de cursor()
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, secuencia):
+        return self.cursor().executemany(sql, secuencia)
+
+    def commit(self):
+        # El commit (fsync en WAL) cuenta como tiempo de BD de la petición
+        inicio = time.perf_counter()
+        super().commit()
+        registrar_bd(time.perf_counter() - inicio, consultas=0)
+
+    def close(self):
+        for cursor in self._cursores:
+            cursor.cerrar_sentencia()
+        self._cursores.clear()
+        super().close()
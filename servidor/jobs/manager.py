@@ -0,0 +1,259 @@
+"""
+Trabajos en segundo plano sobre un pool de procesos
+
+Exportaciones CSV y columnares, analítica de ventanas largas y limpieza por retención
+se ejecutan en procesos aparte (jobs.tareas): no compiten por el GIL con
+el event loop ni con la ingesta MQTT. El pool y su Manager se crean con
+el primer trabajo, en un thread (arrancar procesos spawn tarda ~1 s).
+
+Con varios workers de uvicorn cada trabajo corre en el worker que lo
+recibió, pero su estado y la ruta del resultado se guardan también en el
+estado compartido (clave "trabajo:<id>"): la consulta, la descarga y la
+cancelación funcionan desde cualquier worker. El avance en vivo solo lo
+ve el worker que lo ejecuta, y el listado muestra los trabajos propios.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from analytics.ring_buffer import historial_reciente
+from jobs.tareas import TRABAJOS, TrabajoCancelado, ejecutar, inicializar_worker
+from state.backend import shared_state
+from monitoring.logs import obtener_logger
+from config import DATABASE_PATH, JOBS_DIR, JOBS_MAX_WORKERS, JOBS_HISTORY
+
+log = obtener_logger("trabajos")
+
+CANAL = "trabajos"
+
+
+class Trabajo:
+    """Un trabajo enviado al pool"""
+
+    def __init__(self, tipo, parametros, directorio):
+        self.id = uuid.uuid4().hex[:12]
+        self.tipo = tipo
+        self.parametros = parametros
+        self.ruta = os.path.join(directorio, f"{self.id}.{self.extension}")
+        self.estado = "pendiente"  # pendiente, ejecutando, cancelando, completado, cancelado, error
+        self.creado = datetime.now().isoformat()
+        self.terminado = None
+        self.resultado = None
+        self.error = None
+        self.future = None  # None: trabajo de otro worker (leído del estado compartido)
+
+    @classmethod
+    def remoto(cls, datos):
+        """Trabajo de otro worker a partir de lo que publicó en el estado compartido"""
+        trabajo = cls.__new__(cls)
+        for campo in ("id", "tipo", "parametros", "ruta", "estado", "creado",
+                      "terminado", "resultado", "error"):
+            setattr(trabajo, campo, datos[campo])
+        trabajo.future = None
+        return trabajo
+
+    @property
+    def activo(self):
+        return self.estado in ("pendiente", "ejecutando", "cancelando")
+
+    @property
+    def extension(self):
+        extension = TRABAJOS[self.tipo][2]
+        return extension(self.parametros) if callable(extension) else extension
+
+
+class GestorTrabajos:
+    """Envío, avance, cancelación y resultados de los trabajos"""
+
+    def __init__(self, db_path=DATABASE_PATH, directorio=JOBS_DIR,
+                 max_workers=JOBS_MAX_WORKERS, historial=JOBS_HISTORY):
+        self.db_path = db_path
+        self.directorio = directorio
+        self.max_workers = max_workers
+        self.historial = historial
+        self.trabajos = OrderedDict()  # id -> Trabajo, más antiguo primero
+        self._pool = None
+        self._manager = None
+        self._avance = None
+        self._cancelados = None
+        self._iniciando = None  # asyncio.Lock, se crea en el event loop
+
+    async def iniciar(self):
+        """Crear el pool fuera del event loop si aún no existe"""
+        if self._pool is not None:
+            return
+        if self._iniciando is None:
+            self._iniciando = asyncio.Lock()
+        async with self._iniciando:
+            if self._pool is None:
+                await asyncio.to_thread(self._iniciar_pool)
+
+    def _iniciar_pool(self):
+        # spawn: el servidor tiene threads (MQTT, logging, watchdog) y
+        # hacer fork con threads puede dejar locks tomados en el hijo
+        contexto = multiprocessing.get_context("spawn")
+        self._manager = contexto.Manager()
+        self._avance = self._manager.dict()
+        self._cancelados = self._manager.dict()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=contexto,
+            initializer=inicializar_worker
+        )
+        os.makedirs(self.directorio, exist_ok=True)
+        log.info("Pool de trabajos iniciado", extra={"procesos": self.max_workers})
+
+    def enviar(self, tipo, parametros):
+        """Encolar un trabajo; devuelve el Trabajo con estado pendiente"""
+        if tipo not in TRABAJOS:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        if self._pool is None:
+            self._iniciar_pool()
+        aceptados = TRABAJOS[tipo][1]
+        parametros = {k: v for k, v in parametros.items() if k in aceptados}
+
+        trabajo = Trabajo(tipo, parametros, self.directorio)
+        trabajo.future = self._pool.submit(
+            ejecutar, tipo, trabajo.id, parametros, self.db_path, trabajo.ruta,
+            self._avance, self._cancelados
+        )
+        self.trabajos[trabajo.id] = trabajo
+        self._compartir(trabajo)
+        trabajo.future.add_done_callback(lambda future: self._terminado(trabajo, future))
+        self._podar()
+        log.info("Trabajo %s enviado", tipo, extra={"trabajo": trabajo.id, **parametros})
+        return trabajo
+
+    def _terminado(self, trabajo, future):
+        """Callback del future (thread del pool)"""
+        trabajo.terminado = datetime.now().isoformat()
+        if future.cancelled():
+            trabajo.estado = "cancelado"
+        else:
+            error = future.exception()
+            if error is None:
+                trabajo.estado = "completado"
+                trabajo.resultado = future.result()
+                if trabajo.tipo == "limpieza":
+                    # Lo borrado puede seguir en el historial en memoria
+                    historial_reciente.olvidar_anteriores(time.time() - trabajo.parametros["dias"] * 86400)
+            elif isinstance(error, TrabajoCancelado):
+                trabajo.estado = "cancelado"
+            else:
+                trabajo.estado = "error"
+                trabajo.error = f"{type(error).__name__}: {error}"
+                log.error("Trabajo %s fallido: %s", trabajo.tipo, trabajo.error,
+                          extra={"trabajo": trabajo.id})
+        self._compartir(trabajo)
+        try:
+            self._avance.pop(trabajo.id, None)
+            self._cancelados.pop(trabajo.id, None)
+        except Exception:
+            pass  # Manager ya cerrado
+
+    def _compartir(self, trabajo, datos=True):
+        """Guardar el estado del trabajo para los demás workers (None lo olvida)"""
+        if datos:
+            datos = {campo: getattr(trabajo, campo) for campo in (
+                "id", "tipo", "parametros", "ruta", "estado", "creado",
+                "terminado", "resultado", "error")}
+        try:
+            shared_state.set(f"trabajo:{trabajo.id}", datos)
+        except Exception as e:
+            log.error("Error compartiendo el estado del trabajo: %s", e,
+                      extra={"trabajo": trabajo.id})
+
+    def obtener(self, trabajo_id):
+        """Trabajo de este worker o, si no, el publicado por otro (o None)"""
+        trabajo = self.trabajos.get(trabajo_id)
+        if trabajo is not None:
+            return trabajo
+        datos = shared_state.get(f"trabajo:{trabajo_id}")
+        return Trabajo.remoto(datos) if datos else None
+
+    def estado(self, trabajo):
+        """Estado de un trabajo con su avance (0-1) si sigue activo y es de este worker"""
+        datos = {
+            "id": trabajo.id,
+            "tipo": trabajo.tipo,
+            "parametros": trabajo.parametros,
+            "estado": trabajo.estado,
+            "creado": trabajo.creado,
+            "terminado": trabajo.terminado,
+            "resultado": trabajo.resultado,
+            "error": trabajo.error,
+            "progreso": 1.0 if trabajo.estado == "completado" else None
+        }
+        if trabajo.activo and trabajo.future is not None:
+            avance = self._avance.get(trabajo.id)
+            if avance is not None:
+                if trabajo.estado == "pendiente":
+                    datos["estado"] = "ejecutando"
+                datos["hechos"] = avance["hechos"]
+                if avance["total"]:
+                    datos["progreso"] = round(min(avance["hechos"] / avance["total"], 1.0), 4)
+        return datos
+
+    def listar(self):
+        """Trabajos más recientes primero"""
+        return [self.estado(trabajo) for trabajo in reversed(self.trabajos.values())]
+
+    def cancelar(self, trabajo):
+        """Cancelar un trabajo pendiente o pedir a uno en curso que pare"""
+        if not trabajo.activo:
+            return False
+        if trabajo.future is None:
+            return False  # de otro worker: ver solicitar_cancelacion
+        if not trabajo.future.cancel():
+            # Ya se está ejecutando: el proceso lo verá en su próximo avance
+            trabajo.estado = "cancelando"
+            self._cancelados[trabajo.id] = True
+            self._compartir(trabajo)
+            if trabajo.future.done():
+                self._terminado(trabajo, trabajo.future)  # terminó mientras tanto
+        return True
+
+    async def solicitar_cancelacion(self, trabajo):
+        """Cancelar un trabajo de otro worker: se lo pide por el estado compartido"""
+        if not trabajo.activo:
+            return False
+        await shared_state.publish(CANAL, {"cancelar": trabajo.id})
+        trabajo.estado = "cancelando"
+        return True
+
+    async def on_shared_event(self, canal, mensaje):
+        """Cancelación pedida desde otro worker"""
+        if canal == CANAL:
+            trabajo = self.trabajos.get(mensaje.get("cancelar"))
+            if trabajo is not None:
+                self.cancelar(trabajo)
+
+    def _podar(self):
+        """Olvidar los trabajos terminados más antiguos y borrar sus resultados"""
+        terminados = [t for t in self.trabajos.values() if not t.activo]
+        for trabajo in terminados[:max(0, len(terminados) - self.historial)]:
+            del self.trabajos[trabajo.id]
+            self._compartir(trabajo, None)
+            if os.path.exists(trabajo.ruta):
+                os.remove(trabajo.ruta)
+
+    def cerrar(self):
+        """Cancelar lo pendiente, pedir a lo que corre que pare y cerrar el pool"""
+        if self._pool is None:
+            return
+        for trabajo in self.trabajos.values():
+            if trabajo.activo:
+                self.cancelar(trabajo)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._manager.shutdown()
+        self._pool = None
+
+
+# Instancia global
+gestor_trabajos = GestorTrabajos()
+shared_state.subscribe(gestor_trabajos.on_shared_event)
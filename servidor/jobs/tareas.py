@@ -0,0 +1,171 @@
+"""
+Trabajos que se ejecutan en el pool de procesos (jobs.manager)
+
+Cada trabajo abre su propia conexión a SQLite: de solo lectura para
+exportaciones y analítica, de escritura solo para la limpieza por
+retención. El avance y la cancelación se comparten con el servidor a
+través de dicts de un multiprocessing.Manager.
+"""
+
+import csv
+import os
+import tempfile
+import time
+import zipfile
+
+from analytics.series import cargar_ventana, calcular_analitica
+from database import columnar
+from database.db_manager import DatabaseManager
+from models.serialization import dumps
+from monitoring.logs import configurar_logging, obtener_logger
+from config import JOBS_NICE
+
+log = obtener_logger("trabajos")
+
+TAMANO_LOTE = 10000
+
+
+class TrabajoCancelado(Exception):
+    """El trabajo se canceló mientras se ejecutaba"""
+
+
+class Avance:
+    """Progreso y cancelación de un trabajo
+
+    Escribir el avance y mirar la bandera de cancelación son llamadas al
+    Manager, así que se hacen como mucho cada INTERVALO segundos.
+    """
+
+    INTERVALO = 0.25
+
+    def __init__(self, avance, cancelados, trabajo_id):
+        self.avance = avance
+        self.cancelados = cancelados
+        self.trabajo_id = trabajo_id
+        self._ultimo = 0.0
+
+    def actualizar(self, hechos, total, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < self.INTERVALO:
+            return
+        self._ultimo = ahora
+        if self.trabajo_id in self.cancelados:
+            raise TrabajoCancelado()
+        self.avance[self.trabajo_id] = {"hechos": hechos, "total": total}
+
+
+# ==================== TRABAJOS ====================
+
+# Mismas columnas que el CSV del servidor Flask (también GET /api/exportar/csv)
+CABECERA_CSV = [
+    'ID', 'Timestamp', 'Temperatura (°C)', 'Humedad (%)',
+    'Humedad Suelo (%)', 'Movimiento', 'Distancia (cm)'
+]
+
+
+def fila_csv(l):
+    """Fila de lecturas_sensores (SELECT *) en el orden de CABECERA_CSV"""
+    return (l[0], l[6], l[1], l[2], l[5], l[3], l[4])
+
+
+def exportar_csv(db_path, ruta, avance, horas=24):
+    """Historial de las últimas X horas a CSV (mismas columnas que el Flask)"""
+    db = DatabaseManager(db_path, solo_lectura=True)
+    total = db.contar_lecturas_por_tiempo(horas)
+    hechas = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as archivo:
+        writer = csv.writer(archivo)
+        writer.writerow(CABECERA_CSV)
+        for lote in db.iterar_lecturas_completas(horas, tamano_lote=TAMANO_LOTE):
+            writer.writerows(fila_csv(l) for l in lote)
+            hechas += len(lote)
+            avance.actualizar(hechas, total)
+    return {"filas": hechas}
+
+
+def exportar_columnar(db_path, ruta, avance, horas=24, formato="arrow", particion=None):
+    """Historial de las últimas X horas a Arrow IPC o Parquet (database.columnar)
+
+    Con partición por dispositivo o día los archivos se empaquetan en un
+    zip sin comprimir (Arrow y Parquet ya van en binario compacto).
+    """
+    db = DatabaseManager(db_path, solo_lectura=True)
+    total = db.contar_lecturas_por_tiempo(horas)
+    desde = time.time() - horas * 3600
+    progreso = lambda filas: avance.actualizar(filas, total)
+    if particion is None:
+        resultado = columnar.exportar(db, ruta, formato, desde=desde, avance=progreso)
+    else:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(ruta) or None) as directorio:
+            resultado = columnar.exportar(db, directorio, formato, particion, desde, avance=progreso)
+            with zipfile.ZipFile(ruta, "w", zipfile.ZIP_STORED) as archivo:
+                for parte in resultado["archivos"]:
+                    archivo.write(parte, os.path.relpath(parte, directorio))
+    return {"filas": resultado["filas"], "archivos": len(resultado["archivos"])}
+
+
+def analitica(db_path, ruta, avance, horas=24, paso=300, ventana=12):
+    """Resumen de /api/analitica sobre una ventana larga, a JSON"""
+    db = DatabaseManager(db_path, solo_lectura=True)
+    avance.actualizar(0, 2, forzar=True)
+    datos = cargar_ventana(db, horas)
+    avance.actualizar(1, 2, forzar=True)
+    resultado = calcular_analitica(datos, paso, ventana)
+    with open(ruta, "wb") as archivo:
+        archivo.write(dumps(resultado))
+    return {"lecturas": resultado["lecturas"]}
+
+
+def limpieza(db_path, ruta, avance, dias=30):
+    """Retención: borrar lecturas y estados de más de X días por lotes
+
+    Si se cancela, los lotes ya borrados no se recuperan.
+    """
+    db = DatabaseManager(db_path)
+    total = sum(db.contar_datos_antiguos(dias).values())
+    borradas = {"lecturas_sensores": 0, "estado_actuadores": 0}
+    for tabla, filas in db.limpiar_datos_antiguos_por_lotes(dias):
+        borradas[tabla] += filas
+        avance.actualizar(sum(borradas.values()), total)
+    with open(ruta, "wb") as archivo:
+        archivo.write(dumps({"dias": dias, "borradas": borradas}))
+    return {"borradas": sum(borradas.values())}
+
+
+def _extension_columnar(parametros):
+    return "zip" if parametros.get("particion") else parametros.get("formato", "arrow")
+
+
+# Tipo -> (función, parámetros que acepta, extensión del resultado o
+# función de los parámetros que la devuelve)
+TRABAJOS = {
+    "exportar_csv": (exportar_csv, ("horas",), "csv"),
+    "exportar_columnar": (exportar_columnar, ("horas", "formato", "particion"), _extension_columnar),
+    "analitica": (analitica, ("horas", "paso", "ventana"), "json"),
+    "limpieza": (limpieza, ("dias",), "json"),
+}
+
+
+def ejecutar(tipo, trabajo_id, parametros, db_path, ruta, avance, cancelados):
+    """Punto de entrada en el proceso del pool"""
+    progreso = Avance(avance, cancelados, trabajo_id)
+    progreso.actualizar(0, None, forzar=True)
+    funcion = TRABAJOS[tipo][0]
+    temporal = f"{ruta}.parcial"
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion(db_path, temporal, progreso, **parametros)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    resultado["duracion_s"] = round(time.perf_counter() - inicio, 3)
+    log.info("Trabajo %s terminado", tipo, extra={"trabajo": trabajo_id, **resultado})
+    return resultado
+
+
+def inicializar_worker():
+    """Initializer del pool: menos prioridad y logging propio"""
+    if JOBS_NICE:
+        os.nice(JOBS_NICE)
+    configurar_logging()
@@ -3,16 +3,42 @@ SmartHome API - FastAPI Backend
 Servidor para casa domótica con MQTT y WebSocket
 """
 
-from fastapi import FastAPI, WebSocket, Request
+from fastapi import FastAPI, WebSocket, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 import uvicorn
 
 from mqtt.client import mqtt_client
-from api.routes import router as api_router
+from mqtt.outbox import ColaSalida
+from api.routes import (
+    router as api_router, snapshot_dashboard, registrar_comandos_pendientes, sistema_estado
+)
+from api.admin import router as admin_router
+from api.jobs import router as jobs_router
+from api.scenes import router as scenes_router, aplicar_escena, acciones_de_estado
+from api.schedules import router as schedules_router
 from api.websocket import websocket_manager
+from api.assets import assets
 from database.db_manager import DatabaseManager
+from models.schemas import validar_accion
+from models.serialization import loads
+from analytics.anomaly import AnomalyDetector, AlertDispatcher
+from analytics.ring_buffer import historial_reciente
+from jobs.manager import gestor_trabajos
+from scheduler.manager import planificador
+from monitoring.liveness import monitor_dispositivos
+from state.backend import shared_state
+from monitoring.metrics import (
+    registro, MetricasHTTPMiddleware, HTTP_LATENCIA, COLAS, WEBSOCKET_CLIENTES, DISPOSITIVOS
+)
+from monitoring.watchdog import loop_watchdog
+from monitoring.logs import configurar_logging, obtener_logger
+from monitoring.profiling import PerfiladoMiddleware, perfilador, instalar_fases
+from config import (
+    MQTT_INGEST_WORKERS, LOOP_WATCHDOG_ENABLED, PROFILING_ENABLED,
+    HISTORY_BUFFER_ENABLED, STATE_BACKEND, SCHEDULER_ENABLED, ASSETS_PIPELINE_ENABLED
+)
 
 app = FastAPI(
     title="SmartHome API",
@@ -22,15 +48,35 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
-# Servir archivos estáticos
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Latencia HTTP por ruta (ver /metrics)
+app.add_middleware(MetricasHTTPMiddleware, histograma=HTTP_LATENCIA)
+
+# Fases de cada petición (validación, BD, serialización) para el perfilado
+if PROFILING_ENABLED:
+    instalar_fases()
+    app.add_middleware(PerfiladoMiddleware, perfilador=perfilador)
+
 templates = Jinja2Templates(directory="templates")
+PAGINAS = ("index.html", "control.html", "historial.html")
 
-# Configurar Jinja2 para usar request.url_for correctamente
-templates.env.globals['url_for'] = lambda name, **params: f"/static/{params.get('path', params.get('filename', ''))}"
+if ASSETS_PIPELINE_ENABLED:
+    # Estáticos con huella y precomprimidos en memoria; páginas renderizadas una vez
+    assets.construir()
+    templates.env.globals['url_for'] = assets.url_for
+    assets.prerenderizar(templates.env, PAGINAS)
+else:
+    # Servir archivos estáticos desde el disco
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    templates.env.globals['url_for'] = lambda name, **params: f"/static/{params.get('path', params.get('filename', ''))}"
 
 # Incluir routers API
 app.include_router(api_router, prefix="/api")
+app.include_router(admin_router, prefix="/api/admin")
+app.include_router(jobs_router, prefix="/api/trabajos")
+app.include_router(scenes_router, prefix="/api/escenas")
+app.include_router(schedules_router, prefix="/api/programaciones")
+
+log = obtener_logger("api")
 
 # Inicializar base de datos
 db = DatabaseManager()
@@ -38,30 +84,100 @@ db = DatabaseManager()
 # Conectar MQTT client con WebSocket manager
 mqtt_client.websocket_broadcast = websocket_manager.broadcast
 mqtt_client.db_manager = db
+mqtt_client.historial_reciente = historial_reciente
+websocket_manager.snapshot = snapshot_dashboard
+
+# Estado retenido en el broker: se republica cada vez que el cliente conecta
+def estado_autoritativo():
+    estado = db.obtener_ultimo_estado_actuadores()
+    acciones = acciones_de_estado(estado) if estado else {}
+    return sistema_estado['modo'], sistema_estado['configuracion'], acciones
+
+mqtt_client.estado_autoritativo = estado_autoritativo
+
+# Cola de salida persistente: el estado con QoS > 0 se guarda hasta que el broker lo confirma
+cola_salida = ColaSalida(db, mqtt_client.client)
+mqtt_client.cola_salida = cola_salida
+
+# Acciones programadas: por MQTT como cualquier comando y un broadcast por tick
+planificador.publicar = mqtt_client.publish_actuator_command
+planificador.broadcast = websocket_manager.broadcast_actuator_batch
+planificador.registrar_comandos = registrar_comandos_pendientes
+
+# Detección de anomalías en la ingesta
+alert_dispatcher = AlertDispatcher(db, websocket_manager.broadcast)
+mqtt_client.anomaly_detector = AnomalyDetector()
+mqtt_client.alert_dispatcher = alert_dispatcher
+
+# Presencia de dispositivos: online/offline con alertas y broadcast
+mqtt_client.monitor_dispositivos = monitor_dispositivos
+monitor_dispositivos.alert_dispatcher = alert_dispatcher
+monitor_dispositivos.broadcast = websocket_manager.broadcast
+
+# Profundidad de colas: se calcula al exponer, sin coste en la ingesta
+COLAS.labels("alertas").set_function(lambda: len(alert_dispatcher.pendientes))
+COLAS.labels("frames_parciales").set_function(lambda: len(mqtt_client.frame_assembler.parciales))
+COLAS.labels("broadcasts_en_vuelo").set_function(
+    lambda: mqtt_client.broadcasts_programados - mqtt_client.broadcasts_completados
+)
+COLAS.labels("mqtt_salida").set_function(lambda: len(cola_salida.pendientes))
+COLAS.labels("mqtt_en_vuelo").set_function(lambda: len(cola_salida.en_vuelo))
+WEBSOCKET_CLIENTES.set_function(lambda: len(websocket_manager.active_connections))
+DISPOSITIVOS.labels("online").set_function(lambda: monitor_dispositivos.conteo["online"])
+DISPOSITIVOS.labels("offline").set_function(lambda: monitor_dispositivos.conteo["offline"])
 
 # ==================== RUTAS WEB ====================
 
+def pagina(request, plantilla):
+    """HTML prerenderizado (o renderizado en cada petición sin el pipeline de assets)"""
+    if ASSETS_PIPELINE_ENABLED:
+        return assets.responder(assets.paginas[plantilla], request.headers)
+    return templates.TemplateResponse(plantilla, {"request": request})
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """Dashboard principal"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return pagina(request, "index.html")
 
 @app.get("/control", response_class=HTMLResponse)
 async def control(request: Request):
     """Página de control manual"""
-    return templates.TemplateResponse("control.html", {"request": request})
+    return pagina(request, "control.html")
 
 @app.get("/historial", response_class=HTMLResponse)
 async def historial(request: Request):
     """Página de historial"""
-    return templates.TemplateResponse("historial.html", {"request": request})
+    return pagina(request, "historial.html")
+
+if ASSETS_PIPELINE_ENABLED:
+    @app.api_route("/static/{ruta:path}", methods=["GET", "HEAD"])
+    async def estatico(ruta: str, request: Request):
+        """Estático preparado al arrancar: con huella, caché inmutable"""
+        recurso = assets.recursos.get(ruta)
+        if recurso is None:
+            raise HTTPException(404, "Archivo no encontrado")
+        return assets.responder(recurso, request.headers)
 
 # ==================== WEBSOCKET ====================
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """Endpoint WebSocket para comunicación en tiempo real"""
-    await websocket_manager.connect(websocket)
+    # Reconexión: /ws?epoch=...&last_seq=N reanuda desde el evento N
+    try:
+        last_seq = int(websocket.query_params["last_seq"])
+    except (KeyError, ValueError):
+        last_seq = None
+    # ...&filters=[...] reanuda ya suscrito (mismo formato que "subscribe")
+    try:
+        filtros = loads(websocket.query_params["filters"])
+    except KeyError:
+        filtros = None
+    except ValueError:
+        filtros = "inválido"  # connect responde con un error y no filtra
+    await websocket_manager.connect(
+        websocket, last_seq=last_seq, epoch=websocket.query_params.get("epoch"), filtros=filtros
+    )
     try:
         while True:
             # Recibir comandos del dashboard
@@ -71,15 +187,39 @@ async def websocket_endpoint(websocket: WebSocket):
             if data.get("type") == "control":
                 device = data.get("device")
                 value = data.get("value")
+                try:
+                    validar_accion(device, value)
+                except (ValueError, TypeError) as e:
+                    log.warning("Comando WebSocket rechazado: %s", e)
+                    await websocket_manager.send_personal_message(
+                        {"type": "error", "message": str(e)}, websocket
+                    )
+                    continue
                 
                 # Publicar por MQTT
                 mqtt_client.publish_actuator_command(device, value)
+                registrar_comandos_pendientes({device: value})
                 
                 # Broadcast a otros clientes
                 await websocket_manager.broadcast_actuator_change(device, value)
+            
+            # Filtrar los eventos que recibe esta conexión
+            elif data.get("type") in ("subscribe", "unsubscribe"):
+                await websocket_manager.subscribe(
+                    websocket, data, suscribir=data["type"] == "subscribe"
+                )
+            
+            # Aplicar una escena guardada (un solo broadcast para todos sus cambios)
+            elif data.get("type") == "scene":
+                try:
+                    await aplicar_escena(data.get("nombre"))
+                except HTTPException as e:
+                    await websocket_manager.send_personal_message(
+                        {"type": "error", "message": e.detail}, websocket
+                    )
                 
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        log.info("WebSocket cerrado: %s", e)
     finally:
         websocket_manager.disconnect(websocket)
 
@@ -95,39 +235,109 @@ async def health_check():
         "websocket": f"{len(websocket_manager.active_connections)} clients"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas de este worker en formato Prometheus"""
+    return Response(content=registro.exponer(), media_type=registro.CONTENT_TYPE)
+
 # ==================== EVENTOS ====================
 
 @app.on_event("startup")
 async def startup_event():
     """Inicializar servicios al arrancar"""
-    print("=" * 60)
-    print("🏠 SMARTHOME API - FASTAPI + MQTT + WEBSOCKET")
-    print("=" * 60)
+    # Logging asíncrono: los handlers escriben desde su propio thread
+    app.state.log_listener = configurar_logging()
+    log.info("SmartHome API - FastAPI + MQTT + WebSocket")
 
     # Capturar el event loop de FastAPI para MQTT
     import asyncio
-    mqtt_client.event_loop = asyncio.get_event_loop()
-    print("✓ Event loop asignado al cliente MQTT")
+    loop = asyncio.get_event_loop()
+    mqtt_client.event_loop = loop
+    log.info("Event loop asignado al cliente MQTT")
+
+    # Vigilar bloqueos del event loop
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start(loop)
+        log.info("Watchdog del event loop activo", extra={"umbral_ms": loop_watchdog.umbral * 1000})
+
+    # Estado compartido entre workers
+    await shared_state.start(loop)
+    log.info("Estado compartido: %s", type(shared_state).__name__)
 
     # Inicializar base de datos
     try:
         db.crear_tablas()
-        print("✓ Base de datos inicializada")
+        log.info("Base de datos inicializada")
+        # Modo y umbrales sobreviven al reinicio (y se republican retenidos al conectar)
+        for clave, valor in db.obtener_estado_sistema().items():
+            if clave in ("modo", "configuracion"):
+                sistema_estado[clave] = valor
+        # Lo que no confirmó el broker antes de cerrar se reenvía al conectar
+        cola_salida.cargar()
     except Exception as e:
-        print(f"✗ Error en base de datos: {e}")
+        log.error("Error en base de datos: %s", e)
+
+    # Historial reciente en memoria: solo si este proceso ve todas las
+    # inserciones (antes de conectar MQTT para no perder lecturas)
+    if HISTORY_BUFFER_ENABLED and STATE_BACKEND == "memory" and MQTT_INGEST_WORKERS == 0:
+        try:
+            await asyncio.to_thread(historial_reciente.cargar, db)
+        except Exception as e:
+            log.error("Error precargando historial reciente: %s", e)
 
-    # Conectar MQTT
+    app.state.alert_task = loop.create_task(alert_dispatcher.run())
+    app.state.liveness_task = loop.create_task(monitor_dispositivos.run())
+    app.state.outbox_task = loop.create_task(cola_salida.run())
+
+    # Conectar MQTT (solo el líder consume sensores; todos pueden publicar)
+    mqtt_client.ingesta_activa = False
     mqtt_client.connect()
     mqtt_client.loop_start()
-    print("✓ FastAPI iniciado")
+    if MQTT_INGEST_WORKERS > 0:
+        # La ingesta la hacen los procesos de mqtt.ingest_worker
+        app.state.leader_task = None
+        log.info("Ingesta delegada a %d workers", MQTT_INGEST_WORKERS)
+    else:
+        app.state.leader_task = loop.create_task(shared_state.run_leader_election(
+            "mqtt_ingester",
+            on_elected=mqtt_client.iniciar_ingesta,
+            on_revoked=mqtt_client.detener_ingesta
+        ))
+
+    # Planificador: solo el líder dispara las programaciones
+    app.state.scheduler_task = None
+    if SCHEDULER_ENABLED:
+        app.state.scheduler_task = loop.create_task(shared_state.run_leader_election(
+            "planificador",
+            on_elected=planificador.activar,
+            on_revoked=planificador.desactivar
+        ))
+    log.info("FastAPI iniciado")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Limpiar recursos al cerrar"""
-    print("\nCerrando servicios...")
+    log.info("Cerrando servicios")
+    import asyncio
+    app.state.alert_task.cancel()
+    app.state.liveness_task.cancel()
+    app.state.outbox_task.cancel()
+    await alert_dispatcher.flush()
+    if app.state.leader_task:
+        app.state.leader_task.cancel()
+        await asyncio.gather(app.state.leader_task, return_exceptions=True)
+    if app.state.scheduler_task:
+        app.state.scheduler_task.cancel()
+        await asyncio.gather(app.state.scheduler_task, return_exceptions=True)
+    await planificador.detener()
+    await shared_state.stop()
+    await asyncio.to_thread(gestor_trabajos.cerrar)
+    await loop_watchdog.stop()
+    await cola_salida.detener()
     mqtt_client.loop_stop()
     mqtt_client.disconnect()
-    print("✓ Servicios cerrados")
+    log.info("Servicios cerrados")
+    app.state.log_listener.stop()
 
 # ==================== MAIN ====================
 
@@ -2,9 +2,10 @@
 Pydantic models para validación de datos
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, Dict, List
 from datetime import datetime
+from mqtt.topics import MQTTTopics
 
 class SensorData(BaseModel):
     """Datos de sensores del ESP32"""
@@ -39,7 +40,97 @@ class ThresholdConfig(BaseModel):
     humedad_suelo_seco: int = Field(..., ge=0, le=100, description="Umbral suelo seco")
     humedad_suelo_humedo: int = Field(..., ge=0, le=100, description="Umbral suelo húmedo")
 
+class ConfiguracionParcial(BaseModel):
+    """Umbrales a cambiar (POST /api/configuracion acepta solo algunos, como app.py)"""
+    temp_activacion: Optional[float] = None
+    temp_desactivacion: Optional[float] = None
+    humedad_suelo_seco: Optional[int] = Field(None, ge=0, le=100)
+    humedad_suelo_humedo: Optional[int] = Field(None, ge=0, le=100)
+
 class DataPacket(BaseModel):
     """Paquete completo de datos (sensores + actuadores)"""
     sensores: SensorData
     actuadores: ActuadorData
+
+class PeticionPerfilado(BaseModel):
+    """Petición que se ejecuta bajo el perfilador (/api/admin/perfilar)"""
+    # Solo lectura: perfilar no debe poder accionar actuadores ni borrar datos
+    metodo: str = Field("GET", pattern="^GET$", description="Método HTTP")
+    ruta: str = Field(..., pattern="^/", description="Ruta con query string, ej. /api/historial?horas=24")
+    modo: str = Field("cprofile", pattern="^(cprofile|muestreo)$", description="Perfilador a usar")
+    limite: int = Field(40, ge=1, le=500, description="Entradas del informe")
+
+class PeticionTrabajo(BaseModel):
+    """Trabajo en segundo plano (/api/trabajos); cada tipo usa sus parámetros"""
+    tipo: str = Field(..., pattern="^(exportar_csv|exportar_columnar|analitica|limpieza)$", description="Tipo de trabajo")
+    horas: int = Field(24, ge=1, le=24 * 365, description="Ventana de las exportaciones y analitica")
+    paso: int = Field(300, ge=1, description="Segundos por intervalo (analitica)")
+    ventana: int = Field(12, ge=1, description="Puntos de la media móvil (analitica)")
+    dias: int = Field(30, ge=1, description="Retención en días (limpieza)")
+    formato: str = Field("arrow", pattern="^(arrow|parquet)$", description="Formato (exportar_columnar)")
+    particion: Optional[str] = Field(None, pattern="^(dispositivo|dia)$", description="Un archivo por dispositivo o día (exportar_columnar)")
+
+def validar_accion(dispositivo, valor):
+    """Comprobar que `valor` es válido para el actuador `dispositivo`"""
+    if dispositivo not in MQTTTopics.ACTUADORES:
+        raise ValueError(f"Dispositivo desconocido: {dispositivo}")
+    if dispositivo == "servo":
+        if isinstance(valor, bool) or not 0 <= valor <= 180:
+            raise ValueError("servo: ángulo entre 0 y 180")
+    # El receptor solo enciende o apaga el ventilador (ON/OFF), sin velocidad
+    elif not isinstance(valor, bool):
+        raise ValueError(f"{dispositivo}: se espera true/false")
+
+class Escena(BaseModel):
+    """Escena: acciones de actuadores que se aplican juntas (/api/escenas)"""
+    nombre: str = Field(..., pattern=r"^[\w\- ]{1,64}$", description="Nombre único de la escena")
+    descripcion: Optional[str] = Field(None, max_length=200)
+    acciones: Dict[str, bool | int] = Field(..., min_length=1, description="Dispositivo -> valor, ej. {\"ventilador\": true, \"servo\": 45}")
+
+    @field_validator("acciones")
+    @classmethod
+    def validar_acciones(cls, acciones):
+        for dispositivo, valor in acciones.items():
+            validar_accion(dispositivo, valor)
+        return acciones
+
+class Programacion(BaseModel):
+    """Acción programada (/api/programaciones)
+
+    - una_vez: en `inicio`
+    - diaria: a la `hora` local, solo los `dias` indicados (0 = lunes) o,
+      sin `dias`, todos
+    - intervalo: cada `cada` segundos desde `inicio` (por defecto ahora + cada)
+
+    Con `duracion`, pasados esos segundos se envía `valor_final` (por
+    defecto el contrario de un booleano).
+    """
+    nombre: Optional[str] = Field(None, max_length=64)
+    dispositivo: str = Field(..., description="ventilador, bomba, servo, led_cuarto1...")
+    valor: bool | int = Field(..., description="Valor del comando")
+    tipo: str = Field(..., pattern="^(una_vez|diaria|intervalo)$")
+    inicio: Optional[datetime] = Field(None, description="una_vez / primera ejecución de intervalo (hora local si no lleva zona)")
+    hora: Optional[str] = Field(None, pattern="^([01][0-9]|2[0-3]):[0-5][0-9]$", description="diaria: HH:MM")
+    dias: Optional[List[int]] = Field(None, description="diaria: días de la semana, 0 = lunes")
+    cada: Optional[int] = Field(None, ge=1, description="intervalo: segundos entre ejecuciones")
+    duracion: Optional[int] = Field(None, ge=1, description="Segundos hasta enviar valor_final")
+    valor_final: Optional[bool | int] = None
+
+    @model_validator(mode="after")
+    def validar_programacion(self):
+        validar_accion(self.dispositivo, self.valor)
+        requeridos = {"una_vez": "inicio", "diaria": "hora", "intervalo": "cada"}
+        if getattr(self, requeridos[self.tipo]) is None:
+            raise ValueError(f"{self.tipo}: falta '{requeridos[self.tipo]}'")
+        if self.dias is not None and not self.dias:
+            raise ValueError("dias: lista vacía (omitir para todos los días)")
+        if self.dias is not None and not all(0 <= d <= 6 for d in self.dias):
+            raise ValueError("dias: valores entre 0 (lunes) y 6 (domingo)")
+        if self.duracion is not None:
+            if self.valor_final is None:
+                if isinstance(self.valor, bool):
+                    self.valor_final = not self.valor
+                else:
+                    raise ValueError(f"{self.dispositivo}: indicar valor_final para la duración")
+            validar_accion(self.dispositivo, self.valor_final)
+        return self
@@ -0,0 +1,89 @@
+"""
+Serialización JSON rápida
+
+Usa orjson si está instalado y json de la biblioteca estándar si no.
+- dumps() devuelve bytes; dumps_texto() str (para WebSocket.send_text)
+- filas_json() convierte filas de sqlite3 directamente en bytes JSON
+- RespuestaJSON: respuesta de FastAPI que no pasa por jsonable_encoder
+"""
+
+import json
+import math
+from datetime import date, datetime
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+def _por_defecto(valor):
+    """Tipos que json no conoce (orjson ya maneja datetime y numpy)"""
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if hasattr(valor, "tolist"):  # escalares y arrays de NumPy
+        return valor.tolist()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+if orjson is not None:
+    MOTOR = "orjson"
+    _OPCIONES = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(valor):
+        return orjson.dumps(valor, default=_por_defecto, option=_OPCIONES)
+
+    loads = orjson.loads
+else:
+    MOTOR = "json"
+
+    def _sin_nan(valor):
+        # orjson escribe NaN/Infinity como null; json escribiría JSON inválido
+        if isinstance(valor, float) and not math.isfinite(valor):
+            return None
+        if isinstance(valor, dict):
+            return {k: _sin_nan(v) for k, v in valor.items()}
+        if isinstance(valor, (list, tuple)):
+            return [_sin_nan(v) for v in valor]
+        return valor
+
+    def dumps(valor):
+        try:
+            texto = json.dumps(valor, default=_por_defecto, ensure_ascii=False,
+                               separators=(",", ":"), allow_nan=False)
+        except ValueError:
+            texto = json.dumps(_sin_nan(valor), default=_por_defecto, ensure_ascii=False,
+                               separators=(",", ":"))
+        return texto.encode()
+
+    loads = json.loads
+
+
+def dumps_texto(valor):
+    """JSON como str, para frames de texto de WebSocket"""
+    return dumps(valor).decode()
+
+
+def filas_json(filas, columnas):
+    """Filas (tuplas o sqlite3.Row) → bytes de una lista de objetos JSON
+
+    Las columnas sobrantes de cada fila se ignoran.
+    """
+    return dumps([dict(zip(columnas, fila)) for fila in filas])
+
+
+class RespuestaJSON(Response):
+    """JSONResponse con el serializador rápido
+
+    Devolverla desde una ruta evita jsonable_encoder, que recorre el
+    contenido objeto por objeto antes de serializarlo.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,209 @@
+"""
+Presencia de dispositivos: último mensaje visto, online/offline
+
+Cada mensaje MQTT de un dispositivo online solo actualiza su `ultimo`
+(O(1), sin lock). El vencimiento está en una RuedaTemporizadores: cuando
+vence se mira `ultimo` y, si llegaron datos, se re-arma para
+ultimo + timeout; si no, pasa a offline. Así cada dispositivo cuesta un
+temporizador por periodo de timeout, no uno por mensaje.
+
+Los ESP32 pueden publicar "online" (birth) y dejar como LWT "offline" en
+casa/estado/<dispositivo>; entonces el cambio es inmediato.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from scheduler.wheel import RuedaTemporizadores
+from state.backend import shared_state
+from monitoring.logs import obtener_logger
+from config import (
+    DEVICE_TIMEOUT, DEVICE_TIMEOUTS, DEVICE_CHECK_INTERVAL, DEVICE_SNAPSHOT_INTERVAL
+)
+
+log = obtener_logger("monitoring")
+
+
+class _Dispositivo:
+    __slots__ = ("estado", "ultimo", "desde", "motivo", "timeout")
+
+    def __init__(self, timeout):
+        self.estado = "desconocido"
+        self.ultimo = None
+        self.desde = None
+        self.motivo = None
+        self.timeout = timeout
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat() if ts is not None else None
+
+
+class MonitorDispositivos:
+    """Online/offline por dispositivo con vencimientos en una rueda de temporizadores"""
+
+    def __init__(self, shard_id="principal", timeout=DEVICE_TIMEOUT, timeouts=DEVICE_TIMEOUTS,
+                 intervalo=DEVICE_CHECK_INTERVAL, intervalo_snapshot=DEVICE_SNAPSHOT_INTERVAL):
+        self.shard_id = shard_id
+        self.timeout = timeout
+        self.timeouts = timeouts
+        self.intervalo = intervalo
+        self.intervalo_snapshot = intervalo_snapshot
+        self.dispositivos = {}
+        self.conteo = {"online": 0, "offline": 0}
+        self.rueda = RuedaTemporizadores(time.time(), intervalo)
+        # Lo toman las transiciones y la revisión; el camino frecuente de visto() no
+        self._lock = threading.Lock()
+        # Cambios pendientes de notificar (thread MQTT -> event loop)
+        self.cambios = deque()
+        self.alert_dispatcher = None
+        self.broadcast = None
+
+    # ---------- Entradas (thread MQTT) ----------
+
+    def visto(self, dispositivo, ahora=None):
+        """Llegó un mensaje del dispositivo"""
+        if ahora is None:
+            ahora = time.time()
+        actual = self.dispositivos.get(dispositivo)
+        if actual is not None and actual.estado == "online":
+            actual.ultimo = ahora  # el temporizador se re-arma al vencer
+            return
+        with self._lock:
+            actual = self._obtener(dispositivo)
+            actual.ultimo = ahora
+            self.rueda.agregar(dispositivo, ahora + actual.timeout)
+            self._cambiar(dispositivo, actual, "online", "datos", ahora)
+
+    def estado_mqtt(self, dispositivo, payload, ahora=None):
+        """Mensaje de birth ("online") o LWT ("offline") en casa/estado/<dispositivo>"""
+        if ahora is None:
+            ahora = time.time()
+        online = payload.strip().lower() == "online"
+        with self._lock:
+            actual = self._obtener(dispositivo)
+            if online:
+                actual.ultimo = ahora
+                self.rueda.agregar(dispositivo, ahora + actual.timeout)
+                self._cambiar(dispositivo, actual, "online", "birth", ahora)
+            else:
+                self.rueda.cancelar(dispositivo)
+                self._cambiar(dispositivo, actual, "offline", "lwt", ahora)
+
+    def _obtener(self, dispositivo):
+        actual = self.dispositivos.get(dispositivo)
+        if actual is None:
+            actual = _Dispositivo(self.timeouts.get(dispositivo, self.timeout))
+            self.dispositivos[dispositivo] = actual
+        return actual
+
+    def _cambiar(self, dispositivo, actual, estado, motivo, ahora):
+        if actual.estado == estado:
+            return
+        anterior = actual.estado
+        if anterior in self.conteo:
+            self.conteo[anterior] -= 1
+        self.conteo[estado] += 1
+        actual.estado = estado
+        actual.desde = ahora
+        actual.motivo = motivo
+        self.cambios.append((dispositivo, anterior, estado, motivo, actual.ultimo))
+
+    def reiniciar(self):
+        """Olvidar todos los dispositivos (este worker deja de ingerir)"""
+        with self._lock:
+            for dispositivo in self.dispositivos:
+                self.rueda.cancelar(dispositivo)
+            self.dispositivos.clear()
+            self.conteo = {"online": 0, "offline": 0}
+            self.cambios.clear()
+
+    # ---------- Vencimientos (event loop) ----------
+
+    def revisar(self, ahora=None):
+        """Vencer los temporizadores hasta `ahora`; devuelve cuántos pasaron a offline"""
+        if ahora is None:
+            ahora = time.time()
+        offline = 0
+        with self._lock:
+            for dispositivo, _ in self.rueda.avanzar(ahora):
+                actual = self.dispositivos[dispositivo]
+                limite = actual.ultimo + actual.timeout
+                if limite > ahora:
+                    self.rueda.agregar(dispositivo, limite)
+                else:
+                    self._cambiar(dispositivo, actual, "offline", "timeout", ahora)
+                    offline += 1
+        return offline
+
+    async def notificar(self):
+        """Alertas y broadcast de los cambios pendientes; True si hubo alguno"""
+        lote = []
+        while self.cambios:
+            lote.append(self.cambios.popleft())
+        if not lote:
+            return False
+
+        alertas = []
+        for dispositivo, anterior, estado, motivo, ultimo in lote:
+            # El primer mensaje de un dispositivo no es una reconexión
+            if anterior != "desconocido":
+                alertas.append({
+                    "tipo": f"dispositivo_{estado}",
+                    "dispositivo": dispositivo,
+                    "mensaje": f"{dispositivo}: {estado} ({motivo})",
+                    "nivel": "info" if estado == "online" else "warning",
+                    "timestamp": time.time()
+                })
+            if self.broadcast is not None:
+                await self.broadcast({
+                    "type": "device_status",
+                    "device": dispositivo,
+                    "estado": estado,
+                    "motivo": motivo,
+                    "ultimo_visto": _iso(ultimo)
+                })
+        if alertas and self.alert_dispatcher is not None:
+            self.alert_dispatcher.encolar(alertas)
+        log.info("%d cambios de presencia", len(lote), extra=dict(self.conteo))
+        return True
+
+    async def run(self):
+        """Revisar vencimientos cada intervalo y publicar el listado de este shard"""
+        ultimo_snapshot = 0.0
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                self.revisar()
+                hubo_cambios = await self.notificar()
+                ahora = time.monotonic()
+                # Solo publica quien ingiere (los demás workers no ven dispositivos)
+                if self.dispositivos and (hubo_cambios or ahora - ultimo_snapshot >= self.intervalo_snapshot):
+                    ultimo_snapshot = ahora
+                    shared_state.set(f"dispositivos:{self.shard_id}", self.listar())
+            except Exception as e:
+                log.error("Error revisando presencia de dispositivos: %s", e)
+
+    # ---------- Consultas ----------
+
+    def listar(self):
+        """Estado de cada dispositivo visto"""
+        ahora = time.time()
+        return {
+            dispositivo: {
+                "estado": actual.estado,
+                "motivo": actual.motivo,
+                "ultimo_visto": _iso(actual.ultimo),
+                "segundos_sin_datos": round(ahora - actual.ultimo, 1) if actual.ultimo is not None else None,
+                "desde": _iso(actual.desde),
+                "timeout": actual.timeout
+            }
+            for dispositivo, actual in list(self.dispositivos.items())
+        }
+
+
+# Instancia global
+monitor_dispositivos = MonitorDispositivos()
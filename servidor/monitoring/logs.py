@@ -0,0 +1,179 @@
+"""
+Logging estructurado y asíncrono
+
+Los threads de MQTT y el event loop solo encolan el LogRecord (sin
+formatear); un QueueListener lo formatea y escribe en su propio thread.
+Si la cola se llena, el registro se descarta y se cuenta en /metrics.
+
+Cada componente tiene su logger (smarthome.mqtt, smarthome.websocket...)
+con el nivel de LOG_LEVELS. Los eventos por mensaje usan LogMuestreado:
+nivel DEBUG, 1 de cada N y como mucho M por segundo.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+from monitoring.metrics import LOGS_DESCARTADOS
+from config import (
+    LOG_FORMAT, LOG_LEVELS, LOG_QUEUE_SIZE,
+    LOG_DEBUG_SAMPLE_EVERY, LOG_DEBUG_MAX_PER_SECOND
+)
+
+RAIZ = "smarthome"
+
+# Atributos propios de LogRecord; el resto son campos estructurados (extra=)
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def obtener_logger(componente):
+    """Logger de un componente: smarthome.<componente>"""
+    return logging.getLogger(f"{RAIZ}.{componente}")
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro con los campos de `extra`"""
+
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "nivel": record.levelname,
+            "componente": record.name,
+            "mensaje": record.getMessage()
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD:
+                datos[clave] = valor
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormateadorTexto(logging.Formatter):
+    """Texto legible para desarrollo, con los campos de `extra` al final"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(name)s] %(message)s")
+
+    def format(self, record):
+        linea = super().format(record)
+        campos = {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_RECORD}
+        if campos:
+            linea += " " + " ".join(f"{k}={v}" for k, v in campos.items())
+        return linea
+
+
+class ColaHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el thread que loguea y nunca bloquea"""
+
+    def prepare(self, record):
+        # El formateo (getMessage, JSON) lo hace el thread del listener;
+        # por eso los args deben ser valores que no cambien después
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DESCARTADOS.inc()
+
+
+class LogMuestreado:
+    """Logs DEBUG por mensaje: 1 de cada `cada` y como mucho `por_segundo`
+
+    Si el nivel DEBUG está desactivado el coste es una comparación.
+    """
+
+    def __init__(self, logger, cada=LOG_DEBUG_SAMPLE_EVERY,
+                 por_segundo=LOG_DEBUG_MAX_PER_SECOND):
+        self.logger = logger
+        self.cada = cada
+        self.por_segundo = por_segundo
+        self.vistos = 0
+        self.omitidos = 0
+        self._segundo = 0
+        self._emitidos = 0
+
+    def debug(self, mensaje, *args):
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        self.vistos += 1
+        if self.vistos % self.cada:
+            self.omitidos += 1
+            return
+        segundo = int(time.monotonic())
+        if segundo != self._segundo:
+            self._segundo = segundo
+            self._emitidos = 0
+        if self._emitidos >= self.por_segundo:
+            self.omitidos += 1
+            return
+        self._emitidos += 1
+        omitidos, self.omitidos = self.omitidos, 0
+        self.logger.debug(mensaje, *args, extra={"omitidos": omitidos})
+
+
+def configurar_logging(formato=LOG_FORMAT, niveles=LOG_LEVELS, tamano_cola=LOG_QUEUE_SIZE,
+                       destino=None):
+    """Instalar el handler con cola en el logger raíz del proyecto
+
+    Devuelve el QueueListener (llamar a .stop() al cerrar para vaciar la cola).
+    """
+    salida = logging.StreamHandler(destino or sys.stdout)
+    salida.setFormatter(FormateadorJSON() if formato == "json" else FormateadorTexto())
+
+    cola = queue.Queue(maxsize=tamano_cola)
+    raiz = logging.getLogger(RAIZ)
+    for handler in list(raiz.handlers):
+        if isinstance(handler, ColaHandler):
+            raiz.removeHandler(handler)
+    raiz.addHandler(ColaHandler(cola))
+    raiz.propagate = False
+
+    for nombre, nivel in niveles.items():
+        logging.getLogger(nombre).setLevel(nivel)
+
+    listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+# ====================== TESTS ======================
+
+if __name__ == '__main__':
+    import contextlib
+    import io
+    import os
+
+    n = 100_000
+    print("Probando logging asíncrono...")
+
+    salida = io.StringIO()
+    listener = configurar_logging("json", {"smarthome": "DEBUG"}, destino=salida)
+    log = obtener_logger("prueba")
+    log.info("Mensaje con campos", extra={"topic": "casa/sensores/frame", "bytes": 16})
+    listener.stop()
+    print(f"✓ JSON: {salida.getvalue().strip()}")
+
+    with open(os.devnull, "w") as nulo:
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(nulo):
+            for i in range(n):
+                print(f"📨 MQTT: casa/sensores/temperatura = {i}")
+        por_print = (time.perf_counter() - inicio) / n * 1e6
+
+        for nivel in ("INFO", "DEBUG"):
+            listener = configurar_logging("json", {"smarthome": nivel}, destino=nulo)
+            muestreado = LogMuestreado(obtener_logger("prueba"))
+            inicio = time.perf_counter()
+            for i in range(n):
+                muestreado.debug("MQTT %s = %s", "casa/sensores/temperatura", i)
+            por_log = (time.perf_counter() - inicio) / n * 1e6
+            listener.stop()
+            print(f"✓ LogMuestreado con nivel {nivel}: {por_log:.2f} µs por mensaje")
+
+    print(f"✓ print a stdout: {por_print:.2f} µs por mensaje")
@@ -0,0 +1,290 @@
+"""
+Métricas del servidor en formato de texto de Prometheus
+
+Agregación en el propio proceso sin locks: cada serie guarda números
+planos que se actualizan con `+=`. Con el GIL es suficiente cuando cada
+serie la actualiza un solo thread (el de paho o el event loop); en el
+peor caso se pierde algún incremento, nunca se corrompe la serie.
+Los histogramas guardan cuentas por cubeta y se acumulan al exponer.
+
+En el camino caliente conviene guardar la serie hija (`labels(...)`)
+en lugar de buscarla en cada evento.
+"""
+
+import functools
+import time
+from bisect import bisect_left
+
+# Cubetas por defecto para latencias (segundos)
+CUBETAS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor):
+    if valor != valor:
+        return "NaN"
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor)
+
+
+# ==================== SERIES ====================
+
+class _SerieContador:
+    __slots__ = ("valor",)
+
+    def __init__(self):
+        self.valor = 0
+
+    def inc(self, cantidad=1):
+        self.valor += cantidad
+
+
+class _SerieGauge:
+    __slots__ = ("valor", "funcion")
+
+    def __init__(self):
+        self.valor = 0
+        self.funcion = None
+
+    def set(self, valor):
+        self.valor = valor
+
+    def set_function(self, funcion):
+        """Calcular el valor al exponer (profundidad de colas, clientes...)"""
+        self.funcion = funcion
+
+    def leer(self):
+        if self.funcion is None:
+            return self.valor
+        try:
+            return self.funcion()
+        except Exception:
+            return float("nan")
+
+
+class _SerieHistograma:
+    __slots__ = ("limites", "cuentas", "suma")
+
+    def __init__(self, limites):
+        self.limites = limites
+        # Una cuenta por cubeta más la de +Inf (sin acumular)
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+
+    def observe(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+
+
+# ==================== FAMILIAS ====================
+
+class _Familia:
+    """Métrica con cero o una etiqueta"""
+
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiqueta=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.series = {}
+        if etiqueta is None:
+            self.series[None] = self._nueva_serie()
+
+    def _nueva_serie(self):
+        raise NotImplementedError
+
+    def labels(self, valor):
+        """Serie para un valor de la etiqueta (se crea la primera vez)"""
+        serie = self.series.get(valor)
+        if serie is None:
+            serie = self.series.setdefault(valor, self._nueva_serie())
+        return serie
+
+    def _sufijo(self, valor, extra=""):
+        if self.etiqueta is None:
+            return f"{{{extra}}}" if extra else ""
+        etiquetas = f'{self.etiqueta}="{_escapar(valor)}"'
+        return f"{{{etiquetas},{extra}}}" if extra else f"{{{etiquetas}}}"
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for valor, serie in list(self.series.items()):
+            lineas.extend(self._lineas(valor, serie))
+        return lineas
+
+
+class Counter(_Familia):
+    tipo = "counter"
+
+    def _nueva_serie(self):
+        return _SerieContador()
+
+    def inc(self, cantidad=1):
+        self.series[None].inc(cantidad)
+
+    def _lineas(self, valor, serie):
+        return [f"{self.nombre}{self._sufijo(valor)} {_numero(serie.valor)}"]
+
+
+class Gauge(_Familia):
+    tipo = "gauge"
+
+    def _nueva_serie(self):
+        return _SerieGauge()
+
+    def set(self, valor):
+        self.series[None].set(valor)
+
+    def set_function(self, funcion):
+        self.series[None].set_function(funcion)
+
+    def _lineas(self, valor, serie):
+        return [f"{self.nombre}{self._sufijo(valor)} {_numero(serie.leer())}"]
+
+
+class Histogram(_Familia):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiqueta=None, cubetas=CUBETAS_LATENCIA):
+        self.cubetas = tuple(sorted(cubetas))
+        super().__init__(nombre, ayuda, etiqueta)
+
+    def _nueva_serie(self):
+        return _SerieHistograma(self.cubetas)
+
+    def observe(self, valor):
+        self.series[None].observe(valor)
+
+    def _lineas(self, valor, serie):
+        cuentas = list(serie.cuentas)
+        lineas = []
+        acumulado = 0
+        for limite, cuenta in zip(self.cubetas + (float("inf"),), cuentas):
+            acumulado += cuenta
+            le = f'le="{_numero(limite)}"'
+            lineas.append(f"{self.nombre}_bucket{self._sufijo(valor, le)} {acumulado}")
+        lineas.append(f"{self.nombre}_sum{self._sufijo(valor)} {_numero(serie.suma)}")
+        lineas.append(f"{self.nombre}_count{self._sufijo(valor)} {acumulado}")
+        return lineas
+
+
+# ==================== REGISTRO ====================
+
+class Registro:
+    """Conjunto de métricas que se exponen en /metrics"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+
+    def __init__(self):
+        self.familias = {}
+
+    def _registrar(self, familia):
+        existente = self.familias.get(familia.nombre)
+        if existente is not None:
+            return existente
+        self.familias[familia.nombre] = familia
+        return familia
+
+    def contador(self, nombre, ayuda, etiqueta=None):
+        return self._registrar(Counter(nombre, ayuda, etiqueta))
+
+    def gauge(self, nombre, ayuda, etiqueta=None):
+        return self._registrar(Gauge(nombre, ayuda, etiqueta))
+
+    def histograma(self, nombre, ayuda, etiqueta=None, cubetas=CUBETAS_LATENCIA):
+        return self._registrar(Histogram(nombre, ayuda, etiqueta, cubetas))
+
+    def exponer(self):
+        """Texto en formato de exposición de Prometheus"""
+        lineas = []
+        for familia in list(self.familias.values()):
+            lineas.extend(familia.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+def cronometrar(histograma):
+    """Decorador: observar la duración de cada llamada, etiquetada con el nombre del método"""
+    def decorador(funcion):
+        serie = histograma.labels(funcion.__name__)
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                serie.observe(time.perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+
+class MetricasHTTPMiddleware:
+    """Middleware ASGI: latencia por plantilla de ruta (/api/historial, no la URL)"""
+
+    def __init__(self, app, histograma):
+        self.app = app
+        self.histograma = histograma
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # El router deja la ruta resuelta en el scope
+            ruta = scope.get("route")
+            if ruta is not None:
+                nombre = ruta.path
+            elif scope["path"].startswith("/static/"):
+                nombre = "/static"
+            else:
+                nombre = "sin_ruta"
+            self.histograma.labels(nombre).observe(time.perf_counter() - inicio)
+
+
+# Instancia global
+registro = Registro()
+
+# ==================== MÉTRICAS DEL SERVIDOR ====================
+
+MQTT_MENSAJES = registro.contador(
+    "smarthome_mqtt_mensajes_total",
+    "Mensajes MQTT recibidos por clase de topic (sensor, frame, estado, confirmacion, otro)", "tipo")
+MQTT_ERRORES_PARSEO = registro.contador(
+    "smarthome_mqtt_errores_parseo_total", "Payloads MQTT que no se pudieron interpretar, por sensor", "sensor")
+MQTT_COMANDO_RTT = registro.histograma(
+    "smarthome_mqtt_comando_rtt_segundos",
+    "Desde que se publica un comando hasta que el receptor confirma el valor", "dispositivo",
+    cubetas=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+INGESTA_LATENCIA = registro.histograma(
+    "smarthome_ingesta_latencia_segundos", "Desde on_message hasta completar el broadcast")
+BD_LATENCIA = registro.histograma(
+    "smarthome_bd_latencia_segundos", "Latencia de DatabaseManager por método", "metodo")
+WEBSOCKET_ENVIO = registro.histograma(
+    "smarthome_websocket_envio_segundos", "Duración de cada envío a un cliente WebSocket")
+HTTP_LATENCIA = registro.histograma(
+    "smarthome_http_latencia_segundos", "Latencia de las peticiones HTTP por ruta", "ruta")
+COLAS = registro.gauge(
+    "smarthome_cola_profundidad", "Elementos pendientes en colas internas", "cola")
+DESCARTADOS = registro.contador(
+    "smarthome_mensajes_descartados_total", "Mensajes descartados por motivo", "motivo")
+DISPOSITIVOS = registro.gauge(
+    "smarthome_dispositivos", "Dispositivos por estado de presencia en este worker", "estado")
+WEBSOCKET_CLIENTES = registro.gauge(
+    "smarthome_websocket_clientes", "Clientes WebSocket conectados a este worker")
+LOOP_LAG = registro.histograma(
+    "smarthome_loop_lag_segundos", "Retraso del event loop en cada latido del watchdog")
+LOOP_BLOQUEOS = registro.contador(
+    "smarthome_loop_bloqueos_total", "Bloqueos del event loop por ruta o coroutine", "origen")
+LOGS_DESCARTADOS = registro.contador(
+    "smarthome_logs_descartados_total", "Registros de log descartados con la cola llena")
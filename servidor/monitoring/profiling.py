@@ -0,0 +1,330 @@
+"""
+Perfilado de peticiones HTTP
+
+- Desglose por ruta (PROFILING_ENABLED): validación (solve_dependencies),
+  handler, BD (cursores de DatabaseManager), serialización
+  (serialize_response) y otros (lectura del body, render, envío). Se
+  acumula por ruta y se devuelve en la cabecera Server-Timing.
+- perfilar_peticion(): ejecuta una petición dentro del proceso, a través
+  de la app ASGI, bajo cProfile o un muestreador de pilas.
+
+Las fases se miden envolviendo las funciones de fastapi.routing que
+usa el handler de cada ruta; sin un Perfil activo solo cuestan leer una
+ContextVar.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from monitoring.logs import obtener_logger
+
+log = obtener_logger("monitoring")
+
+# Perfil de la petición en curso (asyncio.to_thread copia el contexto)
+perfil_actual = ContextVar("perfil_actual", default=None)
+
+FASES = ("validacion", "handler", "bd", "serializacion", "otros")
+
+
+class Perfil:
+    """Tiempos (segundos) de una petición"""
+
+    __slots__ = ("validacion", "handler", "bd", "serializacion", "consultas")
+
+    def __init__(self):
+        self.validacion = 0.0
+        self.handler = 0.0
+        self.bd = 0.0
+        self.serializacion = 0.0
+        self.consultas = 0
+
+    def fases(self, total):
+        """Fases disjuntas: la BD se descuenta del handler"""
+        handler = max(0.0, self.handler - self.bd)
+        medido = self.validacion + handler + self.bd + self.serializacion
+        return {
+            "validacion": self.validacion,
+            "handler": handler,
+            "bd": self.bd,
+            "serializacion": self.serializacion,
+            "otros": max(0.0, total - medido)
+        }
+
+
+def registrar_bd(duracion, consultas=1):
+    """Sumar tiempo de BD a la petición en curso (llamado desde los cursores)"""
+    perfil = perfil_actual.get()
+    if perfil is not None:
+        perfil.bd += duracion
+        perfil.consultas += consultas
+
+
+# ==================== FASES DE FASTAPI ====================
+
+def _cronometrar_fase(funcion, fase):
+    async def envoltura(*args, **kwargs):
+        perfil = perfil_actual.get()
+        if perfil is None:
+            return await funcion(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return await funcion(*args, **kwargs)
+        finally:
+            setattr(perfil, fase, getattr(perfil, fase) + time.perf_counter() - inicio)
+    envoltura.__wrapped__ = funcion
+    return envoltura
+
+
+def instalar_fases():
+    """Envolver las funciones de fastapi.routing que delimitan cada fase"""
+    from fastapi import routing
+    for nombre, fase in (("solve_dependencies", "validacion"),
+                         ("run_endpoint_function", "handler"),
+                         ("serialize_response", "serializacion")):
+        funcion = getattr(routing, nombre, None)
+        if funcion is None:
+            log.warning("fastapi.routing.%s no existe: fase '%s' sin medir", nombre, fase)
+            continue
+        if getattr(funcion, "__wrapped__", None) is None:
+            setattr(routing, nombre, _cronometrar_fase(funcion, fase))
+
+
+# ==================== DESGLOSE POR RUTA ====================
+
+class Perfilador:
+    """Suma y máximo de cada fase por ruta"""
+
+    def __init__(self):
+        self.rutas = {}
+
+    def registrar(self, ruta, total, perfil):
+        datos = self.rutas.get(ruta)
+        if datos is None:
+            datos = self.rutas[ruta] = {
+                "peticiones": 0, "consultas": 0, "total": 0.0, "max": 0.0,
+                **{fase: 0.0 for fase in FASES}
+            }
+        datos["peticiones"] += 1
+        datos["consultas"] += perfil.consultas
+        datos["total"] += total
+        datos["max"] = max(datos["max"], total)
+        for fase, duracion in perfil.fases(total).items():
+            datos[fase] += duracion
+
+    def resumen(self):
+        """Media por petición de cada fase en ms, rutas más lentas primero"""
+        resultado = []
+        for ruta, datos in self.rutas.items():
+            n = datos["peticiones"]
+            resultado.append({
+                "ruta": ruta,
+                "peticiones": n,
+                "consultas_por_peticion": round(datos["consultas"] / n, 2),
+                "media_ms": round(datos["total"] / n * 1000, 3),
+                "max_ms": round(datos["max"] * 1000, 3),
+                "fases_ms": {fase: round(datos[fase] / n * 1000, 3) for fase in FASES}
+            })
+        resultado.sort(key=lambda r: r["media_ms"], reverse=True)
+        return resultado
+
+    def reiniciar(self):
+        self.rutas.clear()
+
+
+def _server_timing(fases, total):
+    partes = [f"{fase};dur={duracion * 1000:.2f}" for fase, duracion in fases.items()]
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes).encode()
+
+
+class PerfiladoMiddleware:
+    """Middleware ASGI: Perfil por petición, acumulado por ruta y en Server-Timing"""
+
+    def __init__(self, app, perfilador):
+        self.app = app
+        self.perfilador = perfilador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Si la petición viene de perfilar_peticion ya trae su Perfil
+        perfil = perfil_actual.get()
+        token = None
+        if perfil is None:
+            perfil = Perfil()
+            token = perfil_actual.set(perfil)
+        inicio = time.perf_counter()
+
+        async def send_con_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - inicio
+                cabeceras = list(message.get("headers", []))
+                cabeceras.append((b"server-timing", _server_timing(perfil.fases(total), total)))
+                message = {**message, "headers": cabeceras}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_timing)
+        finally:
+            total = time.perf_counter() - inicio
+            ruta = scope.get("route")
+            if ruta is not None:
+                self.perfilador.registrar(ruta.path, total, perfil)
+            if token is not None:
+                perfil_actual.reset(token)
+
+
+# ==================== PERFILADO BAJO DEMANDA ====================
+
+class MuestreadorPilas:
+    """Muestrea las pilas del event loop y de sus threads de to_thread"""
+
+    # Funciones más internas que indican que el thread está esperando
+    EN_ESPERA = {"select", "_worker", "wait", "_wait_for_tstate_lock"}
+
+    def __init__(self, thread_loop, intervalo=0.001):
+        self.thread_loop = thread_loop
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self.muestras = 0
+        self._detener = threading.Event()
+        self._thread = threading.Thread(target=self._muestrear, name="perfilado", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._thread.join()
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            nombres = {t.ident: t.name for t in threading.enumerate()}
+            self.muestras += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                if ident != self.thread_loop and not nombres.get(ident, "").startswith("asyncio"):
+                    continue
+                if frame.f_code.co_name in self.EN_ESPERA:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    frame = frame.f_back
+                self.pilas[tuple(reversed(pila))] += 1
+
+    def informe(self, limite):
+        propias = Counter()
+        totales = Counter()
+        for pila, n in self.pilas.items():
+            propias[pila[-1]] += n
+            for funcion in set(pila):
+                totales[funcion] += n
+        return {
+            "muestras": self.muestras,
+            "intervalo_ms": self.intervalo * 1000,
+            "funciones": [
+                {"funcion": funcion, "propio": n, "total": totales[funcion]}
+                for funcion, n in propias.most_common(limite)
+            ],
+            "pilas": [
+                {"pila": ";".join(pila), "muestras": n}
+                for pila, n in self.pilas.most_common(limite)
+            ]
+        }
+
+
+def _scope(metodo, ruta, cuerpo):
+    ruta, _, query = ruta.partition("?")
+    cabeceras = [(b"host", b"perfilado"), (b"content-length", str(len(cuerpo)).encode())]
+    if cuerpo:
+        cabeceras.append((b"content-type", b"application/json"))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": metodo,
+        "scheme": "http",
+        "path": ruta,
+        "raw_path": ruta.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": cabeceras,
+        "client": ("127.0.0.1", 0),
+        "server": ("perfilado", 80)
+    }
+
+
+async def perfilar_peticion(app, metodo, ruta, cuerpo=None, modo="cprofile", limite=40):
+    """Ejecutar una petición en este proceso bajo un perfilador
+
+    cProfile solo ve el thread del event loop (también cualquier otra
+    tarea que se ejecute a la vez); el muestreo incluye los threads de
+    asyncio.to_thread.
+    """
+    datos = b"" if cuerpo is None else json.dumps(cuerpo).encode()
+    pendiente = [{"type": "http.request", "body": datos, "more_body": False}]
+    respuesta = {"status": None, "bytes": 0}
+
+    async def receive():
+        if pendiente:
+            return pendiente.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            respuesta["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            respuesta["bytes"] += len(message.get("body", b""))
+
+    perfil = Perfil()
+    token = perfil_actual.set(perfil)
+    inicio = time.perf_counter()
+    try:
+        if modo == "muestreo":
+            with MuestreadorPilas(threading.get_ident()) as muestreador:
+                await app(_scope(metodo, ruta, datos), receive, send)
+            informe = muestreador.informe(limite)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await app(_scope(metodo, ruta, datos), receive, send)
+            finally:
+                profiler.disable()
+            salida = io.StringIO()
+            pstats.Stats(profiler, stream=salida).sort_stats("cumulative").print_stats(limite)
+            informe = salida.getvalue()
+    finally:
+        total = time.perf_counter() - inicio
+        perfil_actual.reset(token)
+
+    return {
+        "metodo": metodo,
+        "ruta": ruta,
+        "modo": modo,
+        "status": respuesta["status"],
+        "bytes": respuesta["bytes"],
+        "duracion_ms": round(total * 1000, 3),
+        "consultas": perfil.consultas,
+        "fases_ms": {fase: round(d * 1000, 3) for fase, d in perfil.fases(total).items()},
+        "informe": informe
+    }
+
+
+# Instancia global
+perfilador = Perfilador()
@@ -0,0 +1,190 @@
+"""
+Watchdog del event loop
+
+Un latido en el event loop mide cuánto se retrasa un sleep corto. Un
+thread auxiliar vigila ese latido y, si se retrasa más del umbral,
+captura el stack del thread del loop con sys._current_frames() mientras
+sigue bloqueado, para saber qué ruta o coroutine lo tenía ocupado
+(sqlite síncrono, prints, serialización grande...).
+"""
+
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from monitoring.metrics import LOOP_LAG, LOOP_BLOQUEOS
+from monitoring.logs import obtener_logger
+from config import (
+    LOOP_WATCHDOG_INTERVAL, LOOP_LAG_THRESHOLD, LOOP_WATCHDOG_HISTORY
+)
+
+log = obtener_logger("monitoring")
+
+# Raíz del servidor: los frames de aquí son "nuestros" (rutas, MQTT, BD)
+PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MONITORING = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopWatchdog:
+    """Mide el retraso del event loop y registra quién lo bloquea"""
+
+    def __init__(self, intervalo=LOOP_WATCHDOG_INTERVAL, umbral=LOOP_LAG_THRESHOLD,
+                 historial=LOOP_WATCHDOG_HISTORY):
+        self.intervalo = intervalo
+        self.umbral = umbral
+        self.hallazgos = deque(maxlen=historial)
+        self.loop = None
+        self.thread_loop = None
+        self.ultimo_latido = None
+        self.ultimo_retraso = 0.0
+        self.max_retraso = 0.0
+        self.latidos = 0
+
+        # Captura en curso (la escribe el thread, la cierra el loop)
+        self._episodio = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._task = None
+        self._thread = None
+
+    # ---------- Ciclo de vida ----------
+
+    def start(self, loop):
+        """Arrancar el latido en `loop` y el thread vigilante"""
+        self.loop = loop
+        self._detener.clear()
+        self._task = loop.create_task(self._latir())
+        self._thread = threading.Thread(target=self._vigilar, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._detener.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    # ---------- Event loop ----------
+
+    async def _latir(self):
+        self.thread_loop = threading.get_ident()
+        self.ultimo_latido = time.perf_counter()
+        while True:
+            esperado = time.perf_counter() + self.intervalo
+            await asyncio.sleep(self.intervalo)
+            ahora = time.perf_counter()
+            retraso = max(0.0, ahora - esperado)
+            self.ultimo_latido = ahora
+            self.ultimo_retraso = retraso
+            self.latidos += 1
+            if retraso > self.max_retraso:
+                self.max_retraso = retraso
+            LOOP_LAG.observe(retraso)
+            if retraso >= self.umbral:
+                self._cerrar_episodio(retraso)
+
+    def _cerrar_episodio(self, retraso):
+        with self._lock:
+            episodio = self._episodio
+            self._episodio = None
+        if episodio is None:
+            # El bloqueo terminó antes de que el thread pudiera verlo
+            episodio = {
+                "detectado": datetime.now().isoformat(),
+                "ruta": None,
+                "coroutine": None,
+                "task": None,
+                "ubicacion": None,
+                "stack": []
+            }
+        episodio["retraso_ms"] = round(retraso * 1000, 1)
+        origen = episodio["ruta"] or episodio["coroutine"] or "desconocido"
+        LOOP_BLOQUEOS.labels(origen).inc()
+        self.hallazgos.append(episodio)
+        log.warning("Event loop bloqueado %.1f ms por %s", episodio["retraso_ms"], origen,
+                    extra={"ubicacion": episodio["ubicacion"]})
+
+    # ---------- Thread vigilante ----------
+
+    def _vigilar(self):
+        while not self._detener.wait(self.intervalo / 2):
+            if self.ultimo_latido is None or self.thread_loop is None:
+                continue
+            atraso = time.perf_counter() - self.ultimo_latido - self.intervalo
+            if atraso < self.umbral or self._episodio is not None:
+                continue
+            try:
+                episodio = self._capturar()
+            except Exception as e:
+                log.error("Error capturando el stack del event loop: %s", e)
+                continue
+            if episodio is None:
+                continue
+            with self._lock:
+                if self._episodio is None:
+                    self._episodio = episodio
+
+    def _capturar(self):
+        """Stack actual del thread del event loop, con su ruta y coroutine"""
+        frame = sys._current_frames().get(self.thread_loop)
+        if frame is None:
+            return None
+
+        ruta = None
+        ubicacion = None
+        coroutine = None
+        actual = frame
+        while actual is not None:
+            codigo = actual.f_code
+            # Primer frame propio (de dentro hacia fuera) fuera de monitoring
+            if (ubicacion is None and codigo.co_filename.startswith(PROYECTO)
+                    and not codigo.co_filename.startswith(MONITORING)):
+                ubicacion = (f"{os.path.relpath(codigo.co_filename, PROYECTO)}:"
+                             f"{actual.f_lineno} en {codigo.co_name}")
+            # Coroutine más interna: la que no cedió el control
+            if coroutine is None and codigo.co_flags & inspect.CO_COROUTINE:
+                coroutine = getattr(codigo, "co_qualname", codigo.co_name)
+            # Las capas ASGI guardan el scope de la petición en curso
+            scope = actual.f_locals.get("scope") if ruta is None else None
+            if isinstance(scope, dict) and scope.get("type") in ("http", "websocket"):
+                plantilla = scope.get("route")
+                ruta = f"{scope.get('method', 'WS')} " + (
+                    plantilla.path if plantilla is not None else scope.get("path", "?")
+                )
+            actual = actual.f_back
+
+        task = asyncio.current_task(self.loop)
+
+        return {
+            "detectado": datetime.now().isoformat(),
+            "ruta": ruta,
+            "coroutine": coroutine,
+            "task": task.get_name() if task is not None else None,
+            "ubicacion": ubicacion,
+            "stack": traceback.format_stack(frame)[-15:]
+        }
+
+    # ---------- Consulta ----------
+
+    def resumen(self):
+        """Estado actual y últimos bloqueos (más reciente primero)"""
+        return {
+            "activo": self._task is not None and not self._task.done(),
+            "intervalo_ms": self.intervalo * 1000,
+            "umbral_ms": self.umbral * 1000,
+            "latidos": self.latidos,
+            "ultimo_retraso_ms": round(self.ultimo_retraso * 1000, 1),
+            "max_retraso_ms": round(self.max_retraso * 1000, 1),
+            "bloqueos": list(reversed(self.hallazgos))
+        }
+
+
+# Instancia global
+loop_watchdog = LoopWatchdog()
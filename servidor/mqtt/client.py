@@ -5,163 +5,401 @@ Cliente MQTT para comunicación con ESP32
 import paho.mqtt.client as mqtt
 import json
 import asyncio
+import os
+import time
+import zlib
 from datetime import datetime
 from mqtt.topics import MQTTTopics
-from config import MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_CLIENT_ID
+from mqtt.frames import parse_frame, FrameAssembler
+from state.backend import shared_state
+from monitoring.metrics import (
+    MQTT_MENSAJES, MQTT_ERRORES_PARSEO, INGESTA_LATENCIA, DESCARTADOS
+)
+from monitoring.logs import obtener_logger, LogMuestreado
+from config import (
+    MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_CLIENT_ID,
+    STATE_BACKEND, DEFAULT_DEVICE_ID, MQTT_QOS_ESTADO, MQTT_RETAIN_ESTADO,
+    MQTT_RECONNECT_MIN, MQTT_RECONNECT_MAX
+)
+
+log = obtener_logger("mqtt")
 
 class MQTTClient:
-    def __init__(self):
-        self.client = mqtt.Client(client_id=MQTT_CLIENT_ID)
+    def __init__(self, client_id=None, protocol=mqtt.MQTTv311,
+                 suscripcion=MQTTTopics.SENSORES_ALL, particion=None,
+                 shard_id="principal", suscripcion_estado=MQTTTopics.ESTADO_ALL):
+        if client_id is None:
+            # Con varios workers cada proceso necesita su propio client_id
+            client_id = MQTT_CLIENT_ID
+            if STATE_BACKEND != "memory":
+                client_id = f"{MQTT_CLIENT_ID}_{os.getpid()}"
+        self.client = mqtt.Client(client_id=client_id, protocol=protocol)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        self.client.reconnect_delay_set(MQTT_RECONNECT_MIN, MQTT_RECONNECT_MAX)
+
+        # Topics de sensores y de presencia, y partición (indice, total) por hash de dispositivo
+        self.suscripcion = suscripcion
+        self.suscripcion_estado = suscripcion_estado
+        self.particion = particion
+        self.shard_id = shard_id
 
-        # Almacenar últimos valores de sensores
-        self.sensor_data = {
-            "temperatura": None,
-            "humedad": None,
-            "humedad_suelo": None,
-            "timestamp": None
-        }
+        # Almacenar últimos valores de sensores por dispositivo
+        self.sensor_data = {}
+        self.frame_assembler = FrameAssembler()
 
         # Callback para broadcast a WebSocket (se asigna desde main.py)
         self.websocket_broadcast = None
         self.db_manager = None
+        self.historial_reciente = None  # analytics.ring_buffer (se asigna desde main.py)
         self.event_loop = None  # Event loop de FastAPI
+
+        # Detección de anomalías (se asignan desde main.py)
+        self.anomaly_detector = None
+        self.alert_dispatcher = None
+
+        # Presencia de dispositivos (monitoring.liveness, se asigna desde main.py)
+        self.monitor_dispositivos = None
+        
+        # Callable -> (modo, configuracion, acciones) que se republica retenido
+        # al conectar (se asigna desde main.py; los workers de ingesta no publican)
+        self.estado_autoritativo = None
+        
+        # mqtt.outbox.ColaSalida para publicar con QoS > 0 (se asigna desde main.py)
+        self.cola_salida = None
+
+        # Solo el worker líder se suscribe a los sensores (ver state.backend)
+        self.ingesta_activa = True
+
+        # Broadcasts en vuelo: cada contador lo escribe un solo thread
+        self.broadcasts_programados = 0
+        self.broadcasts_completados = 0
+        self._broadcasts_fallidos = DESCARTADOS.labels("broadcast_error")
+
+        # Logs por mensaje, muestreados (ver monitoring.logs)
+        self._log_mensajes = LogMuestreado(log)
+        self._log_guardados = LogMuestreado(log)
+        self._log_broadcasts = LogMuestreado(log)
         
     def connect(self):
-        """Conectar al broker MQTT"""
+        """Conectar al broker MQTT
+        
+        La conexión la hace el thread de loop_start, que reintenta con
+        espera exponencial (MQTT_RECONNECT_MIN..MAX) aunque el broker no
+        esté disponible al arrancar.
+        """
         try:
-            self.client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
-            print(f"✓ Conectando a MQTT broker: {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+            self.client.connect_async(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
+            log.info("Conectando a MQTT broker %s:%s", MQTT_BROKER_HOST, MQTT_BROKER_PORT)
         except Exception as e:
-            print(f"✗ Error conectando a MQTT: {e}")
+            log.error("Error conectando a MQTT: %s", e)
             
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback cuando se conecta al broker"""
         if rc == 0:
-            print("✓ MQTT conectado exitosamente")
+            log.info("MQTT conectado")
+            if self.cola_salida is not None:
+                self.client.subscribe(MQTTTopics.CONFIRMACION_ALL, 1)
+            # Tras reiniciar el servidor o el broker, dejar el estado retenido al día
+            self.republicar_estado()
             # Suscribirse a todos los topics de sensores
-            self.client.subscribe(MQTTTopics.SENSORES_ALL)
-            print(f"✓ Suscrito a: {MQTTTopics.SENSORES_ALL}")
+            if self.ingesta_activa:
+                self._suscribir()
+            if self.cola_salida is not None:
+                self.cola_salida.enviar()
         else:
-            print(f"✗ Error de conexión MQTT, código: {rc}")
+            log.error("Error de conexión MQTT", extra={"rc": rc})
+            
+    def iniciar_ingesta(self):
+        """Empezar a consumir sensores (este worker es el líder)"""
+        self.ingesta_activa = True
+        if self.client.is_connected():
+            self._suscribir()
+            
+    def _suscribir(self):
+        """Sensores y presencia (birth/LWT) de los dispositivos"""
+        self.client.subscribe([(self.suscripcion, 0), (self.suscripcion_estado, 0)])
+        log.info("Suscrito a %s y %s", self.suscripcion, self.suscripcion_estado)
+            
+    def detener_ingesta(self):
+        """Dejar de consumir sensores (otro worker es el líder)"""
+        self.ingesta_activa = False
+        if self.monitor_dispositivos is not None:
+            self.monitor_dispositivos.reiniciar()
+        if self.client.is_connected():
+            self.client.unsubscribe([self.suscripcion, self.suscripcion_estado])
+            log.info("Desuscrito de %s y %s", self.suscripcion, self.suscripcion_estado)
             
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
         """Callback cuando se desconecta"""
         if rc != 0:
-            print(f"⚠️ Desconexión inesperada de MQTT. Reconectando...")
+            log.warning("Desconexión inesperada de MQTT, reconectando", extra={"rc": rc})
+            
+    def on_publish(self, client, userdata, mid):
+        """Callback cuando el broker confirma un mensaje (PUBACK/PUBCOMP con QoS > 0)"""
+        if self.cola_salida is not None:
+            self.cola_salida.publicado(mid)
             
     def on_message(self, client, userdata, msg):
         """Callback cuando llega un mensaje MQTT"""
+        inicio = time.perf_counter()
         topic = msg.topic
-        payload = msg.payload.decode()
         
-        print(f"📨 MQTT: {topic} = {payload}")
+        # Métricas por clase de topic: con el dispositivo no tendrían límite
+        dispositivo, sensor = MQTTTopics.parse_sensor_topic(topic)
+        MQTT_MENSAJES.labels(MQTTTopics.tipo_topic(topic, sensor)).inc()
+        if dispositivo is None:
+            self._mensaje_estado(topic, msg.payload)
+            return
+        if not self.es_de_mi_particion(dispositivo):
+            return
+        if self.monitor_dispositivos is not None:
+            self.monitor_dispositivos.visto(dispositivo)
+        
+        # Frame completo: un mensaje, una inserción, un broadcast
+        if sensor == "frame":
+            self._log_mensajes.debug("MQTT %s (%d bytes)", topic, len(msg.payload))
+            frame = parse_frame(msg.payload)
+            if frame is None:
+                MQTT_ERRORES_PARSEO.labels(sensor).inc()
+                log.warning("Frame inválido en %s", topic)
+                return
+            self.handle_frame(dispositivo, *frame, inicio=inicio)
+            return
         
-        # Procesar según el topic
+        payload = msg.payload.decode()
+        self._log_mensajes.debug("MQTT %s = %s", topic, payload)
+        
+        # Topics separados: se unen en un frame con el ensamblador
         try:
-            if topic == MQTTTopics.TEMPERATURA:
-                self.handle_temperatura(float(payload))
-            elif topic == MQTTTopics.HUMEDAD:
-                self.handle_humedad(float(payload))
-            elif topic == MQTTTopics.HUMEDAD_SUELO:
-                self.handle_humedad_suelo(int(payload))
+            if sensor == "temperatura" or sensor == "humedad":
+                valor = float(payload)
+            elif sensor == "humedad_suelo":
+                valor = int(payload)
+            else:
+                return
         except ValueError as e:
-            print(f"✗ Error procesando payload: {e}")
-            
-    def handle_temperatura(self, value):
-        """Procesar temperatura"""
-        self.sensor_data["temperatura"] = value
-        self.sensor_data["timestamp"] = datetime.now().isoformat()
-        self._broadcast_sensor_update("temperatura", value)
-        
-    def handle_humedad(self, value):
-        """Procesar humedad ambiental"""
-        self.sensor_data["humedad"] = value
-        self.sensor_data["timestamp"] = datetime.now().isoformat()
-        self._broadcast_sensor_update("humedad", value)
-        
-    def handle_humedad_suelo(self, value):
-        """Procesar humedad del suelo"""
-        self.sensor_data["humedad_suelo"] = value
-        self.sensor_data["timestamp"] = datetime.now().isoformat()
-        self._broadcast_sensor_update("humedad_suelo", value)
-        
-        # Si tenemos todos los datos, guardar en BD
-        if all(v is not None for v in [
-            self.sensor_data["temperatura"],
-            self.sensor_data["humedad"],
-            self.sensor_data["humedad_suelo"]
-        ]):
-            self._save_to_database()
-            
-    def _broadcast_sensor_update(self, sensor_type, value):
-        """Enviar actualización por WebSocket"""
+            MQTT_ERRORES_PARSEO.labels(sensor).inc()
+            log.warning("Payload inválido en %s: %s", topic, e)
+            return
+            
+        frame = self.frame_assembler.agregar(dispositivo, sensor, valor)
+        if frame is not None:
+            self.handle_frame(dispositivo, *frame, inicio=inicio)
+            
+    def _mensaje_estado(self, topic, payload):
+        """Birth ("online") o LWT ("offline") de un dispositivo, o
+        confirmación de un actuador"""
+        if self.cola_salida is not None and topic.startswith("casa/confirmacion/"):
+            self.cola_salida.confirmar(topic, payload.decode(errors="replace"))
+            return
+        dispositivo = MQTTTopics.parse_status_topic(topic)
+        if (dispositivo is None or self.monitor_dispositivos is None
+                or not self.es_de_mi_particion(dispositivo)):
+            return
+        self.monitor_dispositivos.estado_mqtt(dispositivo, payload.decode(errors="replace"))
+            
+    def _detectar_anomalias(self, dispositivo, estado):
+        """Pasar la lectura por el detector y encolar las alertas"""
+        if self.anomaly_detector is None:
+            return
+        for sensor in MQTTTopics.SENSORES:
+            alertas = self.anomaly_detector.procesar(dispositivo, sensor, estado[sensor])
+            if alertas and self.alert_dispatcher:
+                self.alert_dispatcher.encolar(alertas)
+            
+    def es_de_mi_particion(self, dispositivo):
+        """Comprobar si el dispositivo corresponde a este worker"""
+        if self.particion is None:
+            return True
+        indice, total = self.particion
+        return zlib.crc32(dispositivo.encode()) % total == indice
+        
+    def _estado_dispositivo(self, dispositivo):
+        """Últimos valores de un dispositivo (se crean al primer mensaje)"""
+        estado = self.sensor_data.get(dispositivo)
+        if estado is None:
+            estado = {
+                "temperatura": None,
+                "humedad": None,
+                "humedad_suelo": None,
+                "timestamp": None
+            }
+            self.sensor_data[dispositivo] = estado
+        return estado
+            
+    def handle_frame(self, dispositivo, temperatura, humedad, humedad_suelo,
+                     timestamp_dispositivo=None, inicio=None):
+        """Procesar una lectura completa de un dispositivo
+        
+        `inicio` es el perf_counter de on_message, para medir la latencia
+        hasta el broadcast.
+        """
+        estado = self._estado_dispositivo(dispositivo)
+        estado["temperatura"] = temperatura
+        estado["humedad"] = humedad
+        estado["humedad_suelo"] = humedad_suelo
+        estado["timestamp"] = datetime.now().isoformat()
+        
+        self._detectar_anomalias(dispositivo, estado)
+        self._save_to_database(dispositivo)
+        self._broadcast_sensor_data(dispositivo, estado, inicio)
+            
+    async def _broadcast_cronometrado(self, data, inicio):
+        """Broadcast en el event loop, registrando la latencia de ingesta"""
+        try:
+            await self.websocket_broadcast(data)
+        except Exception as e:
+            self._broadcasts_fallidos.inc()
+            log.error("Error en broadcast: %s", e)
+        finally:
+            self.broadcasts_completados += 1
+            INGESTA_LATENCIA.observe(time.perf_counter() - inicio)
+            
+    def _broadcast_sensor_data(self, dispositivo, estado, inicio=None):
+        """Enviar la lectura completa por WebSocket"""
         if self.websocket_broadcast and self.event_loop:
             data = {
-                "type": "sensor_update",
-                "sensor": sensor_type,
-                "value": value,
-                "timestamp": self.sensor_data["timestamp"]
+                "type": "sensor_data",
+                "device": dispositivo,
+                "data": {
+                    "sensores": {
+                        "temperatura": estado["temperatura"],
+                        "humedad": estado["humedad"],
+                        "humedad_suelo": estado["humedad_suelo"]
+                    },
+                    "timestamp": estado["timestamp"]
+                }
             }
+            if inicio is None:
+                inicio = time.perf_counter()
             # Ejecutar coroutine desde thread externo usando el event loop de FastAPI
             try:
                 asyncio.run_coroutine_threadsafe(
-                    self.websocket_broadcast(data),
+                    self._broadcast_cronometrado(data, inicio),
                     self.event_loop
                 )
-                print(f"✓ Broadcast enviado: {sensor_type} = {value}")
+                self.broadcasts_programados += 1
+                self._log_broadcasts.debug("Broadcast programado: %s", dispositivo)
             except Exception as e:
-                print(f"✗ Error en broadcast: {e}")
+                self._broadcasts_fallidos.inc()
+                log.error("Error programando broadcast: %s", e)
                 
-    def _save_to_database(self):
+    def _save_to_database(self, dispositivo=DEFAULT_DEVICE_ID):
         """Guardar datos completos en base de datos"""
+        estado = self.sensor_data[dispositivo]
         if self.db_manager:
             try:
-                self.db_manager.insertar_lectura_sensores(
-                    temperatura=self.sensor_data["temperatura"],
-                    humedad=self.sensor_data["humedad"],
-                    movimiento=0,
-                    distancia=None,
-                    humedad_suelo=self.sensor_data["humedad_suelo"]
+                lectura = {
+                    "temperatura": estado["temperatura"],
+                    "humedad": estado["humedad"],
+                    "movimiento": 0,
+                    "distancia": None,
+                    "humedad_suelo": estado["humedad_suelo"]
+                }
+                lectura_id = self.db_manager.insertar_lectura_sensores(
+                    dispositivo=dispositivo, **lectura
                 )
-                print("✓ Datos guardados en BD")
+                if self.historial_reciente is not None:
+                    self.historial_reciente.agregar(dispositivo, lectura_id, lectura)
+                self._log_guardados.debug("Lectura guardada: %s", dispositivo)
             except Exception as e:
-                print(f"✗ Error guardando en BD: {e}")
+                log.error("Error guardando en BD: %s", e)
                 
-    def publish(self, topic, payload):
+        # Publicar el último estado de este shard para que la API lo combine
+        try:
+            shared_state.set(f"sensores:{self.shard_id}", self.sensor_data)
+        except Exception as e:
+            log.error("Error publicando estado del shard: %s", e)
+                
+    def publish(self, topic, payload, qos=0, retain=False):
         """Publicar mensaje MQTT"""
         try:
-            result = self.client.publish(topic, payload)
+            result = self.client.publish(topic, payload, qos=qos, retain=retain)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"📤 MQTT publicado: {topic} = {payload}")
+                log.info("MQTT publicado %s = %s", topic, payload)
             else:
-                print(f"✗ Error publicando MQTT: {result.rc}")
+                log.error("Error publicando MQTT en %s", topic, extra={"rc": result.rc})
         except Exception as e:
-            print(f"✗ Error en publish: {e}")
+            log.error("Error en publish: %s", e)
+            
+    def publicar_estado(self, topic, payload):
+        """Publicar estado para los ESP32 (modo, configuración, actuadores):
+        retenido y con MQTT_QOS_ESTADO, por la cola de salida si la hay"""
+        if self.cola_salida is not None and MQTT_QOS_ESTADO > 0:
+            self.cola_salida.encolar([(topic, payload)], MQTT_QOS_ESTADO, MQTT_RETAIN_ESTADO)
+            log.info("MQTT encolado %s = %s", topic, payload)
+            return
+        self.publish(topic, payload, qos=MQTT_QOS_ESTADO, retain=MQTT_RETAIN_ESTADO)
+        
+    def republicar_estado(self):
+        """Publicar retenido todo el estado autoritativo del servidor
+        
+        Un ESP32 que se suscribe después lo recibe del broker sin pedir
+        nada al servidor.
+        """
+        if self.estado_autoritativo is None:
+            return
+        try:
+            modo, configuracion, acciones = self.estado_autoritativo()
+        except Exception as e:
+            log.error("Error leyendo el estado a republicar: %s", e)
+            return
+        self.publicar_estado(MQTTTopics.MODO, modo)
+        self.publicar_estado(MQTTTopics.CONFIG, json.dumps(configuracion))
+        self.publish_actuator_commands(list(acciones.items()))
+            
+    @staticmethod
+    def payload_actuador(value):
+        """Valor de un comando → payload MQTT (ON/OFF para booleanos)"""
+        if isinstance(value, bool):
+            return "ON" if value else "OFF"
+        return str(value)
             
     def publish_actuator_command(self, device, value):
         """Publicar comando a actuador"""
-        topic_map = {
-            "ventilador": MQTTTopics.VENTILADOR,
-            "bomba": MQTTTopics.BOMBA,
-            "servo": MQTTTopics.SERVO,
-            "led_cuarto1": MQTTTopics.LED_CUARTO1,
-            "led_cuarto2": MQTTTopics.LED_CUARTO2,
-            "led_cuarto3": MQTTTopics.LED_CUARTO3,
-        }
-        
-        topic = topic_map.get(device)
+        topic = MQTTTopics.ACTUADORES.get(device)
         if topic:
-            # Convertir valor a string apropiado
-            if isinstance(value, bool):
-                payload = "ON" if value else "OFF"
-            else:
-                payload = str(value)
-            self.publish(topic, payload)
+            self.publicar_estado(topic, self.payload_actuador(value))
         else:
-            print(f"✗ Dispositivo desconocido: {device}")
+            log.warning("Dispositivo desconocido: %s", device)
+            
+    def publish_actuator_commands(self, comandos):
+        """Publicar varios comandos (dispositivo, valor) de una vez (escenas)
+        
+        Se encolan todos (en la cola de salida o en el cliente paho, que
+        los escribe desde su thread de red) con una sola línea de log.
+        Devuelve cuántos se encolaron.
+        """
+        mensajes = []
+        for device, value in comandos:
+            topic = MQTTTopics.ACTUADORES.get(device)
+            if topic is None:
+                log.warning("Dispositivo desconocido: %s", device)
+                continue
+            mensajes.append((topic, self.payload_actuador(value)))
+        if self.cola_salida is not None and MQTT_QOS_ESTADO > 0:
+            encolados = self.cola_salida.encolar(mensajes, MQTT_QOS_ESTADO, MQTT_RETAIN_ESTADO)
+            log.info("MQTT encolados %d comandos de actuadores", encolados, extra={"comandos": len(comandos)})
+            return encolados
+        
+        encolados = 0
+        for topic, payload in mensajes:
+            try:
+                result = self.client.publish(
+                    topic, payload, qos=MQTT_QOS_ESTADO, retain=MQTT_RETAIN_ESTADO
+                )
+            except Exception as e:
+                log.error("Error en publish: %s", e)
+                continue
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                encolados += 1
+            else:
+                log.error("Error publicando MQTT en %s", topic, extra={"rc": result.rc})
+        log.info("MQTT publicados %d comandos de actuadores", encolados, extra={"comandos": len(comandos)})
+        return encolados
             
     def loop_start(self):
         """Iniciar loop en thread separado"""
@@ -0,0 +1,87 @@
+"""
+Frames de sensores: un mensaje por lectura
+
+Formatos aceptados en casa/sensores/frame y casa/sensores/<dispositivo>/frame:
+- JSON: {"temperatura": 25.5, "humedad": 60.1, "humedad_suelo": 45, "timestamp": 123456}
+- Binario (16 bytes, little-endian), igual que struct_message del firmware:
+  float temperatura, float humedad, int humedad_suelo, unsigned long timestamp
+"""
+
+import struct
+import time
+
+from models.serialization import loads
+from config import FRAME_ASSEMBLY_WINDOW
+from monitoring.metrics import DESCARTADOS
+
+# struct_message del ESP32 (float, float, int32, uint32)
+STRUCT_MESSAGE = struct.Struct("<ffiI")
+
+
+def parse_frame(payload):
+    """Convertir el payload en (temperatura, humedad, humedad_suelo, timestamp)
+
+    Devuelve None si el payload no es un frame válido.
+    """
+    if len(payload) == STRUCT_MESSAGE.size and payload[:1] != b"{":
+        temperatura, humedad, humedad_suelo, timestamp = STRUCT_MESSAGE.unpack(payload)
+        return round(temperatura, 2), round(humedad, 2), humedad_suelo, timestamp
+    try:
+        datos = loads(payload)
+        return (
+            float(datos["temperatura"]),
+            float(datos["humedad"]),
+            int(datos["humedad_suelo"]),
+            datos.get("timestamp")
+        )
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class FrameAssembler:
+    """Reconstruye frames a partir de los tres topics separados (formato antiguo)
+
+    Las lecturas de un dispositivo se agrupan si llegan dentro de la
+    ventana; un valor repetido o fuera de la ventana inicia un frame nuevo,
+    así nunca se mezclan valores de ciclos distintos.
+
+    `parciales` está ordenado por inicio, así que cada llamada descarta
+    desde el principio los vencidos de cualquier dispositivo (también de
+    los que dejaron de publicar a mitad de un frame) mirando solo esos.
+    """
+
+    CAMPOS = ("temperatura", "humedad", "humedad_suelo")
+
+    def __init__(self, ventana=FRAME_ASSEMBLY_WINDOW):
+        self.ventana = ventana
+        self.parciales = {}
+        self._descartados = DESCARTADOS.labels("frame_incompleto")
+
+    def agregar(self, dispositivo, sensor, valor, ahora=None):
+        """Añadir una lectura; devuelve el frame completo o None"""
+        if ahora is None:
+            ahora = time.monotonic()
+        self._vencer(ahora)
+        parcial = self.parciales.get(dispositivo)
+        if parcial is None or sensor in parcial:
+            if parcial is not None:
+                self._descartados.inc()
+                del self.parciales[dispositivo]  # al reinsertar pasa al final
+            parcial = {"_inicio": ahora}
+            self.parciales[dispositivo] = parcial
+        parcial[sensor] = valor
+
+        if len(parcial) == len(self.CAMPOS) + 1:
+            del self.parciales[dispositivo]
+            return (parcial["temperatura"], parcial["humedad"],
+                    parcial["humedad_suelo"], None)
+        return None
+
+    def _vencer(self, ahora):
+        """Descartar los parciales con más de `ventana` segundos (los más antiguos van primero)"""
+        while self.parciales:
+            dispositivo = next(iter(self.parciales))
+            if ahora - self.parciales[dispositivo]["_inicio"] <= self.ventana:
+                return
+            del self.parciales[dispositivo]
+            self._descartados.inc()
@@ -0,0 +1,147 @@
+"""
+Workers de ingesta MQTT en procesos separados
+
+Uso (desde servidor/):
+    python -m mqtt.ingest_worker --workers 4 --modo hash
+    python -m mqtt.ingest_worker --workers 4 --modo shared
+
+- hash: cada worker se suscribe a casa/sensores/# y procesa solo los
+  dispositivos cuyo crc32 % N coincide con su índice. Todas las lecturas
+  de un dispositivo caen en el mismo worker. El reparto es del lado del
+  cliente: cada worker recibe todo el tráfico y descarta el resto tras
+  leer el topic, así que se reparten las escrituras en BD, el ensamblado
+  y la analítica, no la red ni el coste por mensaje del broker.
+- shared: suscripción compartida MQTT 5 ($share/grupo/casa/sensores/#),
+  el broker reparte los mensajes y cada worker recibe solo su parte. Pensado para topics de frame completo;
+  con los tres topics separados un dispositivo puede repartirse entre workers.
+  Los mensajes retenidos de presencia no se entregan a suscripciones
+  compartidas: cada dispositivo aparece con su primer mensaje.
+
+Cada worker tiene su propio DatabaseManager y publica en el estado
+compartido su shard de último estado y de presencia de dispositivos
+(requiere STATE_BACKEND = "sqlite").
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import signal
+
+import paho.mqtt.client as mqtt
+
+from config import (
+    MQTT_CLIENT_ID, MQTT_INGEST_WORKERS, MQTT_INGEST_MODE,
+    MQTT_SHARED_GROUP, DATABASE_PATH, STATE_BACKEND
+)
+from mqtt.topics import MQTTTopics
+from monitoring.logs import obtener_logger, configurar_logging
+
+log = obtener_logger("mqtt")
+
+
+def shard_ids(total=MQTT_INGEST_WORKERS):
+    """Identificadores de shard de los workers de ingesta"""
+    return [f"worker{indice}" for indice in range(total)]
+
+
+def crear_cliente_ingesta(indice, total, modo):
+    """Crear un MQTTClient configurado para un worker"""
+    from mqtt.client import MQTTClient
+
+    client_id = f"{MQTT_CLIENT_ID}_ingesta{indice}"
+    if modo == "shared":
+        return MQTTClient(
+            client_id=client_id,
+            protocol=mqtt.MQTTv5,
+            suscripcion=MQTTTopics.shared(MQTT_SHARED_GROUP, MQTTTopics.SENSORES_ALL),
+            suscripcion_estado=MQTTTopics.shared(MQTT_SHARED_GROUP, MQTTTopics.ESTADO_ALL),
+            shard_id=f"worker{indice}"
+        )
+    return MQTTClient(
+        client_id=client_id,
+        particion=(indice, total),
+        shard_id=f"worker{indice}"
+    )
+
+
+async def ejecutar_worker(indice, total, modo):
+    """Bucle principal de un worker de ingesta"""
+    from database.db_manager import DatabaseManager
+    from state.backend import shared_state
+    from analytics.anomaly import AnomalyDetector, AlertDispatcher
+    from monitoring.liveness import MonitorDispositivos
+
+    loop = asyncio.get_running_loop()
+    await shared_state.start(loop)
+
+    cliente = crear_cliente_ingesta(indice, total, modo)
+    cliente.db_manager = DatabaseManager(DATABASE_PATH)
+    cliente.event_loop = loop
+    cliente.websocket_broadcast = lambda data: shared_state.publish("websocket", data)
+    cliente.anomaly_detector = AnomalyDetector()
+    cliente.alert_dispatcher = AlertDispatcher(cliente.db_manager, cliente.websocket_broadcast)
+    alert_task = loop.create_task(cliente.alert_dispatcher.run())
+    cliente.monitor_dispositivos = MonitorDispositivos(shard_id=cliente.shard_id)
+    cliente.monitor_dispositivos.alert_dispatcher = cliente.alert_dispatcher
+    cliente.monitor_dispositivos.broadcast = cliente.websocket_broadcast
+    liveness_task = loop.create_task(cliente.monitor_dispositivos.run())
+
+    cliente.connect()
+    cliente.loop_start()
+    log.info("Worker de ingesta %d/%d iniciado (%s)", indice + 1, total, modo)
+
+    detener = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, detener.set)
+    await detener.wait()
+
+    cliente.loop_stop()
+    cliente.disconnect()
+    alert_task.cancel()
+    liveness_task.cancel()
+    await cliente.alert_dispatcher.flush()
+    await shared_state.stop()
+    log.info("Worker de ingesta %d/%d detenido", indice + 1, total)
+
+
+def _proceso_worker(indice, total, modo):
+    listener = configurar_logging()
+    try:
+        asyncio.run(ejecutar_worker(indice, total, modo))
+    finally:
+        listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workers de ingesta MQTT")
+    parser.add_argument("--workers", type=int, default=MQTT_INGEST_WORKERS or 2)
+    parser.add_argument("--modo", choices=["hash", "shared"], default=MQTT_INGEST_MODE)
+    args = parser.parse_args()
+
+    if STATE_BACKEND == "memory":
+        print("⚠️ STATE_BACKEND = 'memory': la API no verá el estado de los workers")
+    if args.workers != MQTT_INGEST_WORKERS:
+        print(f"⚠️ MQTT_INGEST_WORKERS = {MQTT_INGEST_WORKERS} en config.py; "
+              f"la API solo combina esos shards")
+
+    procesos = [
+        multiprocessing.Process(
+            target=_proceso_worker,
+            args=(indice, args.workers, args.modo),
+            name=f"ingesta-{indice}"
+        )
+        for indice in range(args.workers)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    try:
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        for proceso in procesos:
+            proceso.terminate()
+            proceso.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Cola de salida MQTT persistente para comandos y estado (QoS 1/2)
+
+Cada mensaje se guarda en la tabla cola_mqtt antes de publicarse y se
+borra cuando el broker lo confirma (PUBACK/PUBCOMP), así que lo que no
+llegó a salir se vuelve a enviar tras reiniciar el servidor. Como mucho
+MQTT_INFLIGHT mensajes están publicados sin confirmar; el resto espera
+aquí y, mientras espera, un mensaje nuevo del mismo topic reemplaza al
+anterior (son estados: solo importa el último).
+
+Lo ya entregado a paho sobrevive a una caída del broker: paho lo
+reenvía al reconectar, con la espera exponencial de
+MQTT_RECONNECT_MIN..MAX, y después se vacía lo pendiente.
+
+Además cruza cada comando de actuador con la confirmación del receptor
+(casa/confirmacion/...) y mide la ida y vuelta por dispositivo.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import paho.mqtt.client as mqtt
+
+from mqtt.topics import MQTTTopics
+from monitoring.metrics import MQTT_COMANDO_RTT
+from monitoring.logs import obtener_logger
+from config import MQTT_INFLIGHT, MQTT_OUTBOX_INTERVAL
+
+log = obtener_logger("mqtt")
+
+
+class _Mensaje:
+    __slots__ = ("id", "topic", "payload", "qos", "retain")
+
+    def __init__(self, id, topic, payload, qos, retain):
+        self.id = id
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class ColaSalida:
+    """Mensajes QoS > 0 guardados hasta que el broker los confirma"""
+
+    def __init__(self, db, cliente, ventana=MQTT_INFLIGHT, intervalo=MQTT_OUTBOX_INTERVAL):
+        self.db = db
+        self.cliente = cliente  # paho.mqtt.client.Client
+        self.ventana = ventana
+        self.intervalo = intervalo
+        # paho no debe retener por su cuenta lo que cabe en nuestra ventana
+        cliente.max_inflight_messages_set(ventana)
+
+        self.pendientes = OrderedDict()  # id -> _Mensaje, sin entregar a paho
+        self.por_topic = {}  # topic -> id pendiente (para reemplazarlo)
+        self.en_vuelo = {}  # mid -> _Mensaje entregado a paho sin confirmar
+        self.por_borrar = []  # ids confirmados por el broker o reemplazados, se borran en lote
+        self.sin_confirmar = {}  # topic de actuador -> (payload, perf_counter al publicar)
+        self.publicados = 0
+        self.confirmaciones = 0
+
+        # Nunca se llama a paho con el lock tomado: paho invoca on_publish
+        # con sus propios locks y podría cruzarse con este
+        self._lock = threading.Lock()
+        self._enviando = 0
+        self._acks_tempranos = set()  # PUBACK llegado antes de conocer el mid
+        self._ids_sin_bd = itertools.count(-1, -1)  # si falla la BD, solo en memoria
+        self._dispositivos = {topic: nombre for nombre, topic in MQTTTopics.ACTUADORES.items()}
+
+    # ---------- Entradas ----------
+
+    def cargar(self):
+        """Recuperar los mensajes que quedaron sin confirmar (al arrancar)"""
+        filas = self.db.listar_mensajes_mqtt()
+        with self._lock:
+            for id_, topic, payload, qos, retain in filas:
+                self._agregar(_Mensaje(id_, topic, payload, qos, bool(retain)))
+        if filas:
+            log.info("Cola de salida MQTT: %d mensajes por reenviar", len(filas))
+        return len(filas)
+
+    def encolar(self, mensajes, qos, retain):
+        """Guardar y publicar [(topic, payload)]; devuelve cuántos se encolaron"""
+        # Dentro de un lote también gana el último de cada topic
+        mensajes = list(dict(mensajes).items())
+        with self._lock:
+            try:
+                ids = self.db.encolar_mensajes_mqtt(
+                    [(topic, payload, qos, int(retain)) for topic, payload in mensajes]
+                )
+            except Exception as e:
+                log.error("Error guardando la cola de salida MQTT: %s", e)
+                ids = [next(self._ids_sin_bd) for _ in mensajes]
+            for id_, (topic, payload) in zip(ids, mensajes):
+                self._agregar(_Mensaje(id_, topic, payload, qos, retain))
+        self.enviar()
+        return len(mensajes)
+
+    def _agregar(self, mensaje):
+        anterior = self.por_topic.get(mensaje.topic)
+        if anterior is not None:
+            del self.pendientes[anterior]
+            self.por_borrar.append(anterior)
+        self.pendientes[mensaje.id] = mensaje
+        self.por_topic[mensaje.topic] = mensaje.id
+
+    # ---------- Envío ----------
+
+    def enviar(self):
+        """Entregar a paho lo pendiente mientras quede hueco en la ventana
+
+        Desconectado no se entrega nada: lo pendiente sigue aquí, donde un
+        estado más nuevo reemplaza al viejo, hasta que on_connect llama.
+        """
+        while self.cliente.is_connected():
+            with self._lock:
+                if not self.pendientes or len(self.en_vuelo) + self._enviando >= self.ventana:
+                    return
+                _, mensaje = self.pendientes.popitem(last=False)
+                if self.por_topic.get(mensaje.topic) == mensaje.id:
+                    del self.por_topic[mensaje.topic]
+                self._enviando += 1
+            try:
+                info = self.cliente.publish(
+                    mensaje.topic, mensaje.payload, qos=mensaje.qos, retain=mensaje.retain
+                )
+                rc, mid = info.rc, info.mid
+            except Exception as e:
+                log.error("Error en publish: %s", e)
+                rc, mid = mqtt.MQTT_ERR_UNKNOWN, None
+            with self._lock:
+                self._enviando -= 1
+                # Si la conexión cayó, paho se queda el mensaje y lo envía al reconectar
+                if rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                    self._devolver(mensaje)
+                    log.error("Error publicando MQTT en %s", mensaje.topic, extra={"rc": rc})
+                    self._fin_envio()
+                    return
+                self.publicados += 1
+                if rc == mqtt.MQTT_ERR_SUCCESS and mensaje.topic in self._dispositivos:
+                    self.sin_confirmar[mensaje.topic] = (mensaje.payload, time.perf_counter())
+                if mid in self._acks_tempranos:
+                    self._acks_tempranos.discard(mid)
+                    self.por_borrar.append(mensaje.id)
+                else:
+                    self.en_vuelo[mid] = mensaje
+                self._fin_envio()
+
+    def _devolver(self, mensaje):
+        """Volver a poner un mensaje al principio (se reintenta en la próxima revisión)"""
+        if mensaje.topic in self.por_topic:
+            self.por_borrar.append(mensaje.id)  # ya hay uno más nuevo del mismo topic
+            return
+        self.pendientes[mensaje.id] = mensaje
+        self.pendientes.move_to_end(mensaje.id, last=False)
+        self.por_topic[mensaje.topic] = mensaje.id
+
+    def _fin_envio(self):
+        # Un mid de otro publish (QoS 0 directo) no debe quedar para uno futuro
+        if not self._enviando:
+            self._acks_tempranos.clear()
+
+    # ---------- Confirmaciones (thread de paho) ----------
+
+    def publicado(self, mid):
+        """on_publish de paho: el broker confirmó el mensaje `mid`"""
+        with self._lock:
+            mensaje = self.en_vuelo.pop(mid, None)
+            if mensaje is None:
+                if self._enviando:
+                    self._acks_tempranos.add(mid)
+                return
+            self.por_borrar.append(mensaje.id)
+        self.enviar()
+
+    def confirmar(self, topic, payload):
+        """Mensaje del receptor en casa/confirmacion/...: el actuador aplicó `payload`"""
+        topic_actuador = MQTTTopics.parse_confirmation_topic(topic)
+        with self._lock:
+            enviado = self.sin_confirmar.get(topic_actuador)
+            if enviado is None or enviado[0] != payload:
+                return
+            del self.sin_confirmar[topic_actuador]
+            self.confirmaciones += 1
+        MQTT_COMANDO_RTT.labels(self._dispositivos[topic_actuador]).observe(
+            time.perf_counter() - enviado[1]
+        )
+
+    # ---------- Mantenimiento (event loop) ----------
+
+    async def _borrar(self):
+        with self._lock:
+            ids, self.por_borrar = [i for i in self.por_borrar if i > 0], []
+        if not ids:
+            return
+        try:
+            await asyncio.to_thread(self.db.borrar_mensajes_mqtt, ids)
+        except Exception as e:
+            # Se reintenta; en el peor caso se reenvía un estado ya aplicado
+            log.error("Error borrando la cola de salida MQTT: %s", e)
+            with self._lock:
+                self.por_borrar.extend(ids)
+
+    async def run(self):
+        """Borrar en lote lo confirmado y reintentar lo que paho rechazó"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self._borrar()
+            self.enviar()
+
+    async def detener(self):
+        await self._borrar()
+
+    # ---------- Consultas ----------
+
+    def resumen(self):
+        return {
+            "pendientes": len(self.pendientes),
+            "en_vuelo": len(self.en_vuelo),
+            "ventana": self.ventana,
+            "publicados": self.publicados,
+            "confirmaciones_receptor": self.confirmaciones,
+            "sin_confirmar_receptor": len(self.sin_confirmar)
+        }
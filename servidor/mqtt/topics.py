@@ -2,6 +2,8 @@
 MQTT Topics definitions
 """
 
+from config import DEFAULT_DEVICE_ID
+
 class MQTTTopics:
     """Definición centralizada de topics MQTT"""
     
@@ -9,7 +11,10 @@ class MQTTTopics:
     TEMPERATURA = "casa/sensores/temperatura"
     HUMEDAD = "casa/sensores/humedad"
     HUMEDAD_SUELO = "casa/sensores/humedad_suelo"
+    FRAME = "casa/sensores/frame"  # Lectura completa en un solo mensaje
     SENSORES_ALL = "casa/sensores/#"
+    # Varios nodos: casa/sensores/<dispositivo>/<sensor>
+    SENSORES = ("temperatura", "humedad", "humedad_suelo")
     
     # Actuadores (Servidor → ESP32)
     VENTILADOR = "casa/actuadores/ventilador"
@@ -19,8 +24,71 @@ class MQTTTopics:
     LED_CUARTO2 = "casa/actuadores/leds/cuarto2"
     LED_CUARTO3 = "casa/actuadores/leds/cuarto3"
     ACTUADORES_ALL = "casa/actuadores/#"
+    # Nombre de dispositivo (comandos, escenas) -> topic
+    ACTUADORES = {
+        "ventilador": VENTILADOR,
+        "bomba": BOMBA,
+        "servo": SERVO,
+        "led_cuarto1": LED_CUARTO1,
+        "led_cuarto2": LED_CUARTO2,
+        "led_cuarto3": LED_CUARTO3,
+    }
+    
+    # Presencia (ESP32 → Servidor): "online" al conectar (birth) y
+    # "offline" como LWT, ambos retenidos. casa/estado/<dispositivo>
+    ESTADO_ALL = "casa/estado/#"
+    
+    # Confirmaciones (ESP32 → Servidor): el receptor publica el valor que
+    # aplicó en casa/confirmacion/<resto del topic del actuador>
+    CONFIRMACION_ALL = "casa/confirmacion/#"
     
     # Sistema (Servidor → ESP32)
     MODO = "casa/sistema/modo"
     CONFIG = "casa/sistema/config"
     SISTEMA_ALL = "casa/sistema/#"
+
+    @staticmethod
+    def parse_sensor_topic(topic):
+        """Obtener (dispositivo, sensor) de un topic de sensores"""
+        partes = topic.split("/")
+        if len(partes) == 3 and partes[0] == "casa" and partes[1] == "sensores":
+            return DEFAULT_DEVICE_ID, partes[2]
+        if len(partes) == 4 and partes[0] == "casa" and partes[1] == "sensores":
+            return partes[2], partes[3]
+        return None, None
+
+    @staticmethod
+    def parse_status_topic(topic):
+        """Obtener el dispositivo de un topic de presencia"""
+        partes = topic.split("/")
+        if len(partes) == 2 and partes[0] == "casa" and partes[1] == "estado":
+            return DEFAULT_DEVICE_ID
+        if len(partes) == 3 and partes[0] == "casa" and partes[1] == "estado":
+            return partes[2]
+        return None
+
+    @staticmethod
+    def tipo_topic(topic, sensor=None):
+        """Clase de topic para etiquetar métricas sin el id del dispositivo
+
+        `sensor` es el de parse_sensor_topic, si ya se conoce.
+        """
+        if sensor is not None:
+            return sensor if sensor in MQTTTopics.SENSORES or sensor == "frame" else "otro"
+        if topic.startswith("casa/estado"):
+            return "estado"
+        if topic.startswith("casa/confirmacion/"):
+            return "confirmacion"
+        return "otro"
+
+    @staticmethod
+    def parse_confirmation_topic(topic):
+        """Topic del actuador que confirma un topic de confirmación (o None)"""
+        if topic.startswith("casa/confirmacion/"):
+            return "casa/actuadores/" + topic[len("casa/confirmacion/"):]
+        return None
+
+    @staticmethod
+    def shared(grupo, topic):
+        """Suscripción compartida MQTT 5 ($share/grupo/topic)"""
+        return f"$share/{grupo}/{topic}"
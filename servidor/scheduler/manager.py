@@ -0,0 +1,300 @@
+"""
+Planificador de acciones de actuadores
+
+Las programaciones (una vez, diarias o por intervalo, con duración
+opcional) se guardan en la tabla programaciones y las activas viven en
+una RuedaTemporizadores que el event loop avanza cada tick. Solo el
+worker líder dispara; los cambios hechos desde cualquier worker le
+llegan por el estado compartido (canal "planificador").
+
+Al arrancar se recupera la última ejecución perdida si no tiene más de
+SCHEDULER_CATCHUP_WINDOW segundos, y los finales de duración pendientes
+se envían enseguida (p. ej. apagar la bomba).
+
+Como en las escenas, ventilador, bomba y servo solo se accionan en modo
+manual: en automático los controla el ESP32 y esas acciones se omiten.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from api.routes import sistema_estado
+from api.scenes import estado_de_acciones, SOLO_MANUAL
+from database.db_manager import DatabaseManager
+from scheduler.wheel import RuedaTemporizadores
+from state.backend import shared_state
+from monitoring.logs import obtener_logger
+from config import DATABASE_PATH, SCHEDULER_TICK, SCHEDULER_CATCHUP_WINDOW
+
+ESPERA_REINTENTO = 5  # segundos entre intentos de cargar las programaciones
+
+log = obtener_logger("planificador")
+
+CANAL = "planificador"
+
+
+# ==================== OCURRENCIAS ====================
+
+def _diarias(programacion, desde, hacia):
+    """Ejecuciones diarias (epoch) desde el día de `desde`, 8 días hacia delante o atrás"""
+    horas, minutos = map(int, programacion["hora"].split(":"))
+    dia = datetime.fromtimestamp(desde).date()
+    for i in range(8):
+        fecha = dia + timedelta(days=i * hacia)
+        if programacion["dias"] and fecha.weekday() not in programacion["dias"]:
+            continue
+        yield datetime(fecha.year, fecha.month, fecha.day, horas, minutos).timestamp()
+
+
+def siguiente(programacion, despues):
+    """Primera ejecución estrictamente posterior a `despues`, o None"""
+    tipo = programacion["tipo"]
+    inicio = programacion["inicio"]
+    if tipo == "una_vez":
+        return inicio if inicio > despues else None
+    if tipo == "intervalo":
+        if inicio > despues:
+            return inicio
+        cada = programacion["cada"]
+        return inicio + ((despues - inicio) // cada + 1) * cada
+    return next((t for t in _diarias(programacion, despues, 1) if t > despues), None)
+
+
+def anterior(programacion, ahora):
+    """Última ejecución que tocaba hasta `ahora` (inclusive), o None"""
+    tipo = programacion["tipo"]
+    inicio = programacion["inicio"]
+    if tipo == "una_vez":
+        return inicio if inicio <= ahora else None
+    if tipo == "intervalo":
+        if inicio > ahora:
+            return None
+        return inicio + (ahora - inicio) // programacion["cada"] * programacion["cada"]
+    return next((t for t in _diarias(programacion, ahora, -1) if t <= ahora), None)
+
+
+# ==================== PLANIFICADOR ====================
+
+class Planificador:
+    """Programaciones activas sobre una rueda de temporizadores"""
+
+    def __init__(self, db_path=DATABASE_PATH, tick=SCHEDULER_TICK,
+                 ventana_recuperacion=SCHEDULER_CATCHUP_WINDOW):
+        self.db = DatabaseManager(db_path)
+        self.tick = tick
+        self.ventana_recuperacion = ventana_recuperacion
+        self.publicar = None  # MQTTClient.publish_actuator_command
+        self.broadcast = None  # WebSocketManager.broadcast_actuator_batch
+        self.registrar_comandos = None  # api.routes.registrar_comandos_pendientes (GET /api/comandos)
+        self.programaciones = {}  # id -> programación activa (solo en el líder)
+        self.rueda = None
+        self.disparos = 0
+        self._tarea = None
+
+    # ---------- API ----------
+
+    async def crear(self, datos):
+        """Guardar una programación (dict de schemas.Programacion) y avisar al líder"""
+        programacion = dict(datos)
+        ahora = time.time()
+        if programacion["inicio"] is not None:
+            programacion["inicio"] = programacion["inicio"].timestamp()
+        if programacion["tipo"] == "una_vez" and programacion["inicio"] <= ahora:
+            raise ValueError("inicio ya pasó")
+        if programacion["tipo"] == "intervalo" and programacion["inicio"] is None:
+            programacion["inicio"] = ahora + programacion["cada"]
+        programacion["proxima"] = siguiente(programacion, ahora)
+        programacion["activa"] = True
+
+        programacion_id = await asyncio.to_thread(self.db.insertar_programacion, programacion)
+        await shared_state.publish(CANAL, {"id": programacion_id})
+        return await asyncio.to_thread(self.db.obtener_programacion, programacion_id)
+
+    async def eliminar(self, programacion_id):
+        """Borrar una programación; si tenía una duración en curso se envía su final"""
+        existia = await asyncio.to_thread(self.db.eliminar_programacion, programacion_id)
+        if existia:
+            await shared_state.publish(CANAL, {"id": programacion_id})
+        return existia
+
+    def resumen(self):
+        return {
+            "activo": self.rueda is not None,
+            "programaciones": len(self.programaciones),
+            "temporizadores": len(self.rueda) if self.rueda is not None else 0,
+            "disparos": self.disparos,
+            "tick_s": self.tick
+        }
+
+    async def on_shared_event(self, canal, mensaje):
+        """Programación creada o borrada en algún worker"""
+        if canal == CANAL and self.rueda is not None:
+            await self._recargar(mensaje["id"])
+
+    # ---------- Liderazgo ----------
+
+    def activar(self):
+        """Callback on_elected: cargar las programaciones y empezar a disparar"""
+        if self._tarea is None:
+            self._tarea = asyncio.get_running_loop().create_task(self._ejecutar())
+
+    def desactivar(self):
+        """Callback on_revoked: dejar de disparar (otro worker toma el relevo)"""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    async def detener(self):
+        tarea = self._tarea
+        self.desactivar()
+        if tarea is not None:
+            await asyncio.gather(tarea, return_exceptions=True)
+
+    # ---------- Rueda ----------
+
+    async def _cargar(self):
+        """Leer las programaciones activas; reintenta mientras la BD falle"""
+        while True:
+            try:
+                return await asyncio.to_thread(self.db.listar_programaciones, True)
+            except Exception as e:
+                log.error("Error cargando programaciones (reintento en %s s): %s",
+                          ESPERA_REINTENTO, e)
+                await asyncio.sleep(ESPERA_REINTENTO)
+
+    async def _ejecutar(self):
+        self.rueda = RuedaTemporizadores(time.time(), self.tick)
+        self.programaciones = {}
+        try:
+            activas = await self._cargar()
+            ahora = time.time()
+            cambiadas = [p for p in activas if self._programar(p, ahora)]
+            if cambiadas:
+                await asyncio.to_thread(self.db.actualizar_programaciones,
+                                        [self._fila_estado(p) for p in cambiadas])
+            log.info("Planificador activo", extra={"programaciones": len(self.programaciones)})
+
+            while True:
+                await asyncio.sleep(self.tick - time.time() % self.tick)
+                vencidos = self.rueda.avanzar(time.time())
+                if vencidos:
+                    try:
+                        await self._disparar(vencidos)
+                    except Exception as e:
+                        log.error("Error ejecutando programaciones: %s", e)
+        except Exception as e:
+            log.error("Planificador detenido: %s", e)
+        finally:
+            self.rueda = None
+            self.programaciones = {}
+            # Si terminó por un error, el próximo activar() lo vuelve a lanzar
+            if self._tarea is asyncio.current_task():
+                self._tarea = None
+
+    def _programar(self, programacion, ahora):
+        """Poner en la rueda una programación activa; True si cambió su estado guardado"""
+        pid = programacion["id"]
+        self.programaciones[pid] = programacion
+        if programacion["fin_pendiente"] is not None:
+            # Si ya pasó sale en el próximo tick
+            self.rueda.agregar((pid, "fin"), programacion["fin_pendiente"])
+
+        cambiada = False
+        proxima = programacion["proxima"]
+        if proxima is not None and proxima <= ahora:
+            perdida = anterior(programacion, ahora)
+            duracion = programacion["duracion"]
+            if ahora - perdida <= self.ventana_recuperacion and (not duracion or perdida + duracion > ahora):
+                log.info("Recuperando ejecución perdida de la programación %s", pid,
+                         extra={"retraso_s": round(ahora - perdida)})
+                self.rueda.agregar((pid, "inicio"), perdida)
+                return False
+            log.warning("Programación %s: ejecución perdida omitida", pid,
+                        extra={"retraso_s": round(ahora - perdida)})
+            programacion["proxima"] = siguiente(programacion, ahora)
+            cambiada = True
+
+        if programacion["proxima"] is not None:
+            self.rueda.agregar((pid, "inicio"), programacion["proxima"])
+        elif programacion["fin_pendiente"] is None:
+            programacion["activa"] = False
+            del self.programaciones[pid]
+        return cambiada
+
+    async def _recargar(self, programacion_id):
+        anterior_estado = self.programaciones.pop(programacion_id, None)
+        self.rueda.cancelar((programacion_id, "inicio"))
+        self.rueda.cancelar((programacion_id, "fin"))
+        programacion = await asyncio.to_thread(self.db.obtener_programacion, programacion_id)
+        if programacion is not None and programacion["activa"]:
+            self._programar(programacion, time.time())
+        elif anterior_estado is not None and anterior_estado["fin_pendiente"] is not None:
+            # Borrada con una duración en curso: enviar ya el valor final
+            anterior_estado["proxima"] = None
+            self.programaciones[programacion_id] = anterior_estado
+            self.rueda.agregar((programacion_id, "fin"), time.time())
+
+    async def _disparar(self, vencidos):
+        """Ejecutar los temporizadores vencidos en este tick
+
+        Los comandos salen uno a uno por publish_actuator_command, pero el
+        estado de actuadores se escribe una vez y se hace un solo broadcast
+        aunque venzan muchas programaciones a la vez. En modo automático
+        se omiten las acciones de SOLO_MANUAL, pero la programación avanza.
+        """
+        ahora = time.time()
+        manual = sistema_estado['modo'] == 'manual'
+        acciones = {}
+        omitidas = {}
+        modificadas = {}
+        for (pid, fase), vence in sorted(vencidos, key=lambda v: v[1]):
+            programacion = self.programaciones.get(pid)
+            if programacion is None:
+                continue
+            modificadas[pid] = programacion
+            if fase == "inicio":
+                acciones[programacion["dispositivo"]] = programacion["valor"]
+                programacion["ultima"] = vence
+                if programacion["duracion"]:
+                    programacion["fin_pendiente"] = vence + programacion["duracion"]
+                    self.rueda.agregar((pid, "fin"), programacion["fin_pendiente"])
+                programacion["proxima"] = siguiente(programacion, max(vence, ahora))
+                if programacion["proxima"] is not None:
+                    self.rueda.agregar((pid, "inicio"), programacion["proxima"])
+            else:
+                acciones[programacion["dispositivo"]] = programacion["valor_final"]
+                programacion["fin_pendiente"] = None
+            if programacion["proxima"] is None and programacion["fin_pendiente"] is None:
+                programacion["activa"] = False
+                del self.programaciones[pid]
+
+        if not manual:
+            omitidas = {d: v for d, v in acciones.items() if d in SOLO_MANUAL}
+            acciones = {d: v for d, v in acciones.items() if d not in SOLO_MANUAL}
+        if omitidas:
+            log.warning("Programaciones omitidas en modo automático", extra={"acciones": omitidas})
+        if acciones:
+            for dispositivo, valor in acciones.items():
+                self.publicar(dispositivo, valor)
+            if self.registrar_comandos is not None:
+                self.registrar_comandos(acciones)
+            self.disparos += len(acciones)
+            log.info("Programaciones ejecutadas", extra={"acciones": acciones})
+            cambios, leds = estado_de_acciones(acciones)
+            estado = await asyncio.to_thread(self.db.combinar_estado_actuadores, cambios, leds)
+            if self.broadcast is not None:
+                await self.broadcast(acciones, estado=estado)
+        if modificadas:
+            await asyncio.to_thread(self.db.actualizar_programaciones,
+                                    [self._fila_estado(p) for p in modificadas.values()])
+
+    @staticmethod
+    def _fila_estado(programacion):
+        return (programacion["proxima"], programacion["fin_pendiente"],
+                programacion["ultima"], int(programacion["activa"]), programacion["id"])
+
+
+# Instancia global
+planificador = Planificador()
+shared_state.subscribe(planificador.on_shared_event)
@@ -0,0 +1,101 @@
+"""
+Rueda jerárquica de temporizadores
+
+Cada nivel tiene RANURAS ranuras; el nivel 0 avanza una ranura por tick
+y el nivel N una cada RANURAS**N ticks. Un temporizador se guarda en el
+nivel más bajo cuyo bloque de tiempo coincide con el actual y baja de
+nivel (cascada) cuando su ranura llega. Agregar y cancelar son O(1) y
+cada tick solo mira una ranura, haya diez o cien mil temporizadores.
+"""
+
+import math
+
+
+class RuedaTemporizadores:
+    """Temporizadores identificados por clave con resolución de un tick"""
+
+    def __init__(self, ahora, resolucion=1.0, bits=6, niveles=4):
+        self.resolucion = resolucion
+        self.bits = bits
+        self.niveles = niveles
+        self.mascara = (1 << bits) - 1
+        # niveles x ranuras; cada ranura es un dict clave -> vencimiento (epoch)
+        self.ruedas = [[{} for _ in range(1 << bits)] for _ in range(niveles)]
+        self.lejanos = {}  # más allá del último nivel (RANURAS**niveles ticks)
+        self.vencidos = {}  # agregados con vencimiento ya pasado
+        self.ubicacion = {}  # clave -> dict (ranura) que la contiene
+        self.actual = int(ahora // resolucion)
+
+    def __len__(self):
+        return len(self.ubicacion)
+
+    def __contains__(self, clave):
+        return clave in self.ubicacion
+
+    def agregar(self, clave, vence):
+        """Programar `clave` para `vence` (epoch); reemplaza si ya existía"""
+        self.cancelar(clave)
+        self._colocar(clave, vence)
+
+    def cancelar(self, clave):
+        ranura = self.ubicacion.pop(clave, None)
+        if ranura is None:
+            return False
+        del ranura[clave]
+        return True
+
+    def _colocar(self, clave, vence):
+        tick = math.ceil(vence / self.resolucion)
+        if tick <= self.actual:
+            ranura = self.vencidos
+        else:
+            for nivel in range(self.niveles):
+                bloque = self.bits * (nivel + 1)
+                if tick >> bloque == self.actual >> bloque:
+                    ranura = self.ruedas[nivel][(tick >> (self.bits * nivel)) & self.mascara]
+                    break
+            else:
+                ranura = self.lejanos
+        ranura[clave] = vence
+        self.ubicacion[clave] = ranura
+
+    def _recolocar(self, ranura):
+        pendientes = list(ranura.items())
+        ranura.clear()
+        for clave, vence in pendientes:
+            self._colocar(clave, vence)
+
+    def _vaciar(self, ranura, vencidos):
+        for clave, vence in ranura.items():
+            del self.ubicacion[clave]
+            vencidos.append((clave, vence))
+        ranura.clear()
+
+    def _cascada(self, tick):
+        """Bajar, de arriba abajo, las ranuras de los niveles cuyo índice cambia"""
+        if tick & ((1 << (self.bits * self.niveles)) - 1) == 0:
+            self._recolocar(self.lejanos)
+        for nivel in range(self.niveles - 1, 0, -1):
+            if tick & ((1 << (self.bits * nivel)) - 1) == 0:
+                self._recolocar(self.ruedas[nivel][(tick >> (self.bits * nivel)) & self.mascara])
+
+    def avanzar(self, ahora):
+        """Avanzar hasta `ahora` (epoch); devuelve [(clave, vencimiento)] vencidos"""
+        objetivo = int(ahora // self.resolucion)
+        vencidos = []
+        self._vaciar(self.vencidos, vencidos)
+        if not self.ubicacion:
+            self.actual = max(self.actual, objetivo)
+            return vencidos
+
+        while self.actual < objetivo:
+            self.actual += 1
+            tick = self.actual
+            if tick & self.mascara == 0:
+                self._cascada(tick)
+            ranura = self.ruedas[0][tick & self.mascara]
+            if ranura:
+                self._vaciar(ranura, vencidos)
+            if self.vencidos:
+                self._vaciar(self.vencidos, vencidos)
+        return vencidos
@@ -0,0 +1,314 @@
+"""
+Estado compartido, pub/sub y elección de líder entre workers
+
+- InProcessBackend: un solo proceso (comportamiento por defecto)
+- SQLiteBackend: varios workers de uvicorn sobre el mismo archivo SQLite
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from models.serialization import dumps_texto, loads
+from monitoring.logs import obtener_logger
+from config import (
+    STATE_BACKEND, STATE_DB_PATH, STATE_POLL_INTERVAL,
+    STATE_EVENT_RETENTION, LEADER_LEASE_TTL
+)
+
+log = obtener_logger("estado")
+
+
+class StateBackend:
+    """Interfaz común de los backends de estado compartido"""
+
+    def __init__(self):
+        # Identificador único de este worker (para liderazgo)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.subscribers = []
+        self.event_loop = None
+
+    # ---------- Estado clave/valor ----------
+
+    def get(self, key, default=None):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def mapping(self, namespace, defaults):
+        """Vista tipo dict sobre las claves de un namespace"""
+        return SharedDict(self, namespace, defaults)
+
+    # ---------- Pub/Sub ----------
+
+    def subscribe(self, callback):
+        """Registrar coroutine callback(canal, mensaje) para eventos publicados"""
+        self.subscribers.append(callback)
+
+    async def publish(self, canal, mensaje):
+        raise NotImplementedError
+
+    async def _dispatch(self, canal, mensaje):
+        for callback in self.subscribers:
+            try:
+                await callback(canal, mensaje)
+            except Exception as e:
+                log.error("Error en suscriptor de estado: %s", e)
+
+    # ---------- Liderazgo ----------
+
+    def try_acquire_leadership(self, nombre, ttl=LEADER_LEASE_TTL):
+        raise NotImplementedError
+
+    def release_leadership(self, nombre):
+        raise NotImplementedError
+
+    async def run_leader_election(self, nombre, on_elected, on_revoked,
+                                  ttl=LEADER_LEASE_TTL):
+        """Renovar periódicamente el liderazgo y notificar los cambios
+
+        Si no se puede renovar (p.ej. "database is locked") se sigue siendo
+        líder mientras dure el lease de la última renovación: ningún otro
+        worker puede tomarlo antes. Pasado `ttl` sin renovar, se pierde.
+        """
+        es_lider = False
+        ultimo_ok = None  # time.monotonic() de la última renovación correcta
+        try:
+            while True:
+                try:
+                    actual = await asyncio.to_thread(self.try_acquire_leadership, nombre, ttl)
+                    if actual:
+                        ultimo_ok = time.monotonic()
+                except Exception as e:
+                    log.error("Error renovando el liderazgo de '%s': %s", nombre, e)
+                    actual = es_lider and time.monotonic() - ultimo_ok < ttl
+                if actual and not es_lider:
+                    log.info("Worker %s es líder de '%s'", self.worker_id, nombre)
+                    on_elected()
+                elif not actual and es_lider:
+                    log.warning("Worker %s perdió el liderazgo de '%s'", self.worker_id, nombre)
+                    on_revoked()
+                es_lider = actual
+                await asyncio.sleep(ttl / 3)
+        except asyncio.CancelledError:
+            if es_lider:
+                try:
+                    self.release_leadership(nombre)
+                except Exception as e:
+                    log.error("Error liberando el liderazgo de '%s': %s", nombre, e)
+            raise
+
+    # ---------- Ciclo de vida ----------
+
+    async def start(self, loop):
+        self.event_loop = loop
+
+    async def stop(self):
+        pass
+
+
+class InProcessBackend(StateBackend):
+    """Estado en memoria del propio proceso (un único worker)"""
+
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    async def publish(self, canal, mensaje):
+        await self._dispatch(canal, mensaje)
+
+    def try_acquire_leadership(self, nombre, ttl=LEADER_LEASE_TTL):
+        # Con un solo proceso siempre somos líderes
+        return True
+
+    def release_leadership(self, nombre):
+        pass
+
+
+class SQLiteBackend(StateBackend):
+    """Estado compartido entre procesos usando un archivo SQLite en modo WAL"""
+
+    def __init__(self, db_path=STATE_DB_PATH, poll_interval=STATE_POLL_INTERVAL):
+        super().__init__()
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.last_event_id = 0
+        self._poll_task = None
+        self._crear_tablas()
+
+    @contextmanager
+    def get_connection(self):
+        """Context manager para conexiones a la BD de estado"""
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            conn.close()
+
+    def _crear_tablas(self):
+        with self.get_connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS estado (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS eventos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    canal TEXT,
+                    mensaje TEXT,
+                    creado REAL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS lideres (
+                    nombre TEXT PRIMARY KEY,
+                    propietario TEXT,
+                    expira REAL
+                )
+            ''')
+
+    def get(self, key, default=None):
+        with self.get_connection() as conn:
+            fila = conn.execute(
+                'SELECT valor FROM estado WHERE clave = ?', (key,)
+            ).fetchone()
+        return loads(fila[0]) if fila else default
+
+    def set(self, key, value):
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO estado (clave, valor) VALUES (?, ?)
+                ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor
+            ''', (key, dumps_texto(value)))
+
+    async def publish(self, canal, mensaje):
+        # La entrega (también a este worker) la hace el poller, así todos
+        # los workers ven los eventos en el mismo orden
+        with self.get_connection() as conn:
+            conn.execute(
+                'INSERT INTO eventos (canal, mensaje, creado) VALUES (?, ?, ?)',
+                (canal, dumps_texto(mensaje), time.time())
+            )
+
+    def try_acquire_leadership(self, nombre, ttl=LEADER_LEASE_TTL):
+        ahora = time.time()
+        with self.get_connection() as conn:
+            conn.execute('''
+                INSERT INTO lideres (nombre, propietario, expira) VALUES (?, ?, ?)
+                ON CONFLICT(nombre) DO UPDATE SET
+                    propietario = excluded.propietario,
+                    expira = excluded.expira
+                WHERE lideres.propietario = excluded.propietario
+                   OR lideres.expira < ?
+            ''', (nombre, self.worker_id, ahora + ttl, ahora))
+            fila = conn.execute(
+                'SELECT propietario FROM lideres WHERE nombre = ?', (nombre,)
+            ).fetchone()
+        return fila is not None and fila[0] == self.worker_id
+
+    def release_leadership(self, nombre):
+        with self.get_connection() as conn:
+            conn.execute(
+                'DELETE FROM lideres WHERE nombre = ? AND propietario = ?',
+                (nombre, self.worker_id)
+            )
+
+    async def start(self, loop):
+        await super().start(loop)
+        with self.get_connection() as conn:
+            self.last_event_id = conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM eventos'
+            ).fetchone()[0]
+        self._poll_task = loop.create_task(self._poll_events())
+
+    async def stop(self):
+        if self._poll_task:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    async def _poll_events(self):
+        """Leer eventos nuevos del bus y entregarlos a los suscriptores locales"""
+        ultima_limpieza = time.time()
+        while True:
+            try:
+                with self.get_connection() as conn:
+                    filas = conn.execute(
+                        'SELECT id, canal, mensaje FROM eventos WHERE id > ? ORDER BY id',
+                        (self.last_event_id,)
+                    ).fetchall()
+                    if time.time() - ultima_limpieza > STATE_EVENT_RETENTION:
+                        conn.execute(
+                            'DELETE FROM eventos WHERE creado < ?',
+                            (time.time() - STATE_EVENT_RETENTION,)
+                        )
+                        ultima_limpieza = time.time()
+                for event_id, canal, mensaje in filas:
+                    self.last_event_id = event_id
+                    await self._dispatch(canal, loads(mensaje))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Error leyendo bus de eventos: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+
+class SharedDict(MutableMapping):
+    """Dict cuyas claves de primer nivel viven en el backend compartido
+
+    Los valores anidados se devuelven como copia: para modificarlos hay que
+    reasignar la clave completa (sistema_estado['configuracion'] = {...}).
+    """
+
+    def __init__(self, backend, namespace, defaults):
+        self.backend = backend
+        self.namespace = namespace
+        self.defaults = defaults
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def __getitem__(self, key):
+        if key not in self.defaults:
+            raise KeyError(key)
+        return self.backend.get(self._key(key), self.defaults[key])
+
+    def __setitem__(self, key, value):
+        self.defaults.setdefault(key, None)
+        self.backend.set(self._key(key), value)
+
+    def __delitem__(self, key):
+        raise TypeError("No se pueden eliminar claves del estado compartido")
+
+    def __iter__(self):
+        return iter(self.defaults)
+
+    def __len__(self):
+        return len(self.defaults)
+
+
+def crear_backend(tipo=STATE_BACKEND):
+    """Crear el backend de estado según la configuración"""
+    if tipo == "sqlite":
+        return SQLiteBackend()
+    return InProcessBackend()
+
+# Instancia global
+shared_state = crear_backend()
@@ -5,9 +5,17 @@
 let socket = null;
 let reconnectInterval = null;
 
+// Última secuencia recibida y epoch del servidor: al reconectar se piden
+// solo los eventos perdidos (o el servidor envía un snapshot)
+let ultimaSecuencia = null;
+let epochServidor = null;
+
 function conectarWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws`;
+    let wsUrl = `${protocol}//${window.location.host}/ws`;
+    if (epochServidor !== null && ultimaSecuencia !== null) {
+        wsUrl += `?epoch=${epochServidor}&last_seq=${ultimaSecuencia}`;
+    }
 
     console.log('🔌 Conectando WebSocket:', wsUrl);
 
@@ -22,7 +30,10 @@ function conectarWebSocket() {
             reconnectInterval = null;
         }
 
-        cargarDatosIniciales();
+        // Primera conexión: estado por REST; las reconexiones se ponen al día por el WebSocket
+        if (epochServidor === null) {
+            cargarDatosIniciales();
+        }
     };
 
     socket.onmessage = (event) => {
@@ -30,12 +41,35 @@ function conectarWebSocket() {
             const data = JSON.parse(event.data);
             console.log('📨 WebSocket:', data);
 
-            if (data.type === 'sensor_update') {
+            if (data.type === 'connection') {
+                // Otra epoch (reinicio u otro worker): el servidor manda un snapshot
+                if (data.epoch !== epochServidor) {
+                    epochServidor = data.epoch;
+                    ultimaSecuencia = data.seq;
+                }
+                return;
+            }
+            // Solo avanza: un evento repetido o atrasado no debe hacer retroceder la reanudación
+            if (data.seq !== undefined && (ultimaSecuencia === null || data.seq > ultimaSecuencia)) {
+                ultimaSecuencia = data.seq;
+            }
+
+            if (data.type === 'snapshot') {
+                if (data.estado) actualizarMetricas(data.estado);
+                actualizarGraficas(data.historial);
+            } else if (data.type === 'sensor_update') {
                 actualizarSensorIndividual(data);
             } else if (data.type === 'sensor_data') {
                 actualizarMetricas(data.data);
+                agregarPuntoGraficas(data.data);
             } else if (data.type === 'actuator_change') {
                 console.log(`Actuador ${data.device}:`, data.value);
+            } else if (data.type === 'actuator_batch') {
+                data.changes.forEach(c => console.log(`Actuador ${c.device}:`, c.value));
+            } else if (data.type === 'device_status') {
+                console.log(`Dispositivo ${data.device}: ${data.estado} (${data.motivo})`);
+            } else if (data.type === 'alerta') {
+                console.warn('⚠️ Alerta:', data.alerta.mensaje);
             }
         } catch (error) {
             console.error('Error WebSocket:', error);
@@ -148,12 +182,45 @@ function actualizarEstadoConexion(conectado) {
 }
 
 let chartTempHum, chartSuelo;
+const PUNTOS_GRAFICA = 20;
+
+// Cada lectura del WebSocket se agrega a las gráficas (sin recargar el historial)
+function agregarPuntoGraficas(data) {
+    if (!data || !data.sensores) return;
+    const s = data.sensores;
+    const punto = {
+        timestamp: data.timestamp || new Date().toISOString(),
+        temperatura: s.temperatura,
+        humedad: s.humedad,
+        humedad_suelo: s.humedad_suelo
+    };
+
+    if (!chartTempHum || !chartSuelo) {
+        actualizarGraficas([punto]);
+        return;
+    }
+
+    const label = new Date(punto.timestamp).toLocaleTimeString('es-PE', { hour: '2-digit', minute: '2-digit' });
+    [chartTempHum, chartSuelo].forEach(chart => chart.data.labels.push(label));
+    chartTempHum.data.datasets[0].data.push(punto.temperatura);
+    chartTempHum.data.datasets[1].data.push(punto.humedad);
+    chartSuelo.data.datasets[0].data.push(punto.humedad_suelo);
+
+    [chartTempHum, chartSuelo].forEach(chart => {
+        const sobrantes = chart.data.labels.length - PUNTOS_GRAFICA;
+        if (sobrantes > 0) {
+            chart.data.labels.splice(0, sobrantes);
+            chart.data.datasets.forEach(ds => ds.data.splice(0, sobrantes));
+        }
+        chart.update();
+    });
+}
 
 function actualizarGraficas(historial) {
     if (!historial || historial.length === 0) return;
 
     historial.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
-    const datos = historial.slice(-20);
+    const datos = historial.slice(-PUNTOS_GRAFICA);
 
     const labels = datos.map(d => new Date(d.timestamp).toLocaleTimeString('es-PE', { hour: '2-digit', minute: '2-digit' }));
     const temps = datos.map(d => d.temperatura);
@@ -273,5 +340,4 @@ function actualizarGraficas(historial) {
 document.addEventListener('DOMContentLoaded', function () {
     console.log('🏠 Iniciando Dashboard Premium...');
     conectarWebSocket();
-    setInterval(cargarDatosIniciales, 30000);
 });